@@ -41,13 +41,15 @@ setup(
         'requests',
         'protobuf',
         'ipython',
-        'polars'
+        'polars',
+        'pyarrow'
     ],
     entry_points={
         'console_scripts': [
             'winqwatch=winq.cmd.stock_watch:main',
             'winqselect=winq.cmd.stock_select:main',
-            'winqtrader=winq.cmd.trader:main'
+            'winqtrader=winq.cmd.trader:main',
+            'winqsweep=winq.cmd.sweep:main'
         ]
     },
 )
@@ -0,0 +1,73 @@
+import asyncio
+import itertools
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+import winq.trade.consts as consts
+from winq.trade.broker.broker_simulate import BrokerSimulate
+from winq.trade.entrust import Entrust
+from winq.trade.tracer import Tracer
+
+
+class BrokerSimulateBarTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        seq = itertools.count(1)
+        self.trader = SimpleNamespace(queue={'broker': asyncio.Queue(), 'broker_event': asyncio.Queue()},
+                                      tracer=Tracer(enable=False),
+                                      is_running=lambda queue: True,
+                                      next_id=lambda: str(next(seq)))
+        self.account = SimpleNamespace(account_id='acct', typ='backtest', category='stock',
+                                       db_data=None, db_trade=None, trader=self.trader)
+
+    async def new_broker(self, **opt) -> BrokerSimulate:
+        broker = BrokerSimulate(broker_id='broker:builtin:BrokerSimulate', account=self.account)
+        opt.update(match='bar', participation=0)
+        self.assertTrue(await broker.init(opt))
+        return broker
+
+    def new_entrust(self, price, typ=Entrust.type_buy):
+        entrust = Entrust('e1', self.account)
+        entrust.code, entrust.type = 'sz000001', typ
+        entrust.time = datetime(2023, 3, 1, 10, 30)
+        entrust.price, entrust.volume = price, 100
+        return entrust
+
+    @staticmethod
+    def quot(day_time, open_, high, low, close):
+        return {'list': {'sz000001': dict(day_time=day_time, open=open_, high=high, low=low,
+                                          close=close, volume=100000)}}
+
+    def deals(self):
+        deals = []
+        while not self.trader.queue['broker_event'].empty():
+            deals.append(self.trader.queue['broker_event'].get_nowait()[1])
+        return deals
+
+    async def test_same_bar_not_fill_at_open(self):
+        broker = await self.new_broker(delay=0)
+        # 上涨k线收盘产生的信号, 按收盘价买入
+        await broker.on_entrust(consts.evt_quotation, self.quot(datetime(2023, 3, 1, 10, 30), 10.0, 11.0, 9.9, 10.8))
+        entrust = self.new_entrust(price=10.8)
+        await broker.on_entrust(consts.evt_entrust_buy, entrust)
+
+        self.assertEqual(self.deals(), [entrust])
+        self.assertEqual(entrust.deal_price, 10.8)
+        self.assertEqual(entrust.fills, [(100, 10.8, datetime(2023, 3, 1, 10, 30))])
+
+    async def test_delay_match_next_bar(self):
+        broker = await self.new_broker()
+        self.assertEqual(broker.delay, 1)
+        await broker.on_entrust(consts.evt_quotation, self.quot(datetime(2023, 3, 1, 10, 30), 10.0, 11.0, 9.9, 10.8))
+        entrust = self.new_entrust(price=10.8)
+        await broker.on_entrust(consts.evt_entrust_buy, entrust)
+        self.assertEqual(self.deals(), [])
+
+        await broker.on_entrust(consts.evt_quotation, self.quot(datetime(2023, 3, 1, 11, 30), 10.6, 10.9, 10.5, 10.7))
+        self.assertEqual(self.deals(), [entrust])
+        self.assertEqual(entrust.deal_price, 10.6)
+        self.assertEqual(entrust.fills, [(100, 10.6, datetime(2023, 3, 1, 11, 30))])
+
+
+if __name__ == '__main__':
+    unittest.main()
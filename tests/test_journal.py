@@ -0,0 +1,79 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from winq.trade.entrust import Entrust
+from winq.trade.journal import Journal
+from winq.trade.trade_mapper import TradeMapper
+
+
+class JournalReplayTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.account = SimpleNamespace(account_id='acct')
+        self.mapper = TradeMapper(self.account)
+        self.written = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def writer(self, kind, data):
+        self.written.append((kind, data))
+
+    def new_journal(self, snapshot=1000):
+        return Journal(account_id='acct', writer=self.writer, path=self.tmp.name, snapshot=snapshot)
+
+    def new_entrust(self, entrust_id, status=Entrust.stat_commit):
+        entrust = Entrust(entrust_id, self.account)
+        entrust.name, entrust.code, entrust.type = '平安银行', 'sz000001', Entrust.type_buy
+        entrust.time = datetime(2023, 3, 1, 10, 30)
+        entrust.status = status
+        entrust.price, entrust.volume, entrust.volume_deal = 10.5, 200, 100
+        entrust.desc = 'test'
+        return entrust
+
+    async def test_replay_open_entrust(self):
+        journal = self.new_journal()
+        self.assertIsNone(journal.open(fresh=True))
+        await journal.append('account', dict(account_id='acct'))
+        await journal.append('entrust', self.mapper.entrust_data(self.new_entrust('e1')))
+        # 模拟进程崩溃, 不关闭日志
+        journal.task.cancel()
+        journal.file.close()
+
+        replayed = self.new_journal()
+        state = replayed.open()
+        self.assertIn('e1', state['entrust'])
+
+        entrust = Entrust('e1', self.account)
+        entrust.from_dict(state['entrust']['e1'])
+        self.assertEqual(entrust.desc, 'test')
+        self.assertEqual(entrust.volume_deal, 100)
+        self.assertEqual(entrust.time, datetime(2023, 3, 1, 10, 30))
+        await replayed.close()
+
+    async def test_compact_in_background(self):
+        journal = self.new_journal(snapshot=2)
+        journal.open(fresh=True)
+        await journal.append('account', dict(account_id='acct'))
+        await journal.append('entrust', self.mapper.entrust_data(self.new_entrust('e1')))
+        # 压缩只改名日志, 快照由写库任务生成
+        self.assertTrue(os.path.exists(journal.old_file))
+        await journal.append('entrust', self.mapper.entrust_data(self.new_entrust('e2')))
+        await journal.append('entrust', self.mapper.entrust_data(self.new_entrust('e1', Entrust.stat_deal)))
+        await journal.queue.join()
+        self.assertFalse(os.path.exists(journal.old_file))
+        self.assertTrue(os.path.exists(journal.snapshot_file))
+        self.assertEqual(len(self.written), 4)
+        journal.task.cancel()
+        journal.file.close()
+
+        state = self.new_journal().open()
+        self.assertEqual(list(state['entrust'].keys()), ['e2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import winq.trade.report.metrics as metrics
+
+
+class MetricsTest(unittest.TestCase):
+    window = 10
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.bdate_range('2022-01-03', periods=120)
+        ret = rng.normal(0.0005, 0.02, (len(index), 4))
+        self.equity = pd.DataFrame(1000000 * np.cumprod(1 + ret, axis=0), index=index, columns=list('abcd'))
+        # 长度不同的曲线末尾用NaN补齐
+        self.equity.iloc[-15:, 3] = np.nan
+
+    @staticmethod
+    def pct(eq: pd.Series) -> pd.Series:
+        return eq / eq.shift(1) - 1
+
+    def assert_series(self, actual, expected):
+        np.testing.assert_allclose(np.asarray(actual, dtype=float), np.asarray(expected, dtype=float),
+                                   rtol=1e-8, atol=1e-10, equal_nan=True)
+
+    def test_rolling_window(self):
+        window = self.window
+        returns = metrics.rolling_return(self.equity, window)
+        volatility = metrics.rolling_volatility(self.equity, window)
+        sharpe = metrics.rolling_sharpe(self.equity, window)
+        drawdown = metrics.rolling_max_drawdown(self.equity, window)
+        for col in self.equity.columns:
+            eq = self.equity[col]
+            ret = self.pct(eq).rolling(window - 1)
+            self.assert_series(returns[col], eq / eq.shift(window - 1) - 1)
+            self.assert_series(volatility[col], ret.std() * np.sqrt(252))
+            self.assert_series(sharpe[col], ret.mean() / ret.std() * np.sqrt(252))
+            self.assert_series(drawdown[col],
+                               eq.rolling(window).apply(lambda x: (1 - x / np.maximum.accumulate(x)).max(), raw=True))
+
+        # 所有rolling指标的前window-1行为NaN, 之后有值
+        for value in (returns, volatility, sharpe, drawdown):
+            self.assertTrue(value.iloc[:window - 1].isna().all().all())
+            self.assertFalse(value.iloc[window - 1].isna().any())
+
+    def test_batch(self):
+        total_return = metrics.total_return(self.equity)
+        volatility = metrics.volatility(self.equity)
+        sharpe = metrics.sharpe(self.equity)
+        max_drawdown = metrics.max_drawdown(self.equity)
+        for col in self.equity.columns:
+            eq = self.equity[col].dropna()
+            ret = self.pct(eq)
+            self.assertAlmostEqual(total_return[col], eq.iloc[-1] / eq.iloc[0] - 1, places=10)
+            self.assertAlmostEqual(volatility[col], ret.std() * np.sqrt(252), places=10)
+            self.assertAlmostEqual(sharpe[col], ret.mean() / ret.std() * np.sqrt(252), places=10)
+            self.assertAlmostEqual(max_drawdown[col], (1 - eq / eq.cummax()).max(), places=10)
+
+            # 单条曲线与批量结果一致
+            self.assertAlmostEqual(metrics.sharpe(eq), sharpe[col], places=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
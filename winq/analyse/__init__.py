@@ -1,5 +1,6 @@
 from .plot import *
 from .tools import linear_fitting, extrema
+from .downsample import lttb, downsample_index, resample_ohlc, date_labels
 
 from talib import *
 from talib.abstract import *
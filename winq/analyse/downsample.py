@@ -0,0 +1,108 @@
+"""
+图表降采样
+
+长周期(多年/分钟级)数据点数过多时, pyecharts生成的html过大浏览器无法打开, 超过点数预算时:
+1. 折线使用 LTTB(Largest-Triangle-Three-Buckets) 选点, 保留形状及极值
+2. k线按相邻bar合并(开-首, 高-最大, 低-最小, 收-尾, 量-和)
+"""
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+
+line_budget = 2000
+kline_budget = 1000
+
+
+def lttb(y, budget: int = line_budget, x=None) -> np.ndarray:
+    """
+    LTTB 降采样
+    :param y: 数值序列
+    :param budget: 输出点数
+    :param x: x值序列, 默认等距
+    :return: 选中点的下标(升序, 包括首尾)
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.shape[0]
+    if budget >= n or budget < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    y = np.nan_to_num(y, nan=0.0)
+
+    # 首尾之外的点分为 budget-2 个桶
+    edges = (np.arange(budget - 1) * (n - 2) / (budget - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    index = np.empty(budget, dtype=int)
+    index[0], index[-1] = 0, n - 1
+
+    pre = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < budget - 1:
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[pre] - avg_x) * (y[start:end] - y[pre]) - (x[pre] - x[start:end]) * (avg_y - y[pre]))
+        pre = start + int(np.argmax(area))
+        index[i + 1] = pre
+    return index
+
+
+def downsample_index(*series, budget: int = line_budget, keep_extrema: bool = True) -> np.ndarray:
+    """
+    多条共用x轴的折线选点: 按第一条折线LTTB选点, 并保留每条折线的最大最小值点
+    """
+    n = len(series[0])
+    if n <= budget:
+        return np.arange(n)
+    index = lttb(series[0], budget=budget)
+    if keep_extrema:
+        extrema = []
+        for data in series:
+            data = np.asarray(data, dtype=float)
+            extrema.extend([int(np.nanargmax(data)), int(np.nanargmin(data))])
+        index = np.union1d(index, extrema)
+    return index
+
+
+def resample_ohlc(data: pd.DataFrame, budget: int = kline_budget,
+                  date_field: str = 'trade_date') -> pd.DataFrame:
+    """
+    k线合并为不超过budget根, 时间取每组最后一根
+    """
+    n = data.shape[0]
+    if budget is None or n <= budget:
+        return data
+    size = int(np.ceil(n / budget))
+    agg = {}
+    for col in data.columns:
+        if col == 'open':
+            agg[col] = 'first'
+        elif col == 'high':
+            agg[col] = 'max'
+        elif col == 'low':
+            agg[col] = 'min'
+        elif col in ('volume', 'amount', 'turnover'):
+            agg[col] = 'sum'
+        elif col in ('code', 'name'):
+            agg[col] = 'first'
+        else:
+            agg[col] = 'last'
+    group = np.arange(n) // size
+    df = data.reset_index(drop=True).groupby(group).agg(agg)
+    if date_field in df.columns:
+        df[date_field] = pd.to_datetime(df[date_field])
+    return df.reset_index(drop=True)
+
+
+def date_labels(dates, fmt: Optional[str] = None) -> list:
+    """
+    日期标签(向量化), 默认 yy/mm/dd, 带时间的数据为 yy/mm/dd HH:MM
+    """
+    dates = pd.DatetimeIndex(dates)
+    if fmt is None:
+        fmt = '%y/%m/%d'
+        if len(dates) > 0 and (dates != dates.normalize()).any():
+            fmt = '%y/%m/%d %H:%M'
+    return list(dates.strftime(fmt))
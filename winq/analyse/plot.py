@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from typing import Sequence
 from pyecharts.commons.utils import JsCode
@@ -6,6 +7,7 @@ from pyecharts.charts import *
 import talib
 from pyecharts.charts.chart import Chart
 from pyecharts.globals import SymbolType
+from winq.analyse.downsample import resample_ohlc, date_labels, kline_budget
 
 
 def hi_mark() -> str:
@@ -94,9 +96,8 @@ def kline_tooltip_fmt_func():
 
 
 def kline_orig_data(df):
-    orig_data = df[:]
-    orig_data['trade_date'] = orig_data['trade_date'].apply(
-        lambda d: d.strftime('%Y/%m/%d')[2:])
+    orig_data = df.copy()
+    orig_data['trade_date'] = date_labels(orig_data['trade_date'])
     orig_data.index = orig_data['trade_date']
     orig_data.fillna('-', inplace=True)
     return orig_data.to_dict('index')
@@ -131,9 +132,10 @@ def plot_chart(chart_cls, x_index: list, y_data: list, title: str = '',
 
 
 def plot_volume(data: pd.DataFrame, *, title: str = '成交量', is_grid=False,
-                overlap: Sequence = ('ma5', 'ma10'),
+                overlap: Sequence = ('ma5', 'ma10'), budget: int = kline_budget,
                 **options):
-    trade_date = [d.strftime('%Y/%m/%d')[2:] for d in data['trade_date']]
+    data = resample_ohlc(data, budget)
+    trade_date = date_labels(data['trade_date'])
 
     bar = Bar()
     bar.add_xaxis(trade_date)
@@ -188,8 +190,7 @@ def plot_volume(data: pd.DataFrame, *, title: str = '成交量', is_grid=False,
                     title = None
                 if typ.startswith('ma'):
                     tm = int(typ[2:])
-                    ma = talib.MA(data['volume'], timeperiod=tm)
-                    ma = [round(v, 3) for v in ma]
+                    ma = list(np.round(talib.MA(data['volume'], timeperiod=tm), 3))
                     chart = plot_chart(chart_cls=Line, x_index=trade_date, y_data=ma,
                                        is_smooth=True, title=title,
                                        itemstyle_opts=opts.ItemStyleOpts(color=ma_color(typ)))
@@ -202,7 +203,7 @@ def plot_volume(data: pd.DataFrame, *, title: str = '成交量', is_grid=False,
 
 
 def plot_kline(data: pd.DataFrame, *, title: str = '日线', is_grid=False,
-               overlap: Sequence = ('ma5', 'ma10', 'ma20', 'ma30'),
+               overlap: Sequence = ('ma5', 'ma10', 'ma20', 'ma30'), budget: int = kline_budget,
                **options):
     """
     kline 默认标记最高点，最低点。 包括，MA5, MA10, MA20，可随意叠加overlap。
@@ -210,18 +211,18 @@ def plot_kline(data: pd.DataFrame, *, title: str = '日线', is_grid=False,
     :param data:
     :param title:
     :param overlap:
+    :param budget: k线数超过时相邻k线合并
     :return:
     """
+    data = resample_ohlc(data, budget)
     kdata = list(zip(data['open'], data['close'], data['low'], data['high']))
-    trade_date = [d.strftime('%Y/%m/%d')[2:] for d in data['trade_date']]
+    trade_date = date_labels(data['trade_date'])
 
     max_val, min_val = data['high'].max(), data['low'].min()
     max_y, min_y = int(max_val * 1.1), int(min_val * 0.9)
 
-    max_trade_date = data[data['high'] ==
-                          max_val].iloc[0]['trade_date'].strftime('%Y/%m/%d')[2:]
-    min_trade_date = data[data['low'] ==
-                          min_val].iloc[0]['trade_date'].strftime('%Y/%m/%d')[2:]
+    max_trade_date = trade_date[int(np.argmax(data['high'].values))]
+    min_trade_date = trade_date[int(np.argmin(data['low'].values))]
 
     kline = Kline()
     if not is_grid:
@@ -284,8 +285,7 @@ def plot_kline(data: pd.DataFrame, *, title: str = '日线', is_grid=False,
                 typ = typ.lower()
                 if typ.startswith('ma'):
                     tm = int(typ[2:])
-                    ma = talib.MA(data['close'], timeperiod=tm)
-                    ma = [round(v, 3) for v in ma]
+                    ma = list(np.round(talib.MA(data['close'], timeperiod=tm), 3))
                     chart = plot_chart(chart_cls=Line, x_index=trade_date, y_data=ma,
                                        is_smooth=True, title=typ,
                                        itemstyle_opts=opts.ItemStyleOpts(color=ma_color(typ)))
@@ -296,14 +296,19 @@ def plot_kline(data: pd.DataFrame, *, title: str = '日线', is_grid=False,
     return kline
 
 
-def my_plot(data: pd.DataFrame, overlap=None, marks=None):
+def my_plot(data: pd.DataFrame, overlap=None, marks=None, budget: int = kline_budget):
     """
     plot图象观察
     :param marks: marks: [{color:xx, data:[{trade_date:.. tip:...}...]}]
     :param data:
     :param overlap
+    :param budget: k线数超过时相邻k线合并, 标记合并到所在k线
     :return:
     """
+    is_resample = data.shape[0] > budget
+    data = resample_ohlc(data, budget)
+    dates = pd.DatetimeIndex(data['trade_date'])
+    trade_date = date_labels(dates)
 
     tips, scatters = None, []
     if marks is not None:
@@ -318,13 +323,14 @@ def my_plot(data: pd.DataFrame, overlap=None, marks=None):
             for item in mark['data']:
                 if 'trade_date' not in item or 'tip' not in item:
                     continue
-                index = item['trade_date'].strftime('%Y/%m/%d')[2:]
-                x_index.append(index)
-                y_tmp_data = data[data['trade_date'] == item['trade_date']]
-                if y_tmp_data.shape[0] <= 0:
+                pos = dates.searchsorted(item['trade_date'])
+                if pos >= len(dates) or (not is_resample and dates[pos] != item['trade_date']):
                     continue
-                y_index.append(y_tmp_data.iloc[0]['low']*0.985)
-                tips[index] = item['tip'].replace('\n', '<br>')
+                index = trade_date[pos]
+                x_index.append(index)
+                y_index.append(data['low'].iloc[pos]*0.985)
+                tip = item['tip'].replace('\n', '<br>')
+                tips[index] = tips[index] + '<br>' + tip if index in tips else tip
 
             if 0 < len(x_index) == len(y_index):
                 scatter = plot_chart(chart_cls=Scatter,
@@ -347,17 +353,18 @@ def my_plot(data: pd.DataFrame, overlap=None, marks=None):
         overlap = overlap + scatters
 
     return plot_grid(data=data, title='日线', overlap=overlap,
-                     chart1=plot_volume(data, is_grid=True),
+                     chart1=plot_volume(data, is_grid=True), budget=budget,
                      jscode='var tips = {}'.format(tips if tips is not None else {}))
 
 
-def plot_grid(data: pd.DataFrame, title=None, overlap=None, chart1=None, jscode=None):
+def plot_grid(data: pd.DataFrame, title=None, overlap=None, chart1=None, jscode=None, budget: int = kline_budget):
     """
     第一个为kline，下方有1
 
     :return:
     """
 
+    data = resample_ohlc(data, budget)
     if chart1 is None:
         return plot_kline(data=data, title=title)
 
@@ -366,7 +373,7 @@ def plot_grid(data: pd.DataFrame, title=None, overlap=None, chart1=None, jscode=
         is_show=True, axislabel_opts=opts.LabelOpts(is_show=False)))
 
     grid = Grid()
-    trade_date = [d.strftime('%Y/%m/%d')[2:] for d in data['trade_date']]
+    trade_date = date_labels(data['trade_date'])
     grid.add_js_funcs('var kdata={}'.format(kline_orig_data(data)))
     grid.add_js_funcs('var trade_date={}'.format(trade_date))
     grid.add_js_funcs('var colors=["{}", "{}"]'.format(
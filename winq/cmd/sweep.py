@@ -0,0 +1,51 @@
+from winq.common import setup_log, setup_db, run_until_complete
+from winq.data.winqdb import WinQDB
+from winq.config import *
+import os
+import yaml
+import click
+from winq.trade.sweep import Sweep
+
+
+@click.command()
+@click.option('--conf', type=str, default='~/.config/winq/config.yml', help='config file, default location: ~')
+@click.option('--grid', type=str, help='parameter grid yml file')
+@click.option('--processes', type=int, default=None, help='process count, default: cpu count')
+@click.option('--output', type=str, default=None, help='result csv file')
+def main(conf: str, grid: str, processes: int, output: str):
+    if conf is not None and '~' in conf:
+        conf = os.path.expanduser(conf)
+    conf_file, conf_dict = init_config(conf)
+    if conf_file is None or conf_dict is None:
+        print('config file: {} not exists / load yaml config failed'.format(conf))
+        return
+    if conf_dict['trade']['type'] != 'backtest':
+        print('sweep only support backtest trade type')
+        return
+
+    if grid is None or not os.path.exists(os.path.expanduser(grid)):
+        print('grid file: {} not exists'.format(grid))
+        return
+    with open(os.path.expanduser(grid)) as f:
+        grid_dict = yaml.load(f.read(), yaml.FullLoader)
+
+    log_file = conf_dict['log']['file'] if 'file' in conf_dict['log'] else 'sweep.log'
+    setup_log(conf_dict, log_file)
+    db_data = setup_db(conf_dict, WinQDB)
+    if db_data is None:
+        print('data_db init failed')
+        return
+
+    sweep = Sweep(db_data=db_data, config=conf_dict, grid=grid_dict, processes=processes)
+    data = run_until_complete(sweep.run())[0]
+    if data is None:
+        print('sweep failed')
+        return
+
+    print(data)
+    if output is not None:
+        data.to_csv(output, index=False)
+
+
+if __name__ == '__main__':
+    main()
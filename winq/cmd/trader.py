@@ -5,6 +5,7 @@ import signal
 import os
 import click
 from winq.trade.trader import Trader
+from winq.trade.multi_trader import MultiTrader
 from winq.trade.tradedb import TradeDB
 
 
@@ -27,9 +28,18 @@ def main(conf: str):
         print('data_db / trade_db init failed')
         return
 
-    trader = Trader(db_trade=db_trade, db_data=db_data, config=conf_dict)
+    acct_id = conf_dict['trade']['account-id']
+    if typ != 'backtest' and (acct_id is None or len(acct_id) == 0):
+        # 未指定账户, 同一进程运行数据库中所有已运行的账户
+        trader = MultiTrader(db_trade=db_trade, db_data=db_data, config=conf_dict)
+    else:
+        trader = Trader(db_trade=db_trade, db_data=db_data, config=conf_dict)
     signal.signal(signal.SIGTERM, trader.signal_handler)
     signal.signal(signal.SIGINT, trader.signal_handler)
+    if hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 开始/停止采样分析, kill -USR2 输出任务及队列
+        signal.signal(signal.SIGUSR1, trader.profile_handler)
+        signal.signal(signal.SIGUSR2, trader.tasks_handler)
     run_until_complete(trader.start())
 
 
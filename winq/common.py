@@ -82,9 +82,12 @@ def run_until_complete(*coro):
 
 
 def setup_log(conf_dict, file_name, reset=False):
-    log.setup_logger(file=conf_dict['log']['path'] + os.sep + file_name,
-                     level=conf_dict['log']['level'],
-                     reset=reset)
+    log_dict = conf_dict['log']
+    log.setup_logger(file=log_dict['path'] + os.sep + file_name,
+                     level=log_dict['level'],
+                     reset=reset,
+                     use_queue=log_dict['queue'] if 'queue' in log_dict else False,
+                     limit=log_dict['limit'] if 'limit' in log_dict else None)
     logger = log.get_logger()
     logger.debug('初始化数日志')
 
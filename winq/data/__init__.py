@@ -1,3 +1,4 @@
 
 from winq.data.winqdb import WinQDB
 from winq.data.mongodb import MongoDB
+from winq.data.panel import SharedPanel
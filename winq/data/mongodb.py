@@ -7,6 +7,7 @@ import time
 import traceback
 import pandas as pd
 from winq import log
+import winq.monitor as monitor
 from abc import ABC
 import asyncio
 from functools import partial
@@ -68,7 +69,7 @@ class MongoDB(ABC):
         :param kwargs:  filter=None, projection=None, skip=0, limit=0, sort=None, to_frame=True
         :return: DataFrame
         """
-        self.log.debug('加载: {}, kwargs={} ...'.format(attr, kwargs))
+        self.log.debug('加载: {}, kwargs={} ...', attr, kwargs)
         df = await self.do_load(coll, **kwargs)
         self.log.debug('加载: {} 成功 size={}'.format(
             attr, df.shape[0] if df is not None else 0))
@@ -81,7 +82,7 @@ class MongoDB(ABC):
         """
         count = data.shape[0] if data is not None else 0
         inserted_ids = []
-        self.log.debug('保存: {}, count = {} ...'.format(attr, count))
+        self.log.debug('保存: {}, count = {} ...', attr, count)
         if count > 0:
             inserted_ids = await self.do_insert(coll=coll, data=data)
         self.log.debug('保存: {} 成功, size = {}'.format(
@@ -118,6 +119,7 @@ class MongoDB(ABC):
             return None
         return client[db][col]
 
+    @monitor.timed('winq_db_seconds', op='load')
     async def do_load(self, coll, filter=None, projection=None, skip=0, limit=0, sort=None, to_frame=True):
         for i in range(5):
             try:
@@ -140,12 +142,14 @@ class MongoDB(ABC):
                         return data
                 break
             except (ServerSelectionTimeoutError, AutoReconnect) as e:
+                monitor.inc('winq_db_errors_total', op='load')
                 self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试'.format(
                     self.do_load.__name__, e, traceback.format_exc(), (i + 1) * 5))
                 await asyncio.sleep((i + 1) * 5)
                 self.init()
         return None
 
+    @monitor.timed('winq_db_seconds', op='update')
     async def do_update(self, coll, filter=None, update=None, upsert=True):
         for i in range(5):
             try:
@@ -156,12 +160,14 @@ class MongoDB(ABC):
                 return res.matched_count if res.matched_count > 0 else (
                     res.upserted_id if res.upserted_id is not None else 0)
             except (ServerSelectionTimeoutError, AutoReconnect) as e:
+                monitor.inc('winq_db_errors_total', op='update')
                 self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试'.format(
                     self.do_update.__name__, e, traceback.format_exc(), (i + 1) * 5))
                 await asyncio.sleep((i + 1) * 5)
                 self.init()
         return 0
 
+    @monitor.timed('winq_db_seconds', op='update_many')
     async def do_update_many(self, coll, filter=None, update=None, upsert=True):
         for i in range(5):
             try:
@@ -172,6 +178,7 @@ class MongoDB(ABC):
                 return res.matched_count if res.matched_count > 0 else (
                     res.upserted_id if res.upserted_id is not None else 0)
             except (ServerSelectionTimeoutError, AutoReconnect) as e:
+                monitor.inc('winq_db_errors_total', op='update_many')
                 self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试'.format(
                     self.do_update.__name__, e, traceback.format_exc(), (i + 1) * 5))
                 await asyncio.sleep((i + 1) * 5)
@@ -191,6 +198,7 @@ class MongoDB(ABC):
                 upsert_list.append(upsert)
         return upsert_list if len(upsert_list) > 0 else None
 
+    @monitor.timed('winq_db_seconds', op='delete')
     async def do_delete(self, coll, filter=None, just_one=True):
         for i in range(5):
             try:
@@ -204,12 +212,14 @@ class MongoDB(ABC):
                         res = await coll.drop()
                 return 0 if res is None else res.deleted_count
             except (ServerSelectionTimeoutError, AutoReconnect) as e:
-                self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试').format(
-                    self.do_delete.__name__, e, traceback.format_exc(), (i + 1) * 5)
+                monitor.inc('winq_db_errors_total', op='delete')
+                self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试'.format(
+                    self.do_delete.__name__, e, traceback.format_exc(), (i + 1) * 5))
                 await asyncio.sleep((i + 1) * 5)
                 self.init()
         return 0
 
+    @monitor.timed('winq_db_seconds', op='insert')
     async def do_insert(self, coll, data):
         for i in range(5):
             try:
@@ -220,8 +230,9 @@ class MongoDB(ABC):
                     inserted_ids = result.inserted_ids
                 return inserted_ids
             except (ServerSelectionTimeoutError, AutoReconnect) as e:
-                self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试').format(
-                    self.do_insert.__name__, e, traceback.format_exc(), (i + 1) * 5)
+                monitor.inc('winq_db_errors_total', op='insert')
+                self.log.error('mongodb 调用 {}, 连接异常: ex={}, call {}, {}s后重试'.format(
+                    self.do_insert.__name__, e, traceback.format_exc(), (i + 1) * 5))
                 await asyncio.sleep((i + 1) * 5)
                 self.init()
         return 0
@@ -0,0 +1,105 @@
+"""
+共享内存行情面板
+
+数据按 fields x dates x codes 对齐为一个float64数组放在共享内存中，
+主进程加载一次，子进程通过meta()描述attach，直接映射同一块内存，不复制数据。
+"""
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+
+class SharedPanel:
+    def __init__(self, data: np.ndarray, dates: Sequence, codes: Sequence, fields: Sequence,
+                 names: Optional[Dict] = None, shm: Optional[shared_memory.SharedMemory] = None,
+                 owner: bool = False):
+        self.data = data
+        self.dates = pd.DatetimeIndex(dates)
+        self.codes = list(codes)
+        self.fields = list(fields)
+        self.names = names if names is not None else {}
+
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.field_index = {field: i for i, field in enumerate(self.fields)}
+
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, fields: Sequence, *, date_col='trade_date',
+                   names: Optional[Dict] = None, shared=True) -> 'SharedPanel':
+        """
+        由长表(code, date_col, fields...)生成面板，缺失值为NaN
+        :param df: 行情数据
+        :param fields: 需要放入面板的数值字段
+        :param date_col: 时间字段
+        :param names: code: name 字典
+        :param shared: 是否放入共享内存
+        :return:
+        """
+        date_index, dates = pd.factorize(df[date_col], sort=True)
+        code_index, codes = pd.factorize(df['code'], sort=True)
+        shape = (len(fields), len(dates), len(codes))
+
+        shm = None
+        if shared:
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+            data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        else:
+            data = np.empty(shape, dtype=np.float64)
+        data.fill(np.nan)
+
+        for i, field in enumerate(fields):
+            data[i, date_index, code_index] = df[field].values.astype(np.float64)
+
+        if names is None and 'name' in df.columns:
+            names = dict(zip(df['code'], df['name']))
+
+        return cls(data=data, dates=dates, codes=codes, fields=fields, names=names, shm=shm, owner=shared)
+
+    def meta(self) -> Dict:
+        """
+        可pickle的描述，传给子进程attach
+        """
+        if self.shm is None:
+            raise Exception('panel is not in shared memory')
+        return dict(name=self.shm.name, shape=self.data.shape,
+                    dates=self.dates, codes=self.codes, fields=self.fields, names=self.names)
+
+    @classmethod
+    def attach(cls, meta: Dict) -> 'SharedPanel':
+        shm = shared_memory.SharedMemory(name=meta['name'])
+        data = np.ndarray(meta['shape'], dtype=np.float64, buffer=shm.buf)
+        return cls(data=data, dates=meta['dates'], codes=meta['codes'], fields=meta['fields'],
+                   names=meta['names'], shm=shm, owner=False)
+
+    def field(self, field: str) -> np.ndarray:
+        """
+        :return: dates x codes 视图
+        """
+        return self.data[self.field_index[field]]
+
+    def frame(self, field: str) -> pd.DataFrame:
+        return pd.DataFrame(self.field(field), index=self.dates, columns=self.codes, copy=False)
+
+    def code(self, code: str) -> pd.DataFrame:
+        """
+        :return: 单个代码的 dates x fields 数据，去掉无数据的日期
+        """
+        df = pd.DataFrame(self.data[:, :, self.code_index[code]].T, index=self.dates, columns=self.fields)
+        return df[~np.isnan(df[self.fields[0]].values)]
+
+    def close(self):
+        self.data = None
+        if self.shm is not None:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
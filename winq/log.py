@@ -1,9 +1,23 @@
 """
 日志
+
+1. 参数延迟格式化: log.info('evt={}, payload={}', evt, payload), 日志级别未开启或被限流时不格式化
+2. 按logger名称限流(DEBUG/INFO, WARNING及以上不限): rate 每秒条数(burst 突发条数), sample 每n条记录1条
+3. queue: true 时日志经队列由后台线程写文件/终端, 文件I/O不在事件循环中执行
+
+配置:
+log:
+  queue: true
+  limit:
+    Account: {rate: 10, burst: 20}
+    Dummy: {sample: 100}
 """
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
-from typing import Any
+import queue
+import time
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+from typing import Any, Dict, Optional
 
 
 class _ColorFormatter(logging.Formatter):
@@ -34,10 +48,76 @@ class _ColorFormatter(logging.Formatter):
         return super().format(record)
 
 
+class _Limiter:
+    """
+    令牌桶限流及采样
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[int] = None, sample: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else (max(rate, 1) if rate is not None else None)
+        self.sample = sample if sample is not None and sample > 1 else None
+
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.count = 0
+        self.suppressed = 0
+
+    @classmethod
+    def from_config(cls, opt: Dict) -> '_Limiter':
+        return cls(rate=float(opt['rate']) if 'rate' in opt else None,
+                   burst=int(opt['burst']) if 'burst' in opt else None,
+                   sample=int(opt['sample']) if 'sample' in opt else None)
+
+    def allow(self) -> bool:
+        if self.sample is not None:
+            self.count += 1
+            if self.count % self.sample != 1:
+                self.suppressed += 1
+                return False
+        if self.rate is not None:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+        return True
+
+
+class _LazyMsg:
+    """
+    日志被handler处理时才格式化
+    """
+    __slots__ = ('prefix', 'msg', 'args', 'suppressed')
+
+    def __init__(self, prefix, msg, args, suppressed=0):
+        self.prefix = prefix
+        self.msg = msg
+        self.args = args
+        self.suppressed = suppressed
+
+    def __str__(self):
+        msg = str(self.msg)
+        if len(self.args) > 0:
+            msg = msg.format(*self.args)
+        if self.suppressed > 0:
+            msg = '{} (suppressed {})'.format(msg, self.suppressed)
+        if self.prefix is not None:
+            msg = self.prefix + ' ' + msg
+        return msg
+
+
 class _LogContext:
     def __init__(self, file=None, level=logging.DEBUG, color=False):
         self.is_inited = False
 
+        self.use_queue = False
+        self.queue_handler = None
+        self.listener = None
+        self.limits = {}
+
         self.color = color
         self.file = file
         self.level = level
@@ -48,12 +128,15 @@ class _LogContext:
         self.stream_handler = None
         self.formatter = '[%(asctime)s][%(levelname).1s][%(name)s]  %(message)s'
 
-    def setup_logger(self, file=None, level=logging.DEBUG, color=False):
+    def setup_logger(self, file=None, level=logging.DEBUG, color=False, use_queue=False, limit=None):
         self.is_inited = True
 
         self.color = color
         self.file = file
         self.level = level
+        self.use_queue = use_queue
+        if limit is not None:
+            self.limits = {name: _Limiter.from_config(opt) for name, opt in limit.items()}
 
         for name, my_log in self.tmp_loggers.items():
             my_log.log.removeHandler(self.tmp_handlers[name]['handler'])
@@ -71,6 +154,30 @@ class _LogContext:
             return self.file_handler
         return None
 
+    def get_queue_handler(self):
+        """
+        所有logger共用一个队列handler, 后台线程写终端/文件
+        """
+        if self.queue_handler is not None:
+            return self.queue_handler
+
+        handlers = [self.get_stream_handler()]
+        if self.file is not None:
+            handlers.append(self.get_file_handler())
+        for handler in handlers:
+            handler.setLevel(self.level)
+        log_queue = queue.SimpleQueue()
+        self.queue_handler = QueueHandler(log_queue)
+        self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+        return self.queue_handler
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
     def get_stream_handler(self):
         if self.stream_handler is not None:
             return self.stream_handler
@@ -85,13 +192,18 @@ class _LogContext:
 
             log = logging.getLogger(name)
             log.setLevel(self.level)
-            ch = self.get_stream_handler()
-            ch.setLevel(self.level)
-            log.addHandler(ch)
-            if self.file is not None:
-                ch = self.get_file_handler()
+            if self.use_queue:
+                ch = self.get_queue_handler()
                 ch.setLevel(self.level)
                 log.addHandler(ch)
+            else:
+                ch = self.get_stream_handler()
+                ch.setLevel(self.level)
+                log.addHandler(ch)
+                if self.file is not None:
+                    ch = self.get_file_handler()
+                    ch.setLevel(self.level)
+                    log.addHandler(ch)
             self.loggers[name] = _MyLogger(log=log, prefix=prefix)
             return self.loggers[name]
 
@@ -114,38 +226,50 @@ class _MyLogger:
         self.log = log
         self.prefix = prefix
 
-    def get_msg(self, msg):
-        if self.prefix is not None:
-            return self.prefix + ' ' + msg
-        return msg
+    def is_enabled(self, level=logging.DEBUG) -> bool:
+        return self.log.isEnabledFor(level)
+
+    def _log(self, level, msg, args, kwargs):
+        if not self.log.isEnabledFor(level):
+            return
+        suppressed = 0
+        if level < logging.WARNING:
+            limiter = _g_ctx.limits.get(self.log.name)
+            if limiter is not None:
+                if not limiter.allow():
+                    return
+                suppressed, limiter.suppressed = limiter.suppressed, 0
+        self.log.log(level, _LazyMsg(self.prefix, msg, args, suppressed), **kwargs)
 
     def debug(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        return self.log.debug(self.get_msg(msg), *args, **kwargs)
+        return self._log(logging.DEBUG, msg, args, kwargs)
 
     def info(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        return self.log.info(self.get_msg(msg), *args, **kwargs)
+        return self._log(logging.INFO, msg, args, kwargs)
 
     def warn(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        return self.log.warning(self.get_msg(msg), *args, **kwargs)
+        return self._log(logging.WARNING, msg, args, kwargs)
 
     def warning(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        return self.log.warning(self.get_msg(msg), *args, **kwargs)
+        return self._log(logging.WARNING, msg, args, kwargs)
 
     def error(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        return self.log.error(self.get_msg(msg), *args, **kwargs)
+        return self._log(logging.ERROR, msg, args, kwargs)
 
     def critical(self, msg: Any, *args: Any, **kwargs: Any) -> None:
-        return self.log.critical(self.get_msg(msg), *args, **kwargs)
+        return self._log(logging.CRITICAL, msg, args, kwargs)
 
 
 _g_ctx = _LogContext()
 
 
-def setup_logger(file=None, level='debug', color=False, reset=False):
+def setup_logger(file=None, level='debug', color=False, reset=False, use_queue=False, limit=None):
     global _g_ctx
     if reset:
+        _g_ctx.stop()
         _g_ctx = _LogContext()
-    _g_ctx.setup_logger(file=file, level=logging.getLevelName(level.upper()), color=color)
+    _g_ctx.setup_logger(file=file, level=logging.getLevelName(level.upper()), color=color,
+                        use_queue=use_queue, limit=limit)
 
 
 def get_logger(name='winq', prefix=None):
@@ -0,0 +1,311 @@
+"""
+运行时指标
+
+进程内指标注册表(计数器/瞬时值/直方图), 按 名称+标签 区分:
+- winq_queue_depth{queue,account} 交易队列深度, 采集时读取
+- winq_queue_events_total{queue,account,evt} 队列处理事件数
+- winq_queue_handle_seconds{queue,account} 队列处理函数耗时
+- winq_account_handle_seconds{handler} 账户处理函数耗时
+- winq_db_seconds{op} / winq_db_errors_total{op} 数据库操作耗时/连接异常
+- winq_quot_fetch_seconds / winq_quot_fetch_errors_total 实时行情拉取耗时/失败
+
+导出:
+1. 本地HTTP /metrics, Prometheus文本格式
+2. 定时输出快照到日志
+
+未开启时记录函数直接返回, 不产生开销. 配置:
+trade:
+  monitor:
+    host: 127.0.0.1
+    port: 9108   # 不配置不启动HTTP
+    interval: 60  # 日志快照间隔(秒), 0不输出
+"""
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Optional
+import winq.log as log
+
+_help = {
+    'winq_queue_depth': ('gauge', '交易队列深度'),
+    'winq_queue_events_total': ('counter', '队列处理事件数'),
+    'winq_queue_handle_seconds': ('histogram', '队列处理函数耗时'),
+    'winq_account_handle_seconds': ('histogram', '账户处理函数耗时'),
+    'winq_db_seconds': ('histogram', '数据库操作耗时'),
+    'winq_db_errors_total': ('counter', '数据库连接异常次数'),
+    'winq_quot_fetch_seconds': ('histogram', '实时行情拉取耗时'),
+    'winq_quot_fetch_errors_total': ('counter', '实时行情拉取失败次数'),
+}
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+    def get(self):
+        return self.value
+
+
+class Gauge:
+    __slots__ = ('value', 'func')
+
+    def __init__(self):
+        self.value = 0
+        self.func = None
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        if self.func is not None:
+            try:
+                return self.func()
+            except Exception:
+                return float('nan')
+        return self.value
+
+
+class Histogram:
+    """
+    固定桶直方图, 单位秒
+    """
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def get(self):
+        return dict(count=self.count,
+                    mean_ms=round(self.sum * 1000 / self.count, 3) if self.count > 0 else 0.0,
+                    max_ms=round(self.max * 1000, 3))
+
+
+class Registry:
+    def __init__(self):
+        self.enable = False
+        # name -> (type, {labels: metric})
+        self.metrics = {}
+
+    def _get(self, typ: str, cls, name: str, labels: Dict):
+        if name not in self.metrics:
+            self.metrics[name] = (typ, {})
+        children = self.metrics[name][1]
+        key = tuple(sorted(labels.items()))
+        metric = children.get(key)
+        if metric is None:
+            metric = cls()
+            children[key] = metric
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get('counter', Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get('gauge', Gauge, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get('histogram', Histogram, name, labels)
+
+    def gauge_func(self, name: str, func: Callable, **labels):
+        """
+        采集时调用func取值(如队列深度), 不需要在处理路径上更新
+        """
+        self.gauge(name, **labels).func = func
+
+    @staticmethod
+    def _labels(key, extra=None) -> str:
+        items = list(key) + ([extra] if extra is not None else [])
+        if len(items) == 0:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in items) + '}'
+
+    def render(self) -> str:
+        """
+        Prometheus 文本格式
+        """
+        lines = []
+        for name, (typ, children) in sorted(self.metrics.items()):
+            if name in _help:
+                lines.append('# HELP {} {}'.format(name, _help[name][1]))
+            lines.append('# TYPE {} {}'.format(name, typ))
+            for key, metric in children.items():
+                if typ != 'histogram':
+                    lines.append('{}{} {}'.format(name, self._labels(key), metric.get()))
+                    continue
+                acc = 0
+                for le, cnt in zip(metric.buckets, metric.counts):
+                    acc += cnt
+                    lines.append('{}_bucket{} {}'.format(name, self._labels(key, ('le', le)), acc))
+                lines.append('{}_bucket{} {}'.format(name, self._labels(key, ('le', '+Inf')), metric.count))
+                lines.append('{}_sum{} {}'.format(name, self._labels(key), metric.sum))
+                lines.append('{}_count{} {}'.format(name, self._labels(key), metric.count))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        data = {}
+        for name, (typ, children) in sorted(self.metrics.items()):
+            for key, metric in children.items():
+                data[name + self._labels(key)] = metric.get()
+        return data
+
+
+registry = Registry()
+
+
+def inc(name: str, value=1, **labels):
+    if registry.enable:
+        registry.counter(name, **labels).inc(value)
+
+
+def observe(name: str, seconds: float, **labels):
+    if registry.enable:
+        registry.histogram(name, **labels).observe(seconds)
+
+
+def set_gauge(name: str, value, **labels):
+    if registry.enable:
+        registry.gauge(name, **labels).set(value)
+
+
+def gauge_func(name: str, func: Callable, **labels):
+    if registry.enable:
+        registry.gauge_func(name, func, **labels)
+
+
+def clock() -> float:
+    return time.perf_counter()
+
+
+@contextmanager
+def timer(name: str, **labels):
+    if not registry.enable:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.histogram(name, **labels).observe(time.perf_counter() - start)
+
+
+def timed(name: str, **labels):
+    """
+    async函数耗时
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not registry.enable:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                registry.histogram(name, **labels).observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class Monitor:
+    def __init__(self, host: str = '127.0.0.1', port: Optional[int] = None, interval: int = 60):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.host = host
+        self.port = port
+        self.interval = interval
+
+        self.server = None
+        self.task = None
+        self.routes = {}
+
+    @classmethod
+    def from_config(cls, opt: Optional[Dict]) -> Optional['Monitor']:
+        if opt is None:
+            return None
+        return cls(host=opt['host'] if 'host' in opt else '127.0.0.1',
+                   port=int(opt['port']) if 'port' in opt and opt['port'] is not None else None,
+                   interval=int(opt['interval']) if 'interval' in opt else 60)
+
+    def route(self, path: str, func: Callable[[], str]):
+        """
+        HTTP路径 -> 处理函数(在事件循环中调用, 返回文本)
+        """
+        self.routes[path] = func
+
+    async def start(self) -> bool:
+        registry.enable = True
+        if self.port is not None:
+            try:
+                self.server = await asyncio.start_server(self.on_request, host=self.host, port=self.port)
+            except Exception as e:
+                self.log.error('start metrics server {}:{} failed: {}'.format(self.host, self.port, e))
+                return False
+            self.log.info('metrics server started: http://{}:{}/metrics'.format(self.host, self.port))
+        if self.interval > 0:
+            self.task = asyncio.get_event_loop().create_task(self.snapshot_task())
+        return True
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.dump()
+
+    async def on_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = request.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if path == '/metrics':
+                status, body = '200 OK', registry.render().encode('utf-8')
+            elif path in self.routes:
+                status, body = '200 OK', (self.routes[path]() + '\n').encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write('HTTP/1.1 {}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         'Content-Length: {}\r\nConnection: close\r\n\r\n'.format(status, len(body)).encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        except Exception as e:
+            self.log.debug('metrics request failed: {}'.format(e))
+        finally:
+            writer.close()
+
+    def dump(self):
+        for name, value in registry.snapshot().items():
+            self.log.info('metrics {}: {}'.format(name, value))
+
+    async def snapshot_task(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.dump()
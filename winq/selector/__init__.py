@@ -1,4 +1,5 @@
 from winq.selector.strategy import *
+from winq.selector.panel import SelectPanel
 import pandas as pd
 
 
@@ -0,0 +1,222 @@
+"""
+选股形态计算
+
+输入按时间倒序, 第0行为最近交易日, 沿第0维计算, 不逐行循环:
+- 单个代码: 一维数组, 如 kdata['close'].values
+- 面板: days x codes 二维数组, 如 SelectPanel.field('close')
+一维输入返回标量, 二维输入每个代码返回一个值.
+"""
+from typing import Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+
+
+def _rows(data: np.ndarray) -> np.ndarray:
+    """
+    与data可广播的行号
+    """
+    return np.arange(data.shape[0]).reshape((-1,) + (1,) * (data.ndim - 1))
+
+
+def _newer(data: np.ndarray) -> np.ndarray:
+    """
+    每行对应的较新一个交易日(上一行)的值, 第0行为NaN
+    """
+    newer = np.empty_like(data, dtype=np.float64)
+    if data.shape[0] > 0:
+        newer[0] = np.nan
+        newer[1:] = data[:-1]
+    return newer
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.ndarray) and value.ndim == 0 else value
+
+
+def take(data, index):
+    """
+    每个代码取第index行
+    :param data: 一维/二维数组
+    :param index: 行号, 二维时每个代码一个
+    """
+    data = np.asarray(data)
+    index = np.clip(np.asarray(index), 0, data.shape[0] - 1)
+    return _scalar(np.take_along_axis(data, np.expand_dims(index, 0), axis=0)[0])
+
+
+def leading_true(cond, start=0):
+    """
+    从第start行开始连续为True的行数, 如 hit_days, high_days
+    :param cond: bool数组
+    :param start: 开始行号, 二维时可每个代码不同
+    """
+    cond = np.asarray(cond, dtype=bool)
+    if cond.shape[0] == 0:
+        return _scalar(np.zeros(cond.shape[1:], dtype=np.int64))
+    start = np.asarray(start)
+    cond = cond | (_rows(cond) < start)
+    days = np.where(cond.all(axis=0), cond.shape[0], cond.argmin(axis=0)) - start
+    return _scalar(np.maximum(days, 0))
+
+
+def next_false(cond):
+    """
+    每行及之后(更早的交易日)第一个为False的行号, 如 连续为True区间结束的位置
+    :param cond: bool数组
+    :return: 与cond形状相同, 没有False时为行数
+    """
+    cond = np.asarray(cond, dtype=bool)
+    index = np.where(cond, cond.shape[0], _rows(cond))
+    return np.minimum.accumulate(index[::-1], axis=0)[::-1]
+
+
+def sum_since(data, start=0, end=None):
+    """
+    [start, end) 行的和, 按行顺序累加(与逐行循环相加结果相同)
+    :param data: 一维/二维数组
+    :param start: 开始行号, 二维时可每个代码不同
+    :param end: 结束行号(不包括), None为全部, 二维时可每个代码不同
+    """
+    data = np.asarray(data, dtype=np.float64)
+    end = data.shape[0] if end is None else np.asarray(end)
+    rows = _rows(data)
+    inside = (rows >= np.asarray(start)) & (rows < end)
+    if data.shape[0] == 0:
+        return _scalar(np.zeros(data.shape[1:]))
+    return _scalar(np.cumsum(np.where(inside, data, 0.0), axis=0)[-1])
+
+
+def extreme_since(data, start=0, end=None, kind='max') -> Tuple:
+    """
+    [start, end) 行内的最大/最小值及其行号(相同取最早的行), 忽略NaN
+    :param data: 一维/二维数组
+    :param start: 开始行号, 二维时可每个代码不同
+    :param end: 结束行号(不包括), None为全部
+    :param kind: max/min
+    :return: (值, 行号), 区间内没有数据时值为NaN
+    """
+    data = np.asarray(data, dtype=np.float64)
+    end = data.shape[0] if end is None else np.asarray(end)
+    rows = _rows(data)
+    inside = (rows >= np.asarray(start)) & (rows < end) & ~np.isnan(data)
+    if kind == 'max':
+        index = np.where(inside, data, -np.inf).argmax(axis=0)
+    else:
+        index = np.where(inside, data, np.inf).argmin(axis=0)
+    found = np.take_along_axis(inside, np.expand_dims(index, 0), axis=0)[0]
+    value = np.where(found, np.take_along_axis(data, np.expand_dims(index, 0), axis=0)[0], np.nan)
+    return _scalar(value), _scalar(index)
+
+
+def gaps(high, low) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    缺口及是否回补, 缺口记在较早的一天
+    下跌缺口: 后一日最高价低于当日最低价, 以low为基准, 百分比为负; 之后的最高价 >= low 为回补
+    上升缺口: 后一日最低价高于当日最高价, 以high为基准, 百分比为正; 之后的最低价 <= high 为回补
+    :return: (gap_pct, is_gap_fill), 与输入形状相同
+    """
+    high, low = np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64)
+    prev_high, prev_low = _newer(high), _newer(low)
+    # 之后(更新的)交易日的最高/最低价
+    later_max = _newer(np.fmax.accumulate(high, axis=0))
+    later_min = _newer(np.fmin.accumulate(low, axis=0))
+
+    valid = (prev_high != 0) & (prev_low != 0)
+    down = valid & (prev_high < low)
+    up = valid & (prev_low > high)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap_pct = np.where(down, np.round((prev_high - low) / low * 100, 2),
+                           np.where(up, np.round((prev_low - high) / high * 100, 2), 0.0))
+    is_gap_fill = (down & (later_max >= low)) | (up & (later_min <= high))
+    return gap_pct, is_gap_fill
+
+
+def cal_gaps(kdata: pd.DataFrame) -> pd.DataFrame:
+    """
+    kdata 按时间降序, 增加 gap_pct, is_gap_fill 列
+    """
+    kdata['gap_pct'], kdata['is_gap_fill'] = gaps(kdata['high'].values, kdata['low'].values)
+    return kdata
+
+
+def leg_ratio(open_, high, low, close) -> Tuple:
+    """
+    上影线(high - close)/下影线(open - low) 占振幅的百分比, 无振幅为NaN
+    :return: (top, bottom)
+    """
+    open_, high, low, close = (np.asarray(v, dtype=np.float64) for v in (open_, high, low, close))
+    amplitude = np.where(high == low, np.nan, high - low)
+    return _scalar((high - close) * 100 / amplitude), _scalar((open_ - low) * 100 / amplitude)
+
+
+def is_long_leg(open_, high, low, close, ratio, side=None):
+    """
+    上影线/下影线占振幅超过ratio(百分比)
+    :param side: top/bottom/[top, bottom], None为任一
+    """
+    if side is None:
+        side = ['top', 'bottom']
+    if isinstance(side, str):
+        side = [side]
+    top, bottom = leg_ratio(open_, high, low, close)
+    hit = np.zeros(np.shape(top), dtype=bool)
+    if 'top' in side:
+        hit = hit | (top > ratio)
+    if 'bottom' in side:
+        hit = hit | (bottom > ratio)
+    return _scalar(hit)
+
+
+def falling_down(high, close, chg_pct):
+    """
+    最高价涨幅与收盘涨幅之差(百分比), 即冲高回落的幅度
+    """
+    high, close, chg_pct = (np.asarray(v, dtype=np.float64) for v in (high, close, chg_pct))
+    last_close = close / (1.0 + chg_pct / 100)
+    return _scalar((high - last_close) * 100 / last_close - chg_pct)
+
+
+def is_red(open_, close):
+    return _scalar(np.asarray(close) >= np.asarray(open_))
+
+
+def is_20cm(code: Union[str, Sequence[str]]):
+    """
+    创业板/科创板, 涨跌幅限制20%
+    """
+    if isinstance(code, str):
+        return code[:4] in ('sh68', 'sz30')
+    prefix = pd.Series(code, dtype=object).str[:4]
+    return prefix.isin(['sh68', 'sz30']).values
+
+
+def limit_rate(code: Union[str, Sequence[str]]):
+    """
+    涨跌幅限制(百分比), 面板时为每个代码的数组
+    """
+    if isinstance(code, str):
+        return 20.0 if is_20cm(code) else 10.0
+    return np.where(is_20cm(code), 20.0, 10.0)
+
+
+def limit_price(last_close, rate):
+    """
+    涨停价, 四舍五入到分
+    """
+    return np.round(np.asarray(last_close, dtype=np.float64) * (1 + np.asarray(rate) / 100) + 1e-9, 2)
+
+
+def is_limit_up(close, chg_pct, rate, price=None, last_close=None):
+    """
+    是否涨停
+    :param close: 收盘价
+    :param chg_pct: 涨幅(百分比), 用于推算前收盘价
+    :param rate: 涨跌幅限制, 见limit_rate
+    :param price: 比较的价格, None为收盘价(收盘涨停), 传最高价为盘中触及涨停
+    :param last_close: 前收盘价, 给出时不用chg_pct推算
+    """
+    close = np.asarray(close, dtype=np.float64)
+    price = close if price is None else np.asarray(price, dtype=np.float64)
+    if last_close is None:
+        last_close = np.round(close / (1 + np.asarray(chg_pct, dtype=np.float64) / 100), 2)
+    return _scalar(price >= limit_price(last_close, rate) - 1e-6)
@@ -0,0 +1,154 @@
+"""
+选股面板
+
+全市场最近ndays个交易日的日线一次查询, 对齐为 fields x days x codes 的float64数组:
+- days 按每个代码自己的交易日倒序对齐, 第0行为最近交易日, 与
+  load_kdata(limit=ndays, sort=[('trade_date', -1)]) 得到的 kdata.iloc[i] 一致(停牌日期不占行)
+- 数据不足ndays的代码, 缺少的行为NaN, count为每个代码实际的天数
+- trade_date 单独保存(days x codes, datetime64)
+- shared=True 时数值放在共享内存中, 进程池子进程通过meta() attach, 不复制数据
+"""
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+
+
+class SelectPanel:
+    def __init__(self, data: np.ndarray, trade_date: np.ndarray, count: np.ndarray,
+                 codes, fields, names: Optional[Dict] = None,
+                 shm: Optional[shared_memory.SharedMemory] = None, owner: bool = False):
+        self.data = data
+        self.trade_date = trade_date
+        self.count = count
+        self.codes = list(codes)
+        self.fields = list(fields)
+        self.names = names if names is not None else {}
+
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.field_index = {field: i for i, field in enumerate(self.fields)}
+
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, ndays: int, names: Optional[Dict] = None,
+                   shared=False) -> 'SelectPanel':
+        """
+        :param df: 日线长表(code, trade_date, 数值字段...)
+        :param ndays: 每个代码保留最近的天数
+        :param names: code: name 字典
+        :param shared: 是否放入共享内存
+        """
+        df = df.sort_values(['code', 'trade_date'], ascending=[True, False])
+        code_index, codes = pd.factorize(df['code'], sort=True)
+        lag = df.groupby('code', sort=False).cumcount().values
+        keep = lag < ndays
+        code_index, lag = code_index[keep], lag[keep]
+
+        fields = [col for col in df.columns
+                  if col not in ('code', 'name', 'trade_date') and pd.api.types.is_numeric_dtype(df[col])]
+        shape = (len(fields), ndays, len(codes))
+        shm = None
+        if shared:
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+            data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        else:
+            data = np.empty(shape, dtype=np.float64)
+        data.fill(np.nan)
+        data[:, lag, code_index] = df[fields].values[keep].astype(np.float64).T
+
+        trade_date = np.full((ndays, len(codes)), np.datetime64('NaT'), dtype='datetime64[ns]')
+        trade_date[lag, code_index] = df['trade_date'].values[keep]
+
+        count = np.bincount(code_index, minlength=len(codes))
+
+        if names is None and 'name' in df.columns:
+            names = dict(zip(df['code'], df['name']))
+
+        return cls(data=data, trade_date=trade_date, count=count, codes=codes, fields=fields, names=names,
+                   shm=shm, owner=shared)
+
+    def meta(self) -> Dict:
+        """
+        可pickle的描述，传给子进程attach
+        """
+        if self.shm is None:
+            raise Exception('panel is not in shared memory')
+        return dict(name=self.shm.name, shape=self.data.shape, trade_date=self.trade_date, count=self.count,
+                    codes=self.codes, fields=self.fields, names=self.names)
+
+    @classmethod
+    def attach(cls, meta: Dict) -> 'SelectPanel':
+        shm = shared_memory.SharedMemory(name=meta['name'])
+        data = np.ndarray(meta['shape'], dtype=np.float64, buffer=shm.buf)
+        return cls(data=data, trade_date=meta['trade_date'], count=meta['count'], codes=meta['codes'],
+                   fields=meta['fields'], names=meta['names'], shm=shm, owner=False)
+
+    @property
+    def ndays(self) -> int:
+        return self.data.shape[1]
+
+    def field(self, field: str) -> np.ndarray:
+        """
+        :return: days x codes 视图, 第0行为最近交易日
+        """
+        return self.data[self.field_index[field]]
+
+    def valid(self, min_days: Optional[int] = None) -> np.ndarray:
+        """
+        :return: 天数足够的代码
+        """
+        return self.count >= (self.ndays if min_days is None else min_days)
+
+    def code(self, code: str) -> Optional[pd.DataFrame]:
+        """
+        :return: 单个代码的日线, 同load_kdata按时间倒序
+        """
+        if code not in self.code_index:
+            return None
+        i = self.code_index[code]
+        n = self.count[i]
+        df = pd.DataFrame(self.data[:, :n, i].T, columns=self.fields)
+        df.insert(0, 'trade_date', self.trade_date[:n, i])
+        df.insert(0, 'name', self.names[code] if code in self.names else None)
+        df.insert(0, 'code', code)
+        return df
+
+    def take(self, data: np.ndarray, index: np.ndarray) -> np.ndarray:
+        """
+        每个代码取第index[code]行
+        :param data: days x codes
+        :param index: 每个代码的行号
+        """
+        index = np.clip(index, 0, self.ndays - 1)
+        return np.take_along_axis(data, index[None, :], axis=0)[0]
+
+    def result(self, mask: np.ndarray, **columns) -> Optional[pd.DataFrame]:
+        """
+        选中的代码生成结果表
+        :param mask: 选中的代码
+        :param columns: 每个代码一个值的数组
+        """
+        index = np.flatnonzero(mask)
+        if len(index) == 0:
+            return None
+        codes = [self.codes[i] for i in index]
+        data = dict(code=codes, name=[self.names[code] if code in self.names else None for code in codes])
+        for name, value in columns.items():
+            data[name] = np.asarray(value)[index]
+        return pd.DataFrame(data)
+
+    def close(self):
+        self.data = None
+        if self.shm is not None:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,11 +1,17 @@
 from winq.common import get_datetime
 import winq.log as log
 import pandas as pd
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
 import asyncio
+import multiprocessing
+import os
+import traceback
 from winq.selector.strategy.comm import normalize_date
+from winq.selector.panel import SelectPanel
+import winq.selector.kernels as kernels
 
 
 class Strategy:
@@ -18,12 +24,16 @@ class Strategy:
                  load_info=None,
                  fetch_daily=None,
                  fetch_info=None,
-                 min_hit_days=3
+                 min_hit_days=3,
+                 use_panel=False,
+                 processes=1
                  ):
         """
         :param db: winqdb
         :param test_end_date: 测试截止交易日，None为数据库中日期
         :param min_trade_days 最小交易天数
+        :param use_panel: 一次加载全部代码的日线面板, 策略实现test_panel时整体计算, 否则逐个test
+        :param processes: 逐个test的进程数, 1为当前进程, 0为cpu个数, 大于1时面板放入共享内存由进程池分片计算
         """
         self.log = log.get_logger(self.__class__.__name__)
         self.db = db
@@ -42,6 +52,11 @@ class Strategy:
 
         self.min_hit_days = min_hit_days
 
+        self.use_panel = use_panel
+        self.panel = None
+
+        self.processes = processes
+
         self.sort_by = None
         self.sort_reverse = True
 
@@ -72,6 +87,12 @@ class Strategy:
         if kwargs is not None and 'min_hit_days' in kwargs:
             self.min_hit_days = kwargs['min_hit_days']
 
+        if kwargs is not None and 'use_panel' in kwargs:
+            self.use_panel = kwargs['use_panel']
+
+        if kwargs is not None and 'processes' in kwargs:
+            self.processes = int(kwargs['processes'])
+
         if kwargs is not None and 'sort_by' in kwargs:
             self.sort_by = kwargs['sort_by']
 
@@ -100,10 +121,25 @@ class Strategy:
             filter=flter,
             projection=['code', 'name'])
 
-        size = len(codes)
+        size = len(codes) if codes is not None else 0
         if size == 0:
             return None
 
+        if self.processes != 1 and not self.has_test_panel():
+            return await self.select_process(codes=codes, with_progress=with_progress)
+
+        # 实现了test_panel的策略整体计算已经足够快, 不需要进程池
+        if self.use_panel or self.processes != 1:
+            return await self.select_panel(codes=codes, with_progress=with_progress)
+
+        return await self.select_codes(codes=codes, with_progress=with_progress)
+
+    async def select_codes(self, codes: pd.DataFrame, with_progress=True) -> Optional[pd.DataFrame]:
+        """
+        分批并发逐个代码test
+        """
+        size = len(codes)
+
         s, r = int(size / self.run_task_count), size % self.run_task_count
 
         q = asyncio.Queue()
@@ -128,6 +164,131 @@ class Strategy:
 
         return data
 
+    async def select_panel(self, codes: pd.DataFrame, with_progress=True) -> Optional[pd.DataFrame]:
+        """
+        加载全部代码的日线面板, 实现了test_panel的策略整体计算, 否则逐个test(load_kdata从面板读取)
+        """
+        self.panel = await self.load_panel(codes=codes)
+        if self.panel is None:
+            self.log.error('加载日线面板失败')
+            return None
+        try:
+            if self.has_test_panel():
+                return await self.test_panel(panel=self.panel)
+            return await self.select_codes(codes=codes, with_progress=with_progress)
+        finally:
+            self.panel = None
+
+    async def select_process(self, codes: pd.DataFrame, with_progress=True) -> Optional[pd.DataFrame]:
+        """
+        日线面板放入共享内存, 代码分片后由进程池逐个test, 结果在当前进程合并
+        """
+        self.panel = await self.load_panel(codes=codes, shared=True)
+        if self.panel is None:
+            self.log.error('加载日线面板失败')
+            return None
+
+        processes = self.processes if self.processes > 0 else os.cpu_count()
+        # 每个进程多个分片, 进度更平滑, 也避免个别分片拖慢整体
+        shard_count = min(len(codes), processes * 4)
+        shards = [codes[i::shard_count] for i in range(shard_count)]
+
+        loop = asyncio.get_event_loop()
+        meta = self.panel.meta()
+        state = self.worker_state()
+        ctx = multiprocessing.get_context('spawn')
+        try:
+            with ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+                async def _wait(shard, future):
+                    return shard, await future
+
+                tasks = [_wait(shard, loop.run_in_executor(pool, _select_worker, self.__class__, state, meta,
+                                                           shard.to_dict('records')))
+                         for shard in shards]
+
+                select = []
+                proc_bar = tqdm(total=len(codes)) if with_progress else None
+                for task in asyncio.as_completed(tasks):
+                    shard, (records, error) = await task
+                    if error is not None:
+                        self.log.error('选股进程异常: {}'.format(error))
+                    select = select + records
+                    if proc_bar is not None:
+                        item = shard.iloc[-1]
+                        proc_bar.set_description('处理 {}({})'.format(item['code'], item['name']))
+                        proc_bar.update(len(shard))
+                if proc_bar is not None:
+                    proc_bar.set_description('处理完成')
+                    proc_bar.close()
+        finally:
+            self.panel.close()
+            self.panel = None
+
+        return pd.DataFrame(select) if len(select) > 0 else None
+
+    def worker_state(self) -> Dict:
+        """
+        传给子进程的策略参数, 不包括数据库/加载函数等不能pickle的属性
+        """
+        return {key: value for key, value in vars(self).items()
+                if key not in ('log', 'db', 'panel') and not callable(value)}
+
+    async def load_panel(self, codes: pd.DataFrame, shared=False) -> Optional[SelectPanel]:
+        """
+        一次查询全部代码最近min_trade_days个交易日的日线
+        按自然日范围查询, 范围内不足min_trade_days条的代码(如长期停牌)再逐个按条数查询, 与load_kdata一致
+        """
+        end_date = self.test_end_date
+        # 交易日约为自然日的2/3, 多取节假日的余量
+        start_date = end_date - timedelta(days=int(self.min_trade_days * 1.5) + 30)
+        kdata = await self.load_daily(filter={'code': {'$in': list(codes['code'])},
+                                              'trade_date': {'$gte': start_date, '$lte': end_date}},
+                                      sort=[('trade_date', -1)])
+        if kdata is None:
+            kdata = pd.DataFrame()
+
+        count = kdata.groupby('code').size() if not kdata.empty else pd.Series(dtype=int)
+        short = [code for code in codes['code'] if code not in count.index or count[code] < self.min_trade_days]
+        if len(short) > 0:
+            frames = [kdata[~kdata['code'].isin(short)]] if not kdata.empty else []
+            for code in short:
+                data = await self.load_daily(filter={'code': code, 'trade_date': {'$lte': end_date}},
+                                             limit=self.min_trade_days, sort=[('trade_date', -1)])
+                if data is not None and not data.empty:
+                    frames.append(data)
+            kdata = pd.concat(frames) if len(frames) > 0 else pd.DataFrame()
+        if kdata.empty:
+            return None
+
+        now = datetime.now().date()
+        if self.with_rt_kdata and end_date.date() == now and self.fetch_daily is not None:
+            latest = kdata.groupby('code')['trade_date'].max()
+            bars_list = []
+            for code, db_latest in latest.items():
+                start = db_latest.date() + timedelta(days=1)
+                if start > now:
+                    continue
+                new_data = await self.fetch_daily(code=code, name=None, skip_rt=False, start=start, end=now)
+                bars = new_data['bars']
+                if bars is not None and len(bars) > 0:
+                    bars_list.append(bars)
+            if len(bars_list) > 0:
+                kdata = pd.concat(bars_list + [kdata])
+
+        names = dict(zip(codes['code'], codes['name']))
+        return SelectPanel.from_frame(kdata, ndays=self.min_trade_days, names=names, shared=shared)
+
+    def has_test_panel(self) -> bool:
+        return type(self).test_panel is not Strategy.test_panel
+
+    async def test_panel(self, panel: SelectPanel) -> Optional[pd.DataFrame]:
+        """
+        面板计算, 一次测试所有代码
+        :param panel: 全部代码最近min_trade_days个交易日的日线面板
+        :return: 同select
+        """
+        raise Exception('选股策略 {} 没实现面板测试函数'.format(self.__class__.__name__))
+
     async def test(self, code: str, name: str = None) -> Optional[pd.DataFrame]:
         """
         根据策略，测试股票是否符合策略
@@ -172,6 +333,14 @@ class Strategy:
         return data
 
     async def load_kdata(self, code, **kwargs):
+        if self.panel is not None and self.is_panel_query(**kwargs):
+            kdata = self.panel.code(code)
+            return kdata.head(kwargs['limit']) if kdata is not None else None
+
+        if self.load_daily is None:
+            self.log.error('没有日线加载函数, 查询不在面板中: {}'.format(kwargs))
+            return None
+
         kdata = await self.load_daily(**kwargs)
         now = datetime.now().date()
         test_end_date = self.test_end_date.date()
@@ -192,7 +361,15 @@ class Strategy:
 
         return kdata
 
-   
+    def is_panel_query(self, **kwargs) -> bool:
+        """
+        是否为面板已包含的查询: 截止test_end_date, 按时间倒序的最近不超过min_trade_days条
+        """
+        flter = kwargs['filter'] if 'filter' in kwargs else None
+        limit = kwargs['limit'] if 'limit' in kwargs else 0
+        sort = kwargs['sort'] if 'sort' in kwargs else None
+        return flter is not None and 'trade_date' in flter and flter['trade_date'] == {'$lte': self.test_end_date} and \
+            0 < limit <= self.panel.ndays and sort == [('trade_date', -1)]
 
     async def _do_select_task(self, q: asyncio.Queue, codes: pd.DataFrame) -> Optional[pd.DataFrame]:
         return await self.do_select(q=q, codes=codes)
@@ -264,24 +441,7 @@ class Strategy:
 
     @staticmethod
     def is_long_leg(df, ratio, side=None) -> bool:
-        close, high, low, open_ = df['close'], df['high'], df['low'], df['open']
-        if high == low:
-            return False
-        if side is None:
-            side = ['top', 'bottom']
-        if isinstance(side, str):
-            side = [side]
-        for s in side:
-            if s == 'top':
-                r = (high - close) * 100 / (high - low)
-                if r > ratio:
-                    return True
-            if s == 'bottom':
-                r = (open_ - low) * 100 / (high - low)
-                if r > ratio:
-                    return True
-
-        return False
+        return kernels.is_long_leg(df['open'], df['high'], df['low'], df['close'], ratio=ratio, side=side)
 
     @staticmethod
     def is_short_leg(df, ratio, side=None) -> bool:
@@ -289,21 +449,15 @@ class Strategy:
 
     @staticmethod
     def falling_down(df) -> float:
-        last_close, high, chg_pct = df['close'] / \
-            (1.0 + df['chg_pct']/100), df['high'],  df['chg_pct']
-
-        high_chg_pct = (high - last_close) * 100 / last_close
-
-        return high_chg_pct - chg_pct
+        return kernels.falling_down(df['high'], df['close'], df['chg_pct'])
     
     @staticmethod
     def is_red(df) -> bool:
-        return df['close'] >= df['open']
+        return kernels.is_red(df['open'], df['close'])
     
     @staticmethod
     def is_20cm(code) -> bool:
-        prefix = code[:4]
-        return prefix == 'sh68' or prefix == 'sz30'
+        return kernels.is_20cm(code)
     
     @staticmethod
     def cal_gaps(kdata: pd.DataFrame) -> pd.DataFrame:
@@ -313,38 +467,33 @@ class Strategy:
             kdata (pd.DataFrame): 降序
 
         Returns:
-            pd.DataFrame: 
+            pd.DataFrame: 增加 gap_pct, is_gap_fill
         """
-        kdata['gap_pct'] = 0.0
-        kdata['is_gap_fill'] = False
-        
-        prev_low, prev_high = 0, 0
-        max, min = -99999999.0, 99999999.0
-        for i in range(len(kdata)):
-            data = kdata.iloc[i]
-            low, high = data['low'], data['high']
-            
-            if prev_high != 0 and prev_low != 0:
-                 # 下跌缺口
-                if prev_high < low:
-                    # 以low为基准，计算缺口百分比
-                    gap_pct = round((prev_high - low) / low *100, 2)
-                    kdata.loc[i, 'gap_pct'] = gap_pct
-                    if max >= low:
-                        kdata.loc[i, 'is_gap_fill'] = True
-                
-                # 上升缺口
-                if prev_low > high:
-                    # 以high为基准，计算缺口百分比
-                    gap_pct = round((prev_low - high) / high *100, 2)
-                    kdata.loc[i, 'gap_pct'] = gap_pct
-                    if min <= high:
-                        kdata.loc[i, 'is_gap_fill'] = True
-                        
-            prev_low, prev_high = low, high
-            if low < min:
-                min = low
-            if high > max:
-                max = high
-                
-        return kdata
\ No newline at end of file
+        return kernels.cal_gaps(kdata)
+
+
+def _select_worker(cls, state: Dict, meta: Dict, codes: List[Dict], log_level: str = 'error'):
+    """
+    进程池中运行, 策略不连接数据库, 日线从共享内存面板读取
+    :return: (选中的记录, 异常信息)
+    """
+    log.setup_logger(level=log_level, reset=True)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    panel = SelectPanel.attach(meta)
+    try:
+        strategy = cls(db=None)
+        strategy.__dict__.update(state)
+        strategy.panel = panel
+        select = []
+        for item in codes:
+            got_data = loop.run_until_complete(strategy.test(code=item['code'], name=item['name']))
+            if got_data is not None:
+                select = select + got_data.to_dict('records')
+        return select, None
+    except Exception as e:
+        return [], '{}: {}'.format(e, traceback.format_exc())
+    finally:
+        panel.close()
+        loop.close()
@@ -1,6 +1,9 @@
 from typing import Optional
+import numpy as np
 import pandas as pd
+from winq.selector.panel import SelectPanel
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class EnlargeTrade(Strategy):
@@ -57,34 +60,41 @@ class EnlargeTrade(Strategy):
         if kdata is None or kdata.shape[0] < self.min_trade_days:
             return None
 
-        hit_days = 0
-        for i in range(len(kdata)):
-            df = kdata.iloc[i]
-            chg_pct, amt_chg_pct, vol_chg_pct = df['chg_pct'], df['amount_chg_pct'], df['volume_chg_pct']
-            if chg_pct >= self.min_chg and \
-                    amt_chg_pct >= self.min_amt_chg and \
-                vol_chg_pct >= self.min_vol_chg:
-                hit_days = hit_days + 1
-                continue
-            break
-
-        if hit_days < self.min_hit_days:
+        hit, data = self.match(close=kdata['close'].values, chg_pct=kdata['chg_pct'].values,
+                               amount_chg_pct=kdata['amount_chg_pct'].values,
+                               volume_chg_pct=kdata['volume_chg_pct'].values,
+                               trade_date=kdata['trade_date'].values)
+        if not hit:
             return None
+        return pd.DataFrame([dict(code=code, name=name, **data)])
 
-        data0 = kdata.iloc[0]
-        min_hit_close, n_close = kdata.iloc[self.min_hit_days]['close'], data0['close']
-        min_hit_up = round((n_close - min_hit_close) * 100 / min_hit_close, 2)
-
-        hit_data = kdata.iloc[hit_days-1]
-        hit_close = hit_data['close'] / (1+hit_data['chg_pct']/100.0)
-        hit_chg_pct = round(
-            (data0['close'] - hit_close)*100 / hit_close, 2)
-        got_data = dict(code=code, name=name,
-                        min_hit_close=min_hit_close, close=n_close, min_hit_chg_pct=min_hit_up,
-                        hit_start=hit_data['trade_date'],
-                        hit_chg_pct=hit_chg_pct,
-                        hit_days=hit_days)
-        return pd.DataFrame([got_data])
+    async def test_panel(self, panel: SelectPanel) -> Optional[pd.DataFrame]:
+        hit, data = self.match(close=panel.field('close'), chg_pct=panel.field('chg_pct'),
+                               amount_chg_pct=panel.field('amount_chg_pct'),
+                               volume_chg_pct=panel.field('volume_chg_pct'),
+                               trade_date=panel.trade_date)
+        return panel.result(hit & panel.valid(self.min_trade_days), **data)
+
+    def match(self, close, chg_pct, amount_chg_pct, volume_chg_pct, trade_date):
+        """
+        单个代码(一维)或面板(days x codes)同时计算
+        :return: (是否命中, 结果字段)
+        """
+        hit_days = kernels.leading_true((chg_pct >= self.min_chg) &
+                                        (amount_chg_pct >= self.min_amt_chg) &
+                                        (volume_chg_pct >= self.min_vol_chg))
+
+        min_hit_close, n_close = close[self.min_hit_days], close[0]
+        min_hit_up = np.round((n_close - min_hit_close) * 100 / min_hit_close, 2)
+
+        hit_data_close, hit_data_chg = kernels.take(close, hit_days - 1), kernels.take(chg_pct, hit_days - 1)
+        hit_close = hit_data_close / (1 + hit_data_chg / 100.0)
+        hit_chg_pct = np.round((n_close - hit_close) * 100 / hit_close, 2)
+        return hit_days >= self.min_hit_days, dict(min_hit_close=min_hit_close, close=n_close,
+                                                   min_hit_chg_pct=min_hit_up,
+                                                   hit_start=kernels.take(trade_date, hit_days - 1),
+                                                   hit_chg_pct=hit_chg_pct,
+                                                   hit_days=hit_days)
 
 
 if __name__ == '__main__':
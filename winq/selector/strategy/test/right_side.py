@@ -1,7 +1,10 @@
 from typing import Optional
+import numpy as np
 import pandas as pd
 import hiq_pyfetch as fetch
+from winq.selector.panel import SelectPanel
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class RightSide(Strategy):
@@ -80,56 +83,47 @@ class RightSide(Strategy):
         if kdata is None or kdata.shape[0] < self.min_trade_days:
             return None
 
-        data0 = kdata.iloc[0]
-        n_close = data0['close']
-
-        high_days = 0
-        high_days_break = False
-
-        hit_days = 0
-        hit_days_break = False
-        for i in range(len(kdata)):
-            df = kdata.iloc[i]
-            chg_pct, turnover, close = df['chg_pct'], df['turnover'], df['close']
-            falling_down = self.falling_down(df=df)
-            
-            if not high_days_break:
-                if n_close >= close:
-                    high_days = high_days + 1
-                else:
-                    high_days_break = True
-            
-            if not hit_days_break:
-                if self.max_down_in_rise <= chg_pct <= self.max_up_in_rise and \
-                        falling_down <= self.max_falling_down and \
-                        turnover <= self.max_turnover:
-                    hit_days = hit_days + 1
-                else:
-                    hit_days_break = True
-            
-            if high_days_break and hit_days_break:
-                break
-
-        if hit_days < self.min_hit_days or high_days < self.min_high_ndays:
+        hit, data = self.match(close=kdata['close'].values, chg_pct=kdata['chg_pct'].values,
+                               high=kdata['high'].values, turnover=kdata['turnover'].values,
+                               trade_date=kdata['trade_date'].values)
+        if not hit:
             return None
+        return pd.DataFrame([dict(code=code, name=name, **data)])
 
-        rn_close = kdata.iloc[self.test_recent_ndays]['close']
-        recent_ndays_up = round((n_close - rn_close) * 100 / rn_close, 2)
-        if recent_ndays_up >= self.test_recent_ndays_up:
-            hit_data = kdata.iloc[hit_days-1]
-            pre_close = hit_data['close'] / (1+hit_data['chg_pct']/100.0)
-            hit_chg_pct = round(
-                (data0['close'] - pre_close)*100 / pre_close, 2)
-            got_data = dict(code=code, name=name,
-                            nday_close=rn_close,
-                            close=n_close,
-                            nday_chg_pct=recent_ndays_up,
-                            hit_start=hit_data['trade_date'],
-                            hit_chg_pct=hit_chg_pct,
-                            hit_days=hit_days)
-            return pd.DataFrame([got_data])
-
-        return None
+    async def test_panel(self, panel: SelectPanel) -> Optional[pd.DataFrame]:
+        hit, data = self.match(close=panel.field('close'), chg_pct=panel.field('chg_pct'),
+                               high=panel.field('high'), turnover=panel.field('turnover'),
+                               trade_date=panel.trade_date)
+        return panel.result(hit & panel.valid(self.min_trade_days), **data)
+
+    def match(self, close, chg_pct, high, turnover, trade_date):
+        """
+        单个代码(一维)或面板(days x codes)同时计算
+        :return: (是否命中, 结果字段)
+        """
+        n_close = close[0]
+
+        high_days = kernels.leading_true(n_close >= close)
+        falling_down = kernels.falling_down(high, close, chg_pct)
+        hit_days = kernels.leading_true((self.max_down_in_rise <= chg_pct) & (chg_pct <= self.max_up_in_rise) &
+                                        (falling_down <= self.max_falling_down) &
+                                        (turnover <= self.max_turnover))
+
+        rn_close = close[self.test_recent_ndays]
+        recent_ndays_up = np.round((n_close - rn_close) * 100 / rn_close, 2)
+
+        hit_close, hit_chg = kernels.take(close, hit_days - 1), kernels.take(chg_pct, hit_days - 1)
+        pre_close = hit_close / (1 + hit_chg / 100.0)
+        hit_chg_pct = np.round((n_close - pre_close) * 100 / pre_close, 2)
+
+        hit = (hit_days >= self.min_hit_days) & (high_days >= self.min_high_ndays) & \
+            (recent_ndays_up >= self.test_recent_ndays_up)
+        return hit, dict(nday_close=rn_close,
+                         close=n_close,
+                         nday_chg_pct=recent_ndays_up,
+                         hit_start=kernels.take(trade_date, hit_days - 1),
+                         hit_chg_pct=hit_chg_pct,
+                         hit_days=hit_days)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,11 @@
 from typing import Optional
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import hiq_pyfetch as fetch
+from winq.selector.panel import SelectPanel
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class SuperFalling(Strategy):
@@ -83,65 +86,55 @@ class SuperFalling(Strategy):
         if kdata is None or kdata.shape[0] < self.min_trade_days:
             return None
         
-        data0 = kdata.iloc[0]
-        data0_chg_pct = data0['chg_pct']
-        if data0_chg_pct >= self.max_first_day_rise or \
-                data0_chg_pct <= self.max_first_day_down:
+        hit, data = self.match(open_=kdata['open'].values, high=kdata['high'].values, low=kdata['low'].values,
+                               close=kdata['close'].values, chg_pct=kdata['chg_pct'].values,
+                               turnover=kdata['turnover'].values)
+        if not hit:
             return None
+        return pd.DataFrame([dict(code=code, name=name, **data)])
 
-        data0_close = data0['close']
-        max_index = 0
-        for i in range(self.max_meet_high_days):
-            max_close = kdata.iloc[max_index]['close']
-            cur = kdata.iloc[i]
-            cur_close, cur_turnover = cur['close'], cur['turnover']
-            if cur_close > max_close:
-                max_index = i
-            if cur_turnover > self.max_turnover:
-                return None
-
-        if max_index == 0:
-            return None
-
-        max_close = kdata.iloc[max_index]['close']
-        high_falling_down = round(
-            (data0_close - max_close) / max_close * 100, 2)
-        falling_down_abs = abs(high_falling_down)
-        if falling_down_abs < self.min_high_falling or falling_down_abs > self.max_high_falling:
-            return None
-
-        rise_index = max_index
-        for i in range(max_index, self.min_trade_days):
-            df = kdata.iloc[i]
-            close, chg_pct, turnover = df['close'], df['chg_pct'], df['turnover']
-            if turnover > self.max_turnover:
-                return None
-            if (self.is_red(df) or chg_pct > self.max_down_as_rise) and max_close >= close:
-                rise_index = i
-                continue
-            break
-        if rise_index == max_index:
-            return None
-
-        rise_close = kdata.iloc[rise_index]['close']
-        high_rise = abs((max_close - rise_close) / rise_close * 100)
-        if high_rise < self.min_rise_to_high_ndays:
-            return None
-        
-        # 耗时操作
-        kdata = self.cal_gaps(kdata=kdata)
-        
-        gap_kdata = kdata[(kdata['gap_pct'] > self.max_rise_unfill_gaps) & (kdata['is_gap_fill'] == False)]
-        if len(gap_kdata) > 0:
-            return None
+    async def test_panel(self, panel: SelectPanel) -> Optional[pd.DataFrame]:
+        hit, data = self.match(open_=panel.field('open'), high=panel.field('high'), low=panel.field('low'),
+                               close=panel.field('close'), chg_pct=panel.field('chg_pct'),
+                               turnover=panel.field('turnover'))
+        return panel.result(hit & panel.valid(self.min_trade_days), **data)
 
-        got_data = dict(code=code, name=name,
-                        chg_pct=data0_chg_pct,
-                        high_falling_days=max_index,
-                        high_falling_down=high_falling_down,
-                        high_rise_days=rise_index - max_index,
-                        high_rise=high_rise)
-        return pd.DataFrame([got_data])
+    def match(self, open_, high, low, close, chg_pct, turnover):
+        """
+        单个代码(一维)或面板(days x codes)同时计算
+        :return: (是否命中, 结果字段)
+        """
+        data0_chg_pct = chg_pct[0]
+        hit = (data0_chg_pct < self.max_first_day_rise) & (data0_chg_pct > self.max_first_day_down)
+
+        # max_meet_high_days 内的最高点, 期间换手不能过大
+        max_close, max_index = kernels.extreme_since(close, end=self.max_meet_high_days)
+        top_turnover, _ = kernels.extreme_since(turnover, end=self.max_meet_high_days)
+        hit = hit & (max_index != 0) & np.logical_not(top_turnover > self.max_turnover)
+
+        high_falling_down = np.round((close[0] - max_close) / max_close * 100, 2)
+        falling_down_abs = np.abs(high_falling_down)
+        hit = hit & (falling_down_abs >= self.min_high_falling) & (falling_down_abs <= self.max_high_falling)
+
+        # 最高点之前连续上涨(红盘或跌幅不大, 且不高于最高点), 包括中断的那天换手都不能过大
+        is_rise = (kernels.is_red(open_, close) | (chg_pct > self.max_down_as_rise)) & (max_close >= close)
+        rise_days = kernels.leading_true(is_rise, start=max_index)
+        rise_index = max_index + np.maximum(rise_days - 1, 0)
+        rise_turnover, _ = kernels.extreme_since(turnover, start=max_index, end=max_index + rise_days + 1)
+        hit = hit & (rise_days > 1) & np.logical_not(rise_turnover > self.max_turnover)
+
+        rise_close = kernels.take(close, rise_index)
+        high_rise = np.abs((max_close - rise_close) / rise_close * 100)
+        hit = hit & (high_rise >= self.min_rise_to_high_ndays)
+
+        gap_pct, is_gap_fill = kernels.gaps(high, low)
+        hit = hit & np.logical_not(((gap_pct > self.max_rise_unfill_gaps) & ~is_gap_fill).any(axis=0))
+
+        return hit, dict(chg_pct=data0_chg_pct,
+                         high_falling_days=max_index,
+                         high_falling_down=high_falling_down,
+                         high_rise_days=rise_index - max_index,
+                         high_rise=high_rise)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,9 @@
 import talib
-from typing import Optional
+from typing import Optional, Tuple
 import pandas as pd
 import numpy as np
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class AntClimbTree(Strategy):
@@ -80,47 +81,53 @@ class AntClimbTree(Strategy):
             kdata[self.ma_numbers_tag[i]] = talib.MA(kdata['close'], timeperiod=v)
         kdata = kdata[::-1]
 
-        fit_days = 0
-        ma0_idx, ma2_idx = -1, -1
-        for i in range(kdata.shape[0]):
-            df = kdata.iloc[i]
-            close, rise, ma0, ma2 = df['close'], df['rise'], df[self.ma_numbers_tag[0]], df[self.ma_numbers_tag[2]]
-            if np.isnan(ma0) or np.isnan(ma2):
-                break
-            if close > ma2 and close > ma0 and 0 <= rise <= self.max_climb_up:
-                if ma2_idx == -1:
-                    i_next = i + 1
-                    if i_next >= kdata.shape[0]:
-                        break
-                    df = kdata.iloc[i_next]
-                    close, rise, ma0, ma2 = df['close'], df['rise'], df[self.ma_numbers_tag[0]], df[
-                        self.ma_numbers_tag[2]]
-                    if ma2 < close and close > ma0 and 0 <= rise <= self.max_climb_up:
-                        ma2_idx = i
-                    continue
-            else:
-                if ma2_idx != -1:
-                    if close < ma2 and close < ma0 and 0 <= rise <= self.max_climb_up:
-                        ma0_idx = i
-                        continue
-                ma2_idx = -1
-
-            if ma2_idx != -1 and ma0_idx != -1:
-                break
-
-        if ma2_idx != -1 and ma0_idx != -1:
-            if ma0_idx - ma2_idx >= self.min_climb_days:
-                if ma2_idx < self.max_shock_days:
-                    return None
-
-                name = await self.code_name(code=code, name=name)
-                got_data = dict(code=code, name=name,
-                                m0=kdata.iloc[ma0_idx]['trade_date'], m2=kdata.iloc[ma2_idx]['trade_date'],
-                                )
-                return pd.DataFrame([got_data])
+        index = self.match(close=kdata['close'].values, rise=kdata['rise'].values,
+                           ma0=kdata[self.ma_numbers_tag[0]].values, ma2=kdata[self.ma_numbers_tag[2]].values)
+        if index is None:
+            return None
+
+        ma2_idx, ma0_idx = index
+        if ma0_idx - ma2_idx >= self.min_climb_days:
+            if ma2_idx < self.max_shock_days:
+                return None
+
+            name = await self.code_name(code=code, name=name)
+            got_data = dict(code=code, name=name,
+                            m0=kdata.iloc[ma0_idx]['trade_date'], m2=kdata.iloc[ma2_idx]['trade_date'],
+                            )
+            return pd.DataFrame([got_data])
 
         return None
 
+    def match(self, close, rise, ma0, ma2) -> Optional[Tuple[int, int]]:
+        """
+        单个代码(一维), 从最近交易日往前, 均线有数据的范围内:
+        第一段至少连续两天站上均线的小阳线(最新一天为ma2_idx), 紧接着(更早)一段均线下方的小阳线(最早一天为ma0_idx),
+        再之前一天在均线上方或没有数据. 站上均线后接着的不是均线下方的小阳线, 则继续找下一段
+        :return: (ma2_idx, ma0_idx), 不符合为None
+        """
+        days = kernels.leading_true(np.logical_not(np.isnan(ma0) | np.isnan(ma2)))
+        inside = np.arange(close.shape[0]) < days
+        small = (0 <= rise) & (rise <= self.max_climb_up)
+        above = inside & (close > ma2) & (close > ma0) & small
+        below = inside & (close < ma2) & (close < ma0) & small
+
+        # 连续站上均线区间的最新一天, 及区间之前(更早)的第一天
+        start = above & np.append(above[1:], False) & ~np.insert(above[:-1], 0, False)
+        end = kernels.next_false(above)
+        below_end = below[np.minimum(end, close.shape[0] - 1)] & (end < days)
+        index = np.flatnonzero(start & ((end >= days) | below_end))
+        if len(index) == 0:
+            return None
+
+        ma2_idx = int(index[0])
+        start_below = int(end[ma2_idx])
+        if start_below >= days:
+            return None
+        ma0_idx = start_below + kernels.leading_true(below, start=start_below) - 1
+        if ma0_idx + 1 < days and not above[ma0_idx + 1]:
+            return None
+        return ma2_idx, ma0_idx
 
 if __name__ == '__main__':
     from winq import *
@@ -1,6 +1,8 @@
 from typing import Optional
+import numpy as np
 import pandas as pd
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class RiseShock(Strategy):
@@ -78,49 +80,42 @@ class RiseShock(Strategy):
         if kdata is None or kdata.shape[0] < self.min_trade_days:
             return None
 
-        fit_days = 0
-        fit_start_index = -1
-        shock_rise = 0
-        pre_rise = 0
-        for i in range(kdata.shape[0]):
-            df = kdata.iloc[i]
-            rise = df['rise']
-            if abs(rise) <= self.max_shock_day_ratio:
-                fit_days = fit_days + 1
-                continue
-            if fit_days > 0 and fit_start_index == -1:
-                if rise >= self.min_rise_last_day:
-                    fit_start_index = i
-                    pre_rise = rise
-                    shock_rise = abs(round((df['close'] - kdata.iloc[0]['close'])*100/kdata.iloc[0]['close'], 2))
-            break
-
-        if fit_start_index == -1 or fit_days > self.max_shock_days or shock_rise > self.max_shock_ratio:
-            return None
-
-        test_data = kdata[fit_days:]
-        cont_rise_days = 0
-        acct_rise = 0
-        for i in range(test_data.shape[0]):
-            rise = test_data.iloc[i]['rise']
-            if rise <= 0:
-                break
-            if self.is_con_rise and rise > pre_rise:
-                break
-            cont_rise_days = cont_rise_days + 1
-            acct_rise = acct_rise + rise
-            pre_rise = rise
-
-        if cont_rise_days < self.min_rise_days or acct_rise < self.min_acct_rise:
+        hit, data = self.match(close=kdata['close'].values, rise=kdata['rise'].values,
+                               trade_date=kdata['trade_date'].values)
+        if not hit:
             return None
 
         name = await self.code_name(code=code, name=name)
-        got_data = dict(code=code, name=name,
-                        close=kdata.iloc[0]['close'], shock_start=kdata.iloc[fit_days]['trade_date'],
-                        shock_days=fit_days, shock_rise=shock_rise,
-                        rise_days=cont_rise_days, acct_rise=acct_rise)
-        return pd.DataFrame([got_data])
+        return pd.DataFrame([dict(code=code, name=name, **data)])
 
+    def match(self, close, rise, trade_date):
+        """
+        单个代码(一维)或面板(days x codes)同时计算
+        :return: (是否命中, 结果字段)
+        """
+        n_close = close[0]
+
+        # 最近连续水平震荡的天数, 震荡开始前一日上涨足够多
+        fit_days = kernels.leading_true(np.abs(rise) <= self.max_shock_day_ratio)
+        pre_rise = kernels.take(rise, fit_days)
+        shock_rise = np.abs(np.round((kernels.take(close, fit_days) - n_close) * 100 / n_close, 2))
+        hit = (fit_days > 0) & (fit_days < close.shape[0]) & (pre_rise >= self.min_rise_last_day)
+        hit = hit & (fit_days <= self.max_shock_days) & np.logical_not(shock_rise > self.max_shock_ratio)
+
+        # 震荡开始前连续上涨, is_con_rise时越早的涨幅越小
+        is_rise = np.logical_not(rise <= 0)
+        if self.is_con_rise:
+            is_rise = is_rise & np.logical_not(rise > np.roll(rise, 1, axis=0))
+        rise_days = np.logical_not(pre_rise <= 0) * (1 + kernels.leading_true(is_rise, start=fit_days + 1))
+        acct_rise = kernels.sum_since(rise, start=fit_days, end=fit_days + rise_days)
+        hit = hit & np.logical_not(rise_days < self.min_rise_days) & np.logical_not(acct_rise < self.min_acct_rise)
+
+        return hit, dict(close=n_close,
+                         shock_start=kernels.take(trade_date, fit_days),
+                         shock_days=fit_days,
+                         shock_rise=shock_rise,
+                         rise_days=rise_days,
+                         acct_rise=acct_rise)
 
 if __name__ == '__main__':
     from winq import *
@@ -1,6 +1,7 @@
 from typing import Optional
 import pandas as pd
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class RiseStop(Strategy):
@@ -10,8 +11,8 @@ class RiseStop(Strategy):
 
     def __init__(self, db, *, test_end_date=None):
         super().__init__(db, test_end_date=test_end_date)
-        self.min_stop_rise = 9
-        self.min_cy_stop_rise = 19
+        self.min_stop_rise = None
+        self.min_cy_stop_rise = None
         self.min_high_rise = 8
         self.min_close_rise = 0.5
 
@@ -21,8 +22,8 @@ class RiseStop(Strategy):
                '  说明: 选择涨停开板选股股票\n' + \
                '  参数: min_high_rise -- 涨停次日至少最大上涨百分比(默认: 9)\n' + \
                '        min_close_rise -- 收盘上涨百分比(默认: 0.5)\n' + \
-               '        min_stop_rise -- 非创业板视为涨停百分比(默认: 9)\n' + \
-               '        min_cy_stop_rise -- 创业板收盘上涨百分比(默认: 19)'
+               '        min_stop_rise -- 非创业板视为涨停百分比(默认: None, 按涨停价判断)\n' + \
+               '        min_cy_stop_rise -- 创业板视为涨停百分比(默认: None, 按涨停价判断)'
 
     async def prepare(self, **kwargs):
         """
@@ -58,26 +59,20 @@ class RiseStop(Strategy):
         if kdata is None or kdata.shape[0] < self.min_trade_days:
             return None
 
-        stop_days, high_rise = 0, 0
-        for index, df in enumerate(kdata.to_dict('records')):
-            rise = df['rise']
-            if index == 0:
-                last_close = df['close'] - df['diff']
-                high_rise = ((df['high'] - last_close) * 100) / last_close
-                if high_rise < self.min_high_rise:
-                    return None
-                if rise < self.min_close_rise:
-                    return None
-                if rise >= self.min_high_rise:
-                    return None
-            else:
-                min_stop_rise = self.min_cy_stop_rise if code.startswith('sh688') or code.startswith(
-                    'sz30') else self.min_stop_rise
-                if rise >= min_stop_rise:
-                    stop_days = stop_days + 1
-                    continue
-                break
+        data0 = kdata.iloc[0]
+        last_close = data0['close'] - data0['diff']
+        high_rise = ((data0['high'] - last_close) * 100) / last_close
+        if high_rise < self.min_high_rise or \
+                data0['rise'] < self.min_close_rise or data0['rise'] >= self.min_high_rise:
+            return None
 
+        min_stop_rise = self.min_cy_stop_rise if self.is_20cm(code) else self.min_stop_rise
+        if min_stop_rise is None:
+            close = kdata['close'].values
+            is_stop = kernels.is_limit_up(close, None, kernels.limit_rate(code), last_close=close - kdata['diff'].values)
+        else:
+            is_stop = kdata['rise'].values >= min_stop_rise
+        stop_days = kernels.leading_true(is_stop, start=1)
         if stop_days <= 0:
             return None
 
@@ -1,6 +1,7 @@
 from typing import Optional
 import pandas as pd
 from winq.selector.strategy.strategy import Strategy
+import winq.selector.kernels as kernels
 
 
 class ZCode(Strategy):
@@ -78,46 +79,19 @@ class ZCode(Strategy):
         if kdata is None or kdata.shape[0] < self.min_trade_days:
             return None
 
-        test_data = kdata
-        right_fit_days = 0
-        fit_start_index = -1
-        for i in range(test_data.shape[0]):
-            df = test_data.iloc[i]
-            rise = df['rise']
-            if abs(rise) <= self.max_horizon_shock:
-                right_fit_days = right_fit_days + 1
-                continue
-            if right_fit_days > 0 and fit_start_index == -1:
-                if rise >= self.min_rise_up:
-                    fit_start_index = i
-            break
-
-        if fit_start_index == -1 or right_fit_days > self.right_horizon_days:
+        rise = kdata['rise'].values
+        is_shock = abs(rise) <= self.max_horizon_shock
+        right_fit_days = kernels.leading_true(is_shock)
+        if right_fit_days == 0 or right_fit_days >= len(rise) or \
+                rise[right_fit_days] < self.min_rise_up or right_fit_days > self.right_horizon_days:
             return None
 
-        test_data = kdata[right_fit_days:]
-        cont_rise_days = 0
-        acct_rise = 0
-        for i in range(test_data.shape[0]):
-            rise = test_data.iloc[i]['rise']
-            if rise <= 0:
-                break
-            cont_rise_days = cont_rise_days + 1
-            acct_rise = acct_rise + rise
-
+        cont_rise_days = kernels.leading_true(rise > 0, start=right_fit_days)
+        acct_rise = rise[right_fit_days:right_fit_days + cont_rise_days].sum()
         if cont_rise_days < self.min_rise_days or acct_rise < self.min_acct_rise:
             return None
 
-        test_data = test_data[cont_rise_days:]
-        left_fit_days = 0
-        for i in range(test_data.shape[0]):
-            df = test_data.iloc[i]
-            rise = df['rise']
-            if abs(rise) <= self.max_horizon_shock:
-                left_fit_days = left_fit_days + 1
-                continue
-            break
-
+        left_fit_days = kernels.leading_true(is_shock, start=right_fit_days + cont_rise_days)
         if left_fit_days < self.left_horizon_days:
             return None
 
@@ -7,4 +7,7 @@ from winq.trade.strategy_info import StrategyInfo
 from winq.trade.trade_signal import TradeSignal
 from winq.trade.tradedb import TradeDB
 from winq.trade.trader import Trader
+from winq.trade.multi_trader import MultiTrader
 from winq.trade.report.report import Report
+from winq.trade.vector_backtest import VectorBacktest
+from winq.trade.fees import vector_fee
@@ -8,9 +8,16 @@ from winq.trade.entrust import Entrust
 from typing import Dict, Optional, Tuple, List
 from winq.trade.position import Position
 from winq.trade.deal import Deal
+from winq.trade.trade_signal import TradeSignal, BatchSignal
+from winq.trade.recorder import Recorder
+from winq.trade.trade_mapper import TradeMapper
+from winq.trade.journal import Journal
 from datetime import datetime
-import copy
+import time
+import numpy as np
 import winq.trade.consts as consts
+import winq.trade.fees as fees
+import winq.monitor as monitor
 
 
 class Account(BaseObj):
@@ -51,15 +58,31 @@ class Account(BaseObj):
         self.position = {}
         self.entrust = {}
 
+        # 索引: 可卖持仓 code->position, 活动委托 code->{entrust_id: entrust} / status->{entrust_id: entrust},
+        # 委托冻结资金 entrust_id->cash
+        self.position_available = {}
+        self.active_entrust = {}
+        self.active_status = {}
+        self.active_index = {}
+        self.frozen_cash = {}
+        # 委托已记账的成交量 entrust_id->volume, 同一委托多次部分成交时计算本次成交量
+        self.entrust_dealt = {}
+
         self.broker = None
         self.strategy = None
         self.risk = None
 
-        # 成交 backtest
-        self.deal = []
-        self.signal = []
+        # 信号/成交/每日快照 backtest
+        self.recorder = Recorder(account_id=account_id)
+
+        # 信号/委托/成交/持仓 持久化
+        self.mapper = TradeMapper(account=self)
 
-        self.acct_his = []
+        # 持久化脏数据(实盘), 按sync_interval秒合并写库
+        self.dirty = False
+        self.dirty_position = {}
+        self.sync_interval = 3
+        self.sync_time = 0
 
     async def sync_acct_from_db(self) -> Optional[Dict]:
         data = await self.db_trade.load_account(filter={'account_id': self.account_id, 'status': 0, 'type': self.typ},
@@ -69,6 +92,10 @@ class Account(BaseObj):
             return None
 
         account = data[0]
+        self.load_acct(account)
+        return account
+
+    def load_acct(self, account: Dict):
         self.account_id = account['account_id']
         self.category = account['category']
         self.cash_init = account['cash_init']
@@ -83,8 +110,6 @@ class Account(BaseObj):
         self.start_time = account['start_time']
         self.end_time = account['end_time']
 
-        return account
-
     async def sync_strategy_from_db(self) -> bool:
         data = await self.db_trade.load_strategy(filter={'account_id': self.account_id},
                                                  limit=1)
@@ -131,39 +156,76 @@ class Account(BaseObj):
         return True
 
     async def sync_entrust_from_db(self) -> bool:
-        now = datetime.now()
-        trade_date = datetime(year=now.year, month=now.month, day=now.day)
         entrusts = await self.db_trade.load_entrust(
             filter={'account_id': self.account_id,
-                    '$or': [{'status': 'init'}, {'status': 'commit'}, {'status': 'part_deal'}],
-                    'time': {'$gte': trade_date}})
-        for entrust_dict in entrusts:
-            entrust = Entrust(entrust_id=entrust_dict['entrust_id'], account=self)
-            entrust.from_dict(entrust_dict)
-            self.entrust[entrust.entrust_id] = entrust
+                    '$or': [{'status': 'init'}, {'status': 'commit'}, {'status': 'part_deal'}]})
+        return await self.load_entrust(entrusts)
 
-        entrusts = await self.db_trade.load_entrust(
-            filter={'account_id': self.account_id,
-                    '$or': [{'status': 'init'}, {'status': 'commit'}, {'status': 'part_deal'}],
-                    'time': {'$lt': trade_date}})
+    async def load_entrust(self, entrusts: List[Dict]) -> bool:
+        """
+        恢复未完成委托, 当日之前的委托置为已撤
+        """
+        now = datetime.now()
+        trade_date = datetime(year=now.year, month=now.month, day=now.day)
         for entrust_dict in entrusts:
             entrust = Entrust(entrust_id=entrust_dict['entrust_id'], account=self)
             entrust.from_dict(entrust_dict)
-            entrust.status = entrust.stat_cancel
-            await entrust.sync_to_db()
+            if entrust.time is None or entrust.time < trade_date:
+                entrust.status = entrust.stat_cancel
+                await entrust.sync_to_db()
+                continue
+
+            self.entrust[entrust.entrust_id] = entrust
+            self.index_entrust(entrust)
+            if entrust.type == entrust.type_buy and entrust.entrust_id in self.active_index:
+                self.frozen_cash[entrust.entrust_id] = self.get_cost(
+                    typ=consts.act_buy, code=entrust.code, price=entrust.price,
+                    volume=entrust.volume - entrust.volume_deal - entrust.volume_cancel)
 
         return True
 
     async def sync_position_from_db(self) -> bool:
         positions = await self.db_trade.load_position(filter={'account_id': self.account_id})
+        self.load_position(positions)
+        return True
+
+    def load_position(self, positions: List[Dict]):
         for position in positions:
             pos = Position(position_id=position['position_id'], account=self)
             pos.from_dict(position)
             self.position[pos.code] = pos
+            self.index_position(pos)
 
-        return True
+    def open_journal(self, fresh=False) -> Optional[Dict]:
+        """
+        配置了trade.journal时打开账户事件日志
+        :return: 日志中恢复的状态, 未配置或没有已保存的账户时为None
+        """
+        trade_dict = self.trader.config['trade']
+        if self.trader.is_backtest() or 'journal' not in trade_dict:
+            return None
+        journal = Journal.from_config(account_id=self.account_id, writer=self.mapper.db_write,
+                                      opt=trade_dict['journal'])
+        if journal is None:
+            return None
+        self.mapper.journal = journal
+        return journal.open(fresh=fresh)
 
     async def sync_from_db(self) -> bool:
+        state = self.open_journal()
+        if state is not None:
+            # 从本地日志恢复, 只需从数据库加载策略
+            self.load_acct(state['account'])
+            if not await self.sync_strategy_from_db():
+                return False
+            self.load_position(list(state['position'].values()))
+            if not await self.load_entrust(list(state['entrust'].values())):
+                return False
+            self.log.info('account restored from journal, position={}, entrust={}'.format(
+                len(self.position), len(self.entrust)))
+            self.reset_account()
+            return True
+
         account = await self.sync_acct_from_db()
         if account is None:
             return False
@@ -177,33 +239,26 @@ class Account(BaseObj):
         if not await self.sync_entrust_from_db():
             return False
 
+        self.reset_account()
         return True
 
     @BaseObj.discard_saver
     async def sync_to_db(self) -> bool:
-        data = {'account_id': self.account_id, 'status': self.status,
-                'category': self.category, 'type': self.typ,
-                'cash_init': self.cash_init, 'cash_available': self.cash_available, 'cash_frozen': self.cash_frozen,
-                'total_net_value': self.total_net_value, 'total_hold_value': self.total_hold_value, 'cost': self.cost,
-                'broker_fee': self.broker_fee, "transfer_fee": self.transfer_fee, "tax_fee": self.tax_fee,
-                'profit': self.profit, 'profit_rate': self.profit_rate,
-                'close_profit': self.close_profit,
-                'total_profit': self.total_profit, 'total_profit_rate': self.total_profit_rate,
-                'start_time': self.start_time, 'end_time': self.end_time, 'update_time': datetime.now()}
-        await self.db_trade.save_account(data=data)
-        return True
+        return await self.mapper.save_account()
 
+    @monitor.timed('winq_account_handle_seconds', handler='on_quot')
     async def on_quot(self, evt, payload):
         # evt_start(backtest)
         # evt_morning_start evt_quotation evt_morning_end
         # evt_noon_start evt_quotation evt_noon_end
         # evt_end(backtest)
-        self.log.info(f'account on quot, event={evt}, payload={payload}')
+        self.log.debug('account on quot, event={}, payload={}', evt, payload)
         if evt == consts.evt_morning_start or evt == consts.evt_noon_start:
             self.is_trading = True
 
         if evt == consts.evt_morning_end or evt == consts.evt_noon_end:
             self.is_trading = False
+            await self.flush(force=True)
 
         if evt == consts.evt_noon_end:
             self.end_time = payload['day_time']
@@ -212,19 +267,24 @@ class Account(BaseObj):
                 if position.volume != position.volume_available:
                     position.volume_frozen = 0
                     position.volume_available = position.volume
+                    self.index_position(position)
                     await position.sync_to_db()
-            for entrust in self.entrust.values():
-                if entrust.status == entrust.stat_commit:
-                    entrust.status = entrust.stat_cancel
-                    await entrust.sync_to_db()
-            self.cash_available += self.cash_frozen
+            # 当日未完成的委托失效
+            for entrust in list(self.active_index_entrust()):
+                entrust.status = entrust.stat_cancel
+                self.unindex_entrust(entrust)
+                self.release_frozen(entrust.entrust_id)
+                await entrust.sync_to_db()
+            self.update_total()
             await self.sync_to_db()
 
             if not self.trader.is_backtest():
                 self.entrust.clear()
+            if self.mapper.journal is not None:
+                self.mapper.journal.compact()
 
             if self.trader.is_backtest():
-                self.acct_his.append(self.to_dict(skip_obj=True))
+                self.recorder.record_equity(self)
 
             await self.trader.daily_report()
 
@@ -234,6 +294,18 @@ class Account(BaseObj):
         if evt == consts.evt_quotation:
             await self.update_account(payload=payload)
 
+    @property
+    def acct_his(self) -> List[Dict]:
+        return self.recorder.records('equity')
+
+    @property
+    def deal(self) -> List[Dict]:
+        return self.recorder.records('deal')
+
+    @property
+    def signal(self) -> List[Dict]:
+        return self.recorder.records('signal')
+
     def get_position_volume(self, code) -> Tuple[int, int]:
         if code not in self.position:
             return 0, 0
@@ -242,49 +314,138 @@ class Account(BaseObj):
         return position.volume, position.volume_available
 
     def get_active_entrust(self, code) -> List[Entrust]:
-        entrust_list = []
-        for entrust in self.entrust.values():
-            if entrust.code == code:
-                entrust_list.append(entrust)
-        return entrust_list
+        if code not in self.active_entrust:
+            return []
+        return list(self.active_entrust[code].values())
+
+    def get_status_entrust(self, status) -> List[Entrust]:
+        if status not in self.active_status:
+            return []
+        return list(self.active_status[status].values())
+
+    def active_index_entrust(self):
+        for entrusts in self.active_entrust.values():
+            yield from entrusts.values()
+
+    def get_available_position(self) -> List[Position]:
+        return list(self.position_available.values())
+
+    def index_position(self, position):
+        if position.code in self.position and position.volume_available > 0:
+            self.position_available[position.code] = position
+        else:
+            self.position_available.pop(position.code, None)
+
+    def index_entrust(self, entrust):
+        """
+        委托状态变化后更新活动委托索引，已成/已撤/成交+撤销量等于委托量的委托移出索引
+        """
+        self.unindex_entrust(entrust)
+        if entrust.status == entrust.stat_deal or entrust.status == entrust.stat_cancel or \
+                entrust.volume_deal + entrust.volume_cancel >= entrust.volume:
+            return
+        self.active_entrust.setdefault(entrust.code, {})[entrust.entrust_id] = entrust
+        self.active_status.setdefault(entrust.status, {})[entrust.entrust_id] = entrust
+        self.active_index[entrust.entrust_id] = entrust.status
+
+    def unindex_entrust(self, entrust):
+        status = self.active_index.pop(entrust.entrust_id, None)
+        if status is None:
+            return
+        for index, key in ((self.active_entrust, entrust.code), (self.active_status, status)):
+            entrusts = index[key]
+            del entrusts[entrust.entrust_id]
+            if len(entrusts) == 0:
+                del index[key]
+
+    def release_frozen(self, entrust_id):
+        """
+        委托结束，剩余冻结资金转为可用
+        """
+        cash = self.frozen_cash.pop(entrust_id, 0)
+        if cash != 0:
+            self.cash_frozen = round(self.cash_frozen - cash, 2)
+            self.cash_available = round(self.cash_available + cash, 2)
 
     def get_fee(self, typ, code, price, volume) -> float:
-        total = price * volume
-        broker_fee = total * self.broker_fee
-        if broker_fee < 5:
-            broker_fee = 5
-        tax_fee = 0
-        if typ == consts.act_buy:
-            if code.startswith('sh6'):
-                tax_fee = total * self.transfer_fee
-        elif typ == consts.act_sell:
-            if code.startswith('sz') or code.startswith('sh'):
-                tax_fee = total * self.tax_fee
-        return round(broker_fee + tax_fee, 4)
+        return fees.fee(typ, code, price, volume,
+                        broker_fee=self.broker_fee, transfer_fee=self.transfer_fee, tax_fee=self.tax_fee)
 
     def get_cost(self, typ, code, price, volume) -> float:
         fee = self.get_fee(typ=typ, code=code, price=price, volume=volume)
         return round(fee + price * volume, 4)
 
-    async def update_account(self, payload):
+    def apply_position(self, position, sign=1):
+        """
+        增量更新账户持仓汇总
+        :param position: 持仓
+        :param sign: 1 加入, -1 扣除
+        """
+        self.profit = round(self.profit + sign * position.profit, 4)
+        self.total_hold_value = round(self.total_hold_value + sign * (position.now_price * position.volume), 4)
+        self.cost = round(self.cost + sign * (position.price * position.volume + position.fee), 4)
+
+    def reset_account(self):
+        """
+        全量重算持仓汇总，只在初始化时使用
+        """
         self.profit = 0
         self.cost = 0
         self.total_hold_value = 0
         for position in self.position.values():
-            if payload is not None and position.code in payload:
-                await position.on_quot(payload)
-            self.profit = self.profit + position.profit
-            self.total_hold_value = round(self.total_hold_value + (position.now_price * position.volume), 4)
-            self.cost = round(self.cost + (position.price * position.volume + position.fee), 4)
-        self.profit = round(self.profit, 4)
+            self.apply_position(position)
+        self.update_total()
 
+    def update_total(self):
         if self.cost > 0:
             self.profit_rate = round(self.profit / self.cost * 100, 4)
         self.total_net_value = self.cash_available + self.cash_frozen + self.total_hold_value
         self.total_profit = round(self.close_profit + self.profit, 4)
         self.total_profit_rate = round(self.total_profit / self.cash_init * 100, 4)
-        await self.sync_to_db()
+        self.dirty = True
 
+    def mark_position(self, position):
+        if not self.trader.is_backtest():
+            self.dirty_position[position.position_id] = position
+
+    async def flush(self, force=False) -> bool:
+        """
+        写入脏数据，force=False时按sync_interval合并
+        """
+        if self.trader.is_backtest():
+            self.dirty = False
+            return True
+
+        now = time.monotonic()
+        if not force and now - self.sync_time < self.sync_interval:
+            return True
+        self.sync_time = now
+
+        positions, self.dirty_position = self.dirty_position, {}
+        for position in positions.values():
+            if position.code in self.position:
+                await position.sync_to_db()
+        if self.dirty:
+            self.dirty = False
+            await self.sync_to_db()
+        return True
+
+    async def update_account(self, payload):
+        quots = payload['list'] if payload is not None and 'list' in payload else {}
+        for code, quot in quots.items():
+            if code not in self.position:
+                continue
+            position = self.position[code]
+            self.apply_position(position, -1)
+            await position.on_quot(quot)
+            self.update_position(position, time=quot['day_time'] if 'day_time' in quot else None)
+            self.apply_position(position)
+            self.mark_position(position)
+
+        self.update_total()
+        await self.flush()
+
+    @monitor.timed('winq_account_handle_seconds', handler='on_signal')
     async def on_signal(self, evt, payload):
         """
         payload.source  # 信号源: risk, strategy, broker, manual
@@ -293,19 +454,30 @@ class Account(BaseObj):
         :param payload:  TradeSignal / entrust_id
         :return:
         """
-        self.log.info('account on_signal: evt={}, signal={}'.format(evt, payload))
+        self.log.info('account on_signal: evt={}, signal={}', evt, payload)
         if not self.is_trading:
             self.log.info('is not on trading, omit signal')
             return
 
+        if evt == consts.evt_sig_batch:
+            await self.on_batch_signal(payload)
+            return
+
+        if evt == consts.evt_entrust_cancel or evt == consts.evt_sig_cancel:
+            entrust_id = payload if isinstance(payload, str) else payload.entrust_id
+            if entrust_id not in self.active_index:
+                self.log.warn('entrust not active, omit cancel, entrust_id={}'.format(entrust_id))
+                return
+            await self.emit('broker', consts.evt_entrust_cancel, self.entrust[entrust_id])
+            return
+
         sig = payload
-        await sig.sync_to_db()
-        if self.trader.is_backtest():
-            self.signal.append(sig.to_dict())
+        await self.save_signal(sig)
 
         if evt == consts.evt_sig_buy or evt == consts.evt_sig_sell:
             if sig.volume <= 0:
                 self.log.warn('invalid signal volume, volume={}, '.format(sig.volume))
+                return
 
             cost = 0
             if evt == consts.evt_sig_buy:
@@ -327,56 +499,189 @@ class Account(BaseObj):
                     self.log.error('signal not right, evt={}, signal={}'.format(evt, sig.signal))
                     return
 
-            entrust = Entrust(self.get_uuid(), self)
-            entrust.name = sig.name
-            entrust.code = sig.code
-            entrust.time = sig.time
-            entrust.broker_entrust_id = ''
-            entrust.type = sig.signal
-            entrust.status = entrust.stat_init
-            entrust.price = sig.price
-            entrust.volume = sig.volume
-            entrust.volume_deal = 0
-            entrust.volume_cancel = 0
-            entrust.signal = sig
-            entrust.desc = sig.desc
+            await self.entrust_signal(evt, sig, cost)
 
-            self.entrust[entrust.entrust_id] = entrust
-            await entrust.sync_to_db()
+    @monitor.timed('winq_account_handle_seconds', handler='on_signal_batch')
+    async def on_signal_batch(self, evt, payloads):
+        """
+        一批同类信号(信号队列队首连续的买信号)，按到达顺序一次校验资金，资金不足的信号丢弃
+        """
+        if evt != consts.evt_sig_buy:
+            for payload in payloads:
+                await self.on_signal(evt, payload)
+            return
 
-            evt_broker = None
-            if evt == consts.evt_sig_buy:
-                evt_broker = consts.evt_entrust_buy
-                self.cash_frozen += cost
-                self.cash_available -= cost
+        self.log.info('account on_signal batch: evt={}, count={}', evt, len(payloads))
+        if not self.is_trading:
+            self.log.info('is not on trading, omit signal')
+            return
 
-                await self.sync_to_db()
-            elif evt == consts.evt_sig_sell:
-                evt_broker = consts.evt_entrust_sell
-                position = self.position[sig.code]
-                position.volume_available -= sig.volume
-                position.volume_frozen += sig.volume
+        cash = self.cash_available
+        accepted = []
+        for sig in payloads:
+            await self.save_signal(sig)
+            if sig.volume <= 0 or sig.signal != sig.sig_buy:
+                self.log.warn('invalid buy signal, signal={}, volume={}'.format(sig.signal, sig.volume))
+                continue
+            cost = self.get_cost(typ=consts.act_buy, code=sig.code, price=sig.price, volume=sig.volume)
+            if cost > cash:
+                self.log.warn('not enough money to buy, code={}, cost={}, available={}'.format(sig.code, cost, cash))
+                continue
+            cash -= cost
+            accepted.append((sig, cost))
+
+        for sig, cost in accepted:
+            await self.entrust_signal(evt, sig, cost, sync=False)
+        if len(accepted) > 0:
+            await self.sync_to_db()
 
-                await position.sync_to_db()
-            if evt_broker is not None:
-                await self.emit('broker', evt_broker, entrust)
+    def target_signal(self, batch: BatchSignal) -> List[TradeSignal]:
+        """
+        目标持仓与当前持仓(含未完成委托)比较生成信号, 按手数取整, 卖出不超过可卖量, 清仓时卖出全部可卖量
+        """
+        sigs = []
+        for code, volume in batch.target.items():
+            position = self.position[code] if code in self.position else None
+            hold = position.volume if position is not None else 0
+            for entrust in self.get_active_entrust(code=code):
+                remain = entrust.volume - entrust.volume_deal - entrust.volume_cancel
+                hold += remain if entrust.type == entrust.type_buy else -remain
+
+            delta = volume - hold
+            if volume <= 0 and position is not None and delta < 0:
+                delta = -position.volume_available
+            elif abs(delta) >= 100:
+                delta = int(abs(delta) / 100) * 100 * (1 if delta > 0 else -1)
+            else:
+                continue
+            if delta < 0:
+                # 减仓不能超过可卖量(T+1)
+                delta = max(delta, -position.volume_available) if position is not None else 0
+            if delta == 0 or code not in batch.price:
+                continue
+
+            name = batch.name[code] if code in batch.name else (position.name if position is not None else '')
+            sig = TradeSignal(self.new_id(), self, source=batch.source, source_name=batch.source_name,
+                              code=code, name=name, price=batch.price[code], volume=abs(delta),
+                              time=batch.time, desc=batch.desc)
+            sig.signal = sig.sig_buy if delta > 0 else sig.sig_sell
+            sigs.append(sig)
+        return sigs
+
+    @monitor.timed('winq_account_handle_seconds', handler='on_batch_signal')
+    async def on_batch_signal(self, batch: BatchSignal):
+        """
+        批量信号: 卖在前买在后, 费用/资金一次数组计算, 生成的委托一次发给券商
+        买委托按顺序累计资金, 超出可用资金之后的买委托都拒绝
+        """
+        sigs = list(batch.signals) + self.target_signal(batch)
+        sigs = [sig for sig in sigs if sig.signal == sig.sig_sell] + [sig for sig in sigs if sig.signal == sig.sig_buy]
+        if len(sigs) == 0:
+            return
+
+        codes = [sig.code for sig in sigs]
+        price = np.array([sig.price for sig in sigs], dtype=float)
+        volume = np.array([sig.volume for sig in sigs], dtype=float)
+        is_buy = np.array([sig.signal == sig.sig_buy for sig in sigs])
+
+        fee = fees.vector_fee(np.where(is_buy, consts.act_buy, consts.act_sell), codes, price, volume,
+                              broker_fee=self.broker_fee, transfer_fee=self.transfer_fee, tax_fee=self.tax_fee)
+        cost = np.round(price * volume + fee, 4)
+        valid = volume > 0
+        accept = valid & ~is_buy
+        buy_cost = np.where(is_buy & valid, cost, 0.0)
+        accept |= is_buy & valid & (np.cumsum(buy_cost) <= self.cash_available)
+
+        entrusts = []
+        for i, sig in enumerate(sigs):
+            await self.save_signal(sig)
+            if not accept[i]:
+                self.log.warn('batch signal rejected: code={}, signal={}, volume={}, cost={}, available={}'.format(
+                    sig.code, sig.signal, sig.volume, cost[i], self.cash_available))
+                continue
+            if not is_buy[i]:
+                # 前面的卖委托已扣减可卖量
+                _, volume_available = self.get_position_volume(sig.code)
+                if sig.volume > volume_available:
+                    self.log.warn('not volume to sell, code={}, entrust={}, available={}'.format(
+                        sig.code, sig.volume, volume_available))
+                    continue
+            evt = consts.evt_sig_buy if is_buy[i] else consts.evt_sig_sell
+            entrusts.append(await self.entrust_signal(evt, sig, float(cost[i]) if is_buy[i] else 0, sync=False,
+                                                      emit=False))
+
+        if len(entrusts) == 0:
+            return
+        await self.sync_to_db()
+        await self.emit('broker', consts.evt_entrust_batch, entrusts)
+
+    async def save_signal(self, sig):
+        await sig.sync_to_db()
+        if self.trader.is_backtest():
+            self.recorder.record_signal(sig)
+
+    async def entrust_signal(self, evt, sig, cost, sync=True, emit=True) -> Entrust:
+        """
+        已校验的买卖信号生成委托，冻结资金/持仓并发给券商
+        :param sync: 买委托是否立即保存账户, 批量时由调用方最后保存
+        :param emit: 是否发给券商, 批量时由调用方一次发出
+        """
+        entrust = Entrust(self.new_id(), self)
+        entrust.name = sig.name
+        entrust.code = sig.code
+        entrust.time = sig.time
+        entrust.broker_entrust_id = ''
+        entrust.type = sig.signal
+        entrust.status = entrust.stat_init
+        entrust.price = sig.price
+        entrust.volume = sig.volume
+        entrust.volume_deal = 0
+        entrust.volume_cancel = 0
+        entrust.signal = sig
+        entrust.desc = sig.desc
+
+        self.entrust[entrust.entrust_id] = entrust
+        self.index_entrust(entrust)
+        await entrust.sync_to_db()
+
+        evt_broker = None
+        if evt == consts.evt_sig_buy:
+            evt_broker = consts.evt_entrust_buy
+            self.cash_frozen += cost
+            self.cash_available -= cost
+            self.frozen_cash[entrust.entrust_id] = cost
+
+            if sync:
+                await self.sync_to_db()
+        elif evt == consts.evt_sig_sell:
+            evt_broker = consts.evt_entrust_sell
+            position = self.position[sig.code]
+            position.volume_available -= sig.volume
+            position.volume_frozen += sig.volume
+            self.index_position(position)
 
-        if evt == consts.evt_entrust_cancel:
-            entrust = self.entrust[sig]
-            await self.emit('broker', consts.evt_entrust_cancel, entrust)
+            await position.sync_to_db()
+        if emit and evt_broker is not None:
+            await self.emit('broker', evt_broker, entrust)
+        return entrust
 
     @staticmethod
-    def update_position(position):
+    def update_position(position, time=None):
+        """
+        按最新价计算持仓盈亏, 成交和行情共用
+        :param time: 最大/最小盈利时间, None为持仓时间
+        """
+        time = position.time if time is None else time
         position.max_price = position.now_price if position.now_price > position.max_price else position.max_price
         position.min_price = position.now_price if position.now_price < position.min_price else position.min_price
 
         position.profit = round((position.now_price - position.price) * position.volume, 4)
         if position.profit > position.max_profit:
             position.max_profit = position.profit
-            position.max_profit_time = position.time
+            position.max_profit_time = time
         if position.profit < position.min_profit:
             position.min_profit = position.profit
-            position.min_profit_time = position.time
+            position.min_profit_time = time
 
         position.profit_rate = round(position.profit / (position.volume * position.price) * 100, 4)
         if position.profit_rate > position.max_profit_rate:
@@ -387,7 +692,7 @@ class Account(BaseObj):
     async def add_position(self, deal):
         position = None
         if deal.code not in self.position:
-            position = Position(self.get_uuid(), self)
+            position = Position(self.new_id(), self)
             position.name = deal.name
             position.code = deal.code
             position.time = deal.time
@@ -405,6 +710,7 @@ class Account(BaseObj):
 
         else:
             position = self.position[deal.code]
+            self.apply_position(position, -1)
             position.time = deal.time
             position.fee += deal.fee
             position.price = round((position.price * position.volume + deal.price * deal.volume + deal.fee) / (
@@ -415,8 +721,13 @@ class Account(BaseObj):
 
             await position.sync_to_db()
 
-        self.cash_frozen = round(self.cash_frozen - self.get_cost(consts.act_buy, position.code, deal.price, deal.volume), 2)
-        await self.update_account(None)
+        self.apply_position(position)
+        cost = self.get_cost(consts.act_buy, position.code, deal.price, deal.volume)
+        self.cash_frozen = round(self.cash_frozen - cost, 2)
+        if deal.entrust_id in self.frozen_cash:
+            self.frozen_cash[deal.entrust_id] = round(self.frozen_cash[deal.entrust_id] - cost, 4)
+        self.update_total()
+        await self.flush(force=True)
 
     async def deduct_position(self, deal):
         if deal.code not in self.position:
@@ -424,6 +735,7 @@ class Account(BaseObj):
             return
 
         position = self.position[deal.code]
+        self.apply_position(position, -1)
 
         deal.profit = round((deal.price - position.price) * deal.volume - deal.fee, 4)
         self.close_profit = round(self.close_profit + deal.profit, 4)
@@ -435,15 +747,20 @@ class Account(BaseObj):
         if position.volume > 0:
             # position.now_price = deal.price
             self.update_position(position)
+            self.apply_position(position)
             await position.sync_to_db()
 
         if position.volume == 0:
             del self.position[position.code]
-            await self.db_trade.delete_position(dict(position_id=position.position_id))
+            self.position_available.pop(position.code, None)
+            self.dirty_position.pop(position.position_id, None)
+            await self.mapper.delete_position(position)
 
         self.cash_available = round(self.cash_available + deal.volume * deal.price - deal.fee, 2)
-        await self.update_account(None)
+        self.update_total()
+        await self.flush(force=True)
 
+    @monitor.timed('winq_account_handle_seconds', handler='on_broker')
     async def on_broker(self, evt, payload):
         """
 
@@ -451,47 +768,74 @@ class Account(BaseObj):
         :param payload: Entrust
         :return:
         """
-        self.log.info('account on_broker: evt={}, signal={}'.format(evt, payload))
+        self.log.info('account on_broker: evt={}, signal={}', evt, payload)
         if evt == consts.evt_broker_deal:
-            entrust = copy.copy(payload)
+            entrust = payload
+            fills, entrust.fills = entrust.fills, []
+            if len(fills) == 0:
+                # broker没有逐笔成交记录时, 按累计成交量的增量记账
+                volume = entrust.volume_deal - self.entrust_dealt.get(entrust.entrust_id, 0)
+                if volume > 0:
+                    fills = [(volume, entrust.deal_price if entrust.deal_price > 0 else entrust.price, entrust.time)]
+            if len(fills) == 0:
+                # 已在之前的成交事件中记账
+                return
+            self.entrust_dealt[entrust.entrust_id] = entrust.volume_deal
+
             self.entrust[entrust.entrust_id] = entrust
             await entrust.sync_to_db()
 
-            deal = Deal(self.get_uuid(), entrust.entrust_id, account=self)
+            for volume, price, time in fills:
+                deal = Deal(self.new_id(), entrust.entrust_id, account=self)
 
-            deal.entrust_id = entrust.entrust_id
+                deal.entrust_id = entrust.entrust_id
 
-            deal.name = entrust.name
-            deal.code = entrust.code
-            deal.time = entrust.time
-            deal.type = entrust.type
+                deal.name = entrust.name
+                deal.code = entrust.code
+                deal.time = time
+                deal.type = entrust.type
 
-            deal.price = entrust.price
-            deal.volume = entrust.volume_deal
+                deal.price = price
+                deal.volume = volume
 
-            deal.fee = self.get_fee(typ=entrust.type, code=deal.code, price=deal.price, volume=deal.volume)
+                deal.fee = self.get_fee(typ=entrust.type, code=deal.code, price=deal.price, volume=deal.volume)
 
-            if entrust.type == entrust.type_buy:
-                await self.add_position(deal)
-            elif entrust.type == entrust.type_sell:
-                await self.deduct_position(deal)
+                if entrust.type == entrust.type_buy:
+                    await self.add_position(deal)
+                elif entrust.type == entrust.type_sell:
+                    await self.deduct_position(deal)
 
-            if self.trader.is_backtest():
-                self.deal.append(deal.to_dict())
+                if self.trader.is_backtest():
+                    self.recorder.record_deal(deal)
 
-            await deal.sync_to_db()
+                await deal.sync_to_db()
 
+            self.index_entrust(entrust)
             if entrust.volume == entrust.volume_deal + entrust.volume_cancel:
+                self.entrust_dealt.pop(entrust.entrust_id, None)
+                self.release_frozen(entrust.entrust_id)
+                self.update_total()
                 if not self.trader.is_backtest():
                     del self.entrust[entrust.entrust_id]
 
-        if evt == consts.evt_entrust_cancel:
+        if evt == consts.evt_entrust_cancel or evt == consts.evt_broker_cancelled:
             entrust = self.entrust[payload.entrust_id]
             entrust.volume_cancel = payload.volume_cancel
             if entrust.volume_deal != 0:
                 entrust.status = entrust.stat_part_deal
             else:
                 entrust.status = entrust.stat_cancel
+            self.unindex_entrust(entrust)
+            self.release_frozen(entrust.entrust_id)
+            self.entrust_dealt.pop(entrust.entrust_id, None)
+            if entrust.type == entrust.type_sell and entrust.code in self.position:
+                position = self.position[entrust.code]
+                volume = entrust.volume - entrust.volume_deal
+                position.volume_frozen -= volume
+                position.volume_available += volume
+                self.index_position(position)
+                await position.sync_to_db()
+            self.update_total()
             await entrust.sync_to_db()
             if not self.trader.is_backtest():
                 del self.entrust[entrust.entrust_id]
@@ -500,6 +844,7 @@ class Account(BaseObj):
             entrust = self.entrust[payload.entrust_id]
             entrust.status = payload.status
             entrust.broker_entrust_id = payload.broker_entrust_id
+            self.index_entrust(entrust)
             await entrust.sync_to_db()
 
     @staticmethod
@@ -35,6 +35,12 @@ class BaseActionObj(BaseObj):
     async def cancel(self, sig):
         await self.emit('signal', consts.evt_sig_cancel, sig)
 
+    async def batch(self, batch):
+        """
+        批量信号(BatchSignal, 目标持仓/信号列表)，一次事件由账户统一校验生成委托
+        """
+        await self.emit('signal', consts.evt_sig_batch, batch)
+
     async def quot_subs(self, *codes):
         """
         订阅新的代码行情
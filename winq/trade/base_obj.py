@@ -47,7 +47,8 @@ class BaseObj(ABC):
                 'trade is stop running, still emit signal, omit: queue={}, evt={}, payload={}'.format(queue, evt,
                                                                                                       payload))
             return
-        await self.trader.queue[queue].put((evt, payload))
+        tracer = self.trader.tracer
+        await self.trader.queue[queue].put(tracer.pack(evt, payload, tracer.current()))
 
     @property
     def is_trading(self):
@@ -75,3 +76,60 @@ class BaseObj(ABC):
     def __str__(self):
         return yaml.dump(self.to_dict(), allow_unicode=True, sort_keys=False)
 
+    def new_id(self) -> str:
+        return self.trader.next_id()
+
+    def get_state(self) -> object:
+        """
+        回测断点保存的状态(可pickle), 子类按需实现
+        """
+        return None
+
+    def set_state(self, state: object):
+        """
+        从回测断点恢复状态
+        """
+        pass
+
+
+class BaseRecord:
+    """
+    交易记录(信号/委托/成交/持仓)基类:
+    1. __slots__ 不保存日志/数据库引用，日志为类级别
+    2. 持久化由 account.mapper(TradeMapper) 完成
+    """
+    __slots__ = ('account',)
+
+    log = log.get_logger('BaseRecord')
+
+    def __init__(self, account):
+        self.account = account
+
+    @property
+    def typ(self):
+        return self.account.typ
+
+    @property
+    def trader(self):
+        return self.account.trader
+
+    async def sync_to_db(self) -> bool:
+        return await self.account.mapper.save(self)
+
+    def get_state(self) -> tuple:
+        """
+        按__slots__顺序保存字段值, 引用的其他记录不保存
+        """
+        return tuple(None if isinstance(value, BaseRecord) else value
+                     for value in (getattr(self, slot) for slot in self.__slots__))
+
+    def set_state(self, state: tuple):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def to_dict(self) -> Dict:
+        return {}
+
+    def __str__(self):
+        return yaml.dump(self.to_dict(), allow_unicode=True, sort_keys=False)
+
@@ -2,6 +2,7 @@ import json
 from winq.trade.base_obj import BaseObj
 from winq.trade.account import Account
 from typing import Optional, Dict
+import winq.trade.consts as consts
 
 
 class Broker(BaseObj):
@@ -11,6 +12,7 @@ class Broker(BaseObj):
     1. evt_entrust_buy 买委托事件
     2. evt_entrust_sell 卖委托事件
     3. evt_entrust_cancel 撤销委托事件
+    4. evt_entrust_batch 批量买卖委托事件, 默认逐个调用on_entrust
 
     buy(买), sell(卖), cancel(撤销)委托成功或失败均产生委托结果事件
     buy(买), sell(卖), cancel(撤销)成交或撤销均产生事件
@@ -30,6 +32,9 @@ class Broker(BaseObj):
 
         self.opt = None
 
+        # 是否需要接收行情事件(evt_quotation)
+        self.need_quot = False
+
     async def init(self, opt: Optional[Dict]):
         return True
 
@@ -68,6 +73,31 @@ class Broker(BaseObj):
         """
         pass
 
+    async def on_entrust_event(self, evt, payload):
+        """
+        券商任务的处理函数
+        """
+        if evt == consts.evt_entrust_batch:
+            await self.on_entrust_batch(payload)
+            return
+        await self.on_entrust(evt, payload)
+
+    async def on_entrust_batch(self, entrusts):
+        """
+        批量委托, 可一次提交的券商重写
+        :param entrusts: [Entrust]
+        """
+        for entrust in entrusts:
+            evt = consts.evt_entrust_buy if entrust.type == entrust.type_buy else consts.evt_entrust_sell
+            await self.on_entrust(evt, entrust)
+
+    async def emit_deals(self, entrusts):
+        """
+        批量产生成交事件
+        """
+        for entrust in entrusts:
+            await self.emit('broker_event', consts.evt_broker_deal, entrust)
+
     async def sync_from_db(self) -> bool:
         opt = await self.db_trade.load_strategy(filter={'account_id': self.account.account_id},
                                                 projection=['broker_opt'], limit=1)
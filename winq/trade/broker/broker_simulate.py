@@ -1,33 +1,172 @@
 from .broker import Broker
 from winq.trade.account import Account
-import copy
+from typing import Dict, List, Optional
+import numpy as np
 import winq.trade.consts as consts
 
 
 class BrokerSimulate(Broker):
+    """
+    模拟券商, 两种撮合方式(option: match):
+    1. instant 委托立即按委托价全部成交(默认)
+    2. bar 按k线撮合, 所有未成交委托在一次向量化计算中与k线的开高低量撮合:
+       - delay 1(默认): 委托只与之后到达的k线撮合, 买: 最低价 <= 委托价成交, 成交价 min(开盘价, 委托价);
+         卖: 最高价 >= 委托价成交, 成交价 max(开盘价, 委托价)
+       - delay 0: 委托到达后与产生信号的同一根k线撮合, 开盘价已经过去, 成交价为委托价(限制在最高最低价之间)
+       - slippage 滑点比例, 滑点后价格不超过委托价且在最高最低价之间
+       - participation 单根k线可成交量占k线成交量的比例上限, 同一代码按委托先后分配, 0不限制
+       - lot 部分成交时成交量取整手数
+       - 每次成交记录到entrust.fills(量, 价, k线时间), 账户逐笔记账
+    """
+
     def __init__(self, broker_id, account: Account):
         super().__init__(broker_id=broker_id, account=account)
 
+        self.match = 'instant'
+        self.delay = 1
+        self.participation = 0.1
+        self.slippage = 0.0
+        self.lot = 100
+
+        self.pending = []  # 未成交委托, 按到达顺序
+        self.bars = {}  # code -> 最新k线
+        self.used = {}  # code -> 最新k线已成交量
+
     def name(self):
         return '神算子模拟券商'
 
+    async def init(self, opt: Optional[Dict]):
+        self.opt = opt
+        if opt is not None:
+            self.match = opt['match'] if 'match' in opt else self.match
+            self.delay = int(opt['delay']) if 'delay' in opt else self.delay
+            self.participation = float(opt['participation']) if 'participation' in opt else self.participation
+            self.slippage = float(opt['slippage']) if 'slippage' in opt else self.slippage
+            self.lot = int(opt['lot']) if 'lot' in opt else self.lot
+        if self.match not in ['instant', 'bar']:
+            self.log.error('invalid match option: {}'.format(self.match))
+            return False
+        self.need_quot = self.match == 'bar'
+        return True
+
+    async def on_close(self, evt, payload):
+        if evt == consts.evt_noon_end:
+            # 当日未成交委托由账户置为失效
+            self.pending.clear()
+
     async def on_entrust(self, evt, payload):
-        self.log.info('on entrust, evt={}, entrust={}'.format(evt, payload))
-        entrust = copy.copy(payload)
-        if evt == consts.evt_entrust_buy:
-            entrust.broker_entrust_id = self.get_uuid()
-            entrust.status = entrust.stat_deal
-            entrust.volume_deal = entrust.volume
-            await self.emit('broker_event', consts.evt_broker_deal, entrust)
-
-        if evt == consts.evt_entrust_sell:
-            entrust.broker_entrust_id = self.get_uuid()
-            entrust.status = entrust.stat_deal
-            entrust.volume_deal = entrust.volume
-            await self.emit('broker_event', consts.evt_broker_deal, entrust)
+        if evt == consts.evt_quotation:
+            for code, bar in payload['list'].items():
+                self.bars[code] = bar
+                self.used[code] = 0
+            if len(self.pending) > 0:
+                await self.emit_deals(self.match_bar(codes=payload['list'], new_bar=True))
+            return
+
+        self.log.info('on entrust, evt={}, entrust={}', evt, payload)
+
+        # 模拟券商与账户同进程，直接更新委托
+        entrust = payload
+        if evt == consts.evt_entrust_buy or evt == consts.evt_entrust_sell:
+            entrust.broker_entrust_id = self.new_id()
+            if self.match == 'instant':
+                entrust.status = entrust.stat_deal
+                entrust.volume_deal = entrust.volume
+                await self.emit('broker_event', consts.evt_broker_deal, entrust)
+                return
+
+            self.pending.append(entrust)
+            # 同一批委托都到达后统一撮合
+            if self.delay == 0 and self.trader.queue['broker'].empty():
+                await self.emit_deals(self.match_bar())
 
         if evt == consts.evt_entrust_cancel:
-            entrust.broker_entrust_id = self.get_uuid()
+            if entrust in self.pending:
+                self.pending.remove(entrust)
+            entrust.broker_entrust_id = self.new_id()
             entrust.status = entrust.stat_cancel
-            entrust.volume_cancel = entrust.volume_cancel
+            entrust.volume_cancel = entrust.volume - entrust.volume_deal
             await self.emit('broker_event', consts.evt_broker_cancelled, entrust)
+
+    async def on_entrust_batch(self, entrusts):
+        self.log.info('on entrust batch, count={}', len(entrusts))
+        for entrust in entrusts:
+            entrust.broker_entrust_id = self.new_id()
+        if self.match == 'instant':
+            for entrust in entrusts:
+                entrust.status = entrust.stat_deal
+                entrust.volume_deal = entrust.volume
+            await self.emit_deals(entrusts)
+            return
+
+        self.pending.extend(entrusts)
+        if self.delay == 0:
+            await self.emit_deals(self.match_bar())
+
+    def match_bar(self, codes=None, new_bar=False) -> List:
+        """
+        未成交委托与最新k线撮合
+        :param codes: 只撮合这些代码, None为所有有k线的代码
+        :param new_bar: 是否为委托之后新到达的k线, 否则为产生信号的同一根k线, 不能按开盘价成交
+        :return: 有成交的委托
+        """
+        codes = self.bars if codes is None else codes
+        entrusts = [entrust for entrust in self.pending if entrust.code in codes]
+        if len(entrusts) == 0:
+            return []
+
+        codes = [entrust.code for entrust in entrusts]
+        bars = [self.bars[code] for code in codes]
+        side = np.array([1 if entrust.type == entrust.type_buy else -1 for entrust in entrusts])
+        price = np.array([entrust.price for entrust in entrusts], dtype=float)
+        remain = np.array([entrust.volume - entrust.volume_deal for entrust in entrusts], dtype=float)
+        bar_open = np.array([bar['open'] for bar in bars], dtype=float)
+        bar_high = np.array([bar['high'] for bar in bars], dtype=float)
+        bar_low = np.array([bar['low'] for bar in bars], dtype=float)
+        bar_volume = np.array([bar['volume'] for bar in bars], dtype=float)
+
+        is_buy = side > 0
+        hit = np.where(is_buy, bar_low <= price, bar_high >= price) & (remain > 0)
+
+        if new_bar:
+            fill_price = np.where(is_buy, np.minimum(bar_open, price), np.maximum(bar_open, price))
+        else:
+            fill_price = price
+        fill_price = fill_price * (1 + side * self.slippage)
+        fill_price = np.where(is_buy, np.minimum(fill_price, price), np.maximum(fill_price, price))
+        fill_price = np.clip(fill_price, bar_low, bar_high)
+        fill_price = np.round(fill_price, 3 if self.account.category == 'fund' else 2)
+
+        want = np.where(hit, remain, 0)
+        if self.participation > 0:
+            # 同一代码按委托先后分配可成交量
+            code_index = np.unique(codes, return_inverse=True)[1]
+            cap = bar_volume * self.participation - np.array([self.used[code] for code in codes], dtype=float)
+            order = np.argsort(code_index, kind='stable')
+            cum = np.cumsum(want[order])
+            sorted_code = code_index[order]
+            start = np.r_[True, sorted_code[1:] != sorted_code[:-1]]
+            base = np.maximum.accumulate(np.where(start, cum - want[order], 0))
+            before = np.empty_like(cum)
+            before[order] = cum - want[order] - base
+            fill = np.clip(np.maximum(cap, 0) - before, 0, want)
+        else:
+            fill = want
+
+        partial = fill < remain
+        if self.lot > 1:
+            fill = np.where(partial, np.floor(fill / self.lot) * self.lot, fill)
+
+        dealt = []
+        for i in np.nonzero(fill > 0)[0]:
+            entrust = entrusts[i]
+            volume = int(fill[i])
+            entrust.deal_price = float(fill_price[i])
+            entrust.volume_deal += volume
+            entrust.fills.append((volume, entrust.deal_price, bars[i]['day_time'] if 'day_time' in bars[i] else entrust.time))
+            entrust.status = entrust.stat_deal if entrust.volume_deal >= entrust.volume else entrust.stat_part_deal
+            self.used[entrust.code] += volume
+            dealt.append(entrust)
+
+        self.pending = [entrust for entrust in self.pending if entrust.volume_deal < entrust.volume]
+        return dealt
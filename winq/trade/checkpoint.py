@@ -0,0 +1,143 @@
+"""
+回测断点
+
+在交易日结束(evt_noon_end处理完, 所有队列为空)时保存回测完整状态:
+- 账户资金/盈亏
+- 持仓、未完成委托(记录类按__slots__顺序保存为tuple)、冻结资金
+- 回测记录(Recorder 列缓存)
+- strategy/risk/broker 通过 get_state/set_state 钩子保存的状态
+- 行情游标(最后处理的k线时间)及id序号
+
+使用pickle二进制格式, 从断点恢复时重新创建账户/策略(可以修改策略参数), 再还原状态并跳过游标之前的行情。
+
+配置:
+trade:
+  checkpoint:
+    path: ~/.config/winq/checkpoint  # 保存目录, 不配置不保存
+    every: 1  # 每几个交易日保存一次
+    resume: ~/.config/winq/checkpoint/xxx-20210104.ckpt  # 从该断点恢复
+"""
+import os
+import pickle
+import itertools
+from typing import Dict, Optional
+import winq.log as log
+from winq.trade.entrust import Entrust
+from winq.trade.position import Position
+
+_version = 2
+
+_account_fields = ('status', 'category', 'cash_init', 'cash_available', 'cash_frozen', 'total_net_value',
+                   'total_hold_value', 'cost', 'profit', 'profit_rate', 'close_profit',
+                   'total_profit', 'total_profit_rate', 'broker_fee', 'transfer_fee', 'tax_fee',
+                   'start_time', 'end_time')
+
+
+class Checkpoint:
+    def __init__(self, path: Optional[str] = None, every: int = 1, resume: Optional[str] = None):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.path = os.path.expanduser(path) if path is not None else None
+        self.every = every if every is not None and every > 0 else 1
+        self.resume = os.path.expanduser(resume) if resume is not None else None
+
+        self.days = 0
+
+    @classmethod
+    def from_config(cls, opt: Optional[Dict]) -> Optional['Checkpoint']:
+        if opt is None:
+            return None
+        return cls(path=opt['path'] if 'path' in opt else None,
+                   every=opt['every'] if 'every' in opt else 1,
+                   resume=opt['resume'] if 'resume' in opt else None)
+
+    def need_save(self) -> bool:
+        """
+        交易日结束时调用
+        """
+        if self.path is None:
+            return False
+        self.days += 1
+        return self.days % self.every == 0
+
+    @staticmethod
+    def snapshot(trader) -> Dict:
+        account = trader.account
+        quot = trader.quot
+        seq = next(trader.id_seq)
+        trader.id_seq = itertools.count(seq)
+
+        entrusts = [entrust for entrust in account.entrust.values() if entrust.entrust_id in account.active_index]
+        return dict(version=_version,
+                    day_time=quot.day_time,
+                    id_seq=seq,
+                    account={field: getattr(account, field) for field in _account_fields},
+                    position=[position.get_state() for position in account.position.values()],
+                    entrust=[entrust.get_state() for entrust in entrusts],
+                    frozen_cash=dict(account.frozen_cash),
+                    entrust_dealt=dict(account.entrust_dealt),
+                    recorder=account.recorder.buffer,
+                    strategy=account.strategy.get_state(),
+                    risk=account.risk.get_state(),
+                    broker=account.broker.get_state())
+
+    async def save(self, trader) -> Optional[str]:
+        state = self.snapshot(trader)
+        os.makedirs(self.path, exist_ok=True)
+        day_time = state['day_time']
+        file = os.path.join(self.path, '{}-{}.ckpt'.format(trader.account.account_id, day_time.strftime('%Y%m%d')))
+        tmp = file + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+        self.log.info('checkpoint saved: {}'.format(file))
+        return file
+
+    def load(self) -> Optional[Dict]:
+        if self.resume is None:
+            return None
+        if not os.path.exists(self.resume):
+            self.log.error('checkpoint not exists: {}'.format(self.resume))
+            return None
+        with open(self.resume, 'rb') as f:
+            state = pickle.load(f)
+        if state['version'] != _version:
+            self.log.error('checkpoint version not match: {}'.format(state['version']))
+            return None
+        return state
+
+    @staticmethod
+    def restore(trader, state: Dict) -> bool:
+        account = trader.account
+        for field, value in state['account'].items():
+            setattr(account, field, value)
+
+        account.position.clear()
+        account.position_available.clear()
+        for data in state['position']:
+            position = Position(None, account)
+            position.set_state(data)
+            account.position[position.code] = position
+            account.index_position(position)
+
+        account.entrust.clear()
+        account.active_entrust.clear()
+        account.active_status.clear()
+        account.active_index.clear()
+        for data in state['entrust']:
+            entrust = Entrust(None, account)
+            entrust.set_state(data)
+            account.entrust[entrust.entrust_id] = entrust
+            account.index_entrust(entrust)
+        account.frozen_cash = dict(state['frozen_cash'])
+        account.entrust_dealt = dict(state['entrust_dealt'])
+
+        account.recorder.buffer = state['recorder']
+        account.recorder.frames.clear()
+
+        account.strategy.set_state(state['strategy'])
+        account.risk.set_state(state['risk'])
+        account.broker.set_state(state['broker'])
+
+        trader.id_seq = itertools.count(state['id_seq'])
+
+        return trader.quot.seek(state['day_time'])
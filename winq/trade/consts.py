@@ -18,6 +18,8 @@ evt_noon_end = 'evt_noon_end'
 evt_entrust_buy = 'evt_entrust_buy'
 evt_entrust_sell = 'evt_entrust_sell'
 evt_entrust_cancel = 'evt_entrust_cancel'
+# 批量委托 payload = [Entrust]
+evt_entrust_batch = 'evt_entrust_batch'
 
 # broker产生的反馈事件:
 # 委托提交事件/委托(买, 卖)成交事件/撤销事件/资金同步事件/持仓同步事件
@@ -32,6 +34,8 @@ evt_broker_pos_sync = 'evt_broker_pos_sync'
 evt_sig_cancel = 'evt_sig_cancel'
 evt_sig_buy = 'evt_sig_buy'
 evt_sig_sell = 'evt_sig_sell'
+# 批量信号(目标持仓/信号列表) payload = BatchSignal
+evt_sig_batch = 'evt_sig_batch'
 
 # 订阅行情事件
 evt_quot_codes = 'evt_quot_codes'
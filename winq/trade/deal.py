@@ -1,10 +1,14 @@
-from winq.trade.base_obj import BaseObj
+from winq.trade.base_obj import BaseRecord
+import winq.log as log
 
 
-class Deal(BaseObj):
+class Deal(BaseRecord):
+    __slots__ = ('deal_id', 'entrust_id', 'name', 'code', 'time', 'type', 'price', 'volume', 'profit', 'fee')
+
+    log = log.get_logger('Deal')
+
     def __init__(self, deal_id: str, entrust_id: str, account):
-        super().__init__(typ=account.typ, db_data=account.db_data, db_trade=account.db_trade, trader=account.trader)
-        self.account = account
+        super().__init__(account=account)
 
         self.deal_id = deal_id
         self.entrust_id = entrust_id
@@ -19,18 +23,6 @@ class Deal(BaseObj):
 
         self.fee = 0
 
-    @BaseObj.discard_saver
-    async def sync_to_db(self) -> bool:
-        data = {'account_id': self.account.account_id,
-                'deal_id': self.deal_id, 'entrust_id': self.entrust_id,
-                'name': self.name, 'code': self.code,
-                'volume': self.volume, 'price': self.price,
-                'fee': self.fee, 'time': self.time,
-                'type': self.type, 'profit': self.profit
-                }
-        await self.db_trade.save_deal(data=data)
-        return True
-
     def to_dict(self):
         return {'account_id': self.account.account_id,
                 'deal_id': self.deal_id, 'entrust_id': self.entrust_id,
@@ -1,14 +1,19 @@
-from winq.trade.base_obj import BaseObj
+from winq.trade.base_obj import BaseRecord
 from datetime import datetime
+import winq.log as log
 
 
-class Entrust(BaseObj):
+class Entrust(BaseRecord):
+    __slots__ = ('entrust_id', 'name', 'code', 'time', 'broker_entrust_id', 'type', 'status',
+                 'price', 'volume', 'volume_deal', 'volume_cancel', 'deal_price', 'fills', 'desc', 'signal')
+
+    log = log.get_logger('Entrust')
+
     stat_init, stat_commit, stat_deal, stat_part_deal, stat_cancel = 'init', 'commit', 'deal', 'part_deal', 'cancel '
     type_buy, type_sell, type_cancel = 'buy', 'sell', 'cancel'
 
     def __init__(self, entrust_id: str, account):
-        super().__init__(typ=account.typ, db_data=account.db_data, db_trade=account.db_trade, trader=account.trader)
-        self.account = account
+        super().__init__(account=account)
 
         self.entrust_id = entrust_id
 
@@ -26,35 +31,15 @@ class Entrust(BaseObj):
         self.volume_deal = 0  # 已成量
         self.volume_cancel = 0  # 已取消量
 
+        self.deal_price = 0.0  # 最近成交价(broker设置, 0为委托价)
+        self.fills = []  # 未记账的成交(volume, price, time), broker追加, account记账后清空
+
         self.desc = ''
 
         self.signal = None
 
     async def sync_from_db(self) -> bool:
-        entrust = await self.db_trade.load_entrust(filter={'entrust_id': self.entrust_id}, limit=1)
-        entrust = None if len(entrust) == 0 else entrust[0]
-        if entrust is None:
-            self.log.error('entrust from db not found: {}'.format(self.entrust_id))
-            return False
-        self.from_dict(entrust)
-        return True
-
-    @BaseObj.discard_saver
-    async def sync_to_db(self) -> bool:
-        data = {'account_id': self.account.account_id,
-                'entrust_id': self.entrust_id,
-                'broker_entrust_id': self.broker_entrust_id,
-                'name': self.name,
-                'code': self.code,
-                'type': self.type,
-                'price': self.price,
-                'volume': self.volume,
-                'volume_deal': self.volume_deal,
-                'volume_cancel': self.volume_cancel,
-                'status': self.status,
-                'time': self.time}
-        await self.db_trade.save_entrust(data=data)
-        return True
+        return await self.account.mapper.load_entrust(self)
 
     def from_dict(self, data):
         self.name = data['name']
@@ -65,7 +50,7 @@ class Entrust(BaseObj):
         self.price = data['price']
         self.status = data['status']
         self.type = data['type']
-        self.desc = data['desc']
+        self.desc = data['desc'] if 'desc' in data else ''
         self.broker_entrust_id = data['broker_entrust_id']
         self.time = data['time'] if isinstance(data['time'], datetime) else datetime.strptime(data['time'],
                                                                                               '%Y-%m-%d %H:%M:%S')
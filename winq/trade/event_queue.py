@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+from collections import OrderedDict
+from typing import Dict, List
+import winq.trade.consts as consts
+
+
+class ConflateQueue(asyncio.Queue):
+    """
+    行情合并队列(实盘使用)，队列元素为 (evt, payload, ...):
+    1. 同一个key的evt_quotation在队列中只保留最新的一个，旧行情中有而新行情没有的代码合并到新行情
+    2. 其他事件(evt_morning_start, evt_noon_end ...)不会丢弃，行情也不会越过这些事件合并
+    3. dropped 被丢弃的旧行情数，merged 其中有代码合并到新行情的次数
+    """
+
+    def __init__(self, maxsize=0, key=None):
+        super().__init__(maxsize=maxsize)
+        self.key = key if key is not None else self.quotation_key
+        self.dropped = 0
+        self.merged = 0
+
+    @staticmethod
+    def quotation_key(evt, payload):
+        """
+        :return: 可合并事件的key，None不可合并
+        """
+        if evt == consts.evt_quotation:
+            return evt
+        return None
+
+    def merge(self, pre_payload, payload):
+        if not isinstance(pre_payload, dict) or not isinstance(payload, dict) or \
+                'list' not in pre_payload or 'list' not in payload:
+            return payload
+
+        missing = [code for code in pre_payload['list'] if code not in payload['list']]
+        if len(missing) == 0:
+            return payload
+
+        quot = OrderedDict((code, pre_payload['list'][code]) for code in missing)
+        quot.update(payload['list'])
+        self.merged += 1
+        return dict(payload, list=quot)
+
+    def _put(self, item):
+        evt, payload = item[0], item[1]
+        key = self.key(evt, payload)
+        if key is not None:
+            for i in range(len(self._queue) - 1, -1, -1):
+                pre_evt, pre_payload = self._queue[i][0], self._queue[i][1]
+                pre_key = self.key(pre_evt, pre_payload)
+                if pre_key is None:
+                    break
+                if pre_key == key:
+                    del self._queue[i]
+                    # 被替换的事件不会再被get, 对应的task_done由新事件承担
+                    self._unfinished_tasks -= 1
+                    self.dropped += 1
+                    item = (evt, self.merge(pre_payload, payload)) + tuple(item[2:])
+                    break
+        super()._put(item)
+
+    def stat(self) -> Dict:
+        return dict(size=self.qsize(), dropped=self.dropped, merged=self.merged)
+
+
+class SignalQueue(asyncio.Queue):
+    """
+    交易信号优先队列，队列元素为 (evt, payload, ...):
+    1. 优先级: 撤单 > 风控卖 > 其他卖 > 买/批量 > 其他, 同优先级先进先出, evt_term最后
+    2. 同一来源、同一代码、同一方向还在队列中的买卖信号只保留最新的一个
+    3. get_batch 取出队首连续的同一事件(如一批买信号)，由账户一次校验资金
+    4. coalesced 被合并的信号数
+    """
+
+    def _init(self, maxsize):
+        self._queue = []
+        self.seq = 0
+        self.index = {}  # 合并key -> 队列中的entry
+        self.coalesced = 0
+
+    @staticmethod
+    def priority(evt, payload) -> int:
+        if evt == consts.evt_sig_cancel or evt == consts.evt_entrust_cancel:
+            return 0
+        if evt == consts.evt_sig_sell:
+            source = getattr(payload, 'source', '')
+            return 1 if source is not None and source.startswith('risk') else 2
+        if evt == consts.evt_sig_buy or evt == consts.evt_sig_batch:
+            return 3
+        if evt == consts.evt_term:
+            return 5
+        return 4
+
+    @staticmethod
+    def coalesce_key(evt, payload):
+        """
+        :return: 可合并信号的key，None不可合并
+        """
+        if evt == consts.evt_sig_buy or evt == consts.evt_sig_sell:
+            return evt, getattr(payload, 'source', None), getattr(payload, 'code', None)
+        return None
+
+    def _put(self, item):
+        evt, payload = item[0], item[1]
+        key = self.coalesce_key(evt, payload)
+        if key is not None and key in self.index:
+            # 替换队列中的旧信号，位置不变，对应的task_done由新信号承担
+            self.index[key][2] = item
+            self._unfinished_tasks -= 1
+            self.coalesced += 1
+            return
+        self.seq += 1
+        entry = [self.priority(evt, payload), self.seq, item]
+        if key is not None:
+            self.index[key] = entry
+        heapq.heappush(self._queue, entry)
+
+    def _get(self):
+        entry = heapq.heappop(self._queue)
+        item = entry[2]
+        key = self.coalesce_key(item[0], item[1])
+        if key is not None and self.index.get(key) is entry:
+            del self.index[key]
+        return item
+
+    def get_batch(self, evt) -> List:
+        """
+        取出队首连续的evt事件(不等待)
+        """
+        items = []
+        while len(self._queue) > 0 and self._queue[0][2][0] == evt:
+            items.append(self.get_nowait())
+        return items
+
+    def stat(self) -> Dict:
+        return dict(size=self.qsize(), coalesced=self.coalesced)
@@ -0,0 +1,53 @@
+"""
+交易费用
+
+佣金最低5元，沪市(sh6)买入收过户费，沪深卖出收印花税。
+fee 逐笔计算(Account.get_fee), vector_fee 为数组版本(批量信号, VectorBacktest), 规则相同。
+"""
+import numpy as np
+import winq.trade.consts as consts
+
+
+def fee(typ, code, price, volume,
+        broker_fee=0.00025, transfer_fee=0.00002, tax_fee=0.001) -> float:
+    """
+    单笔费用
+    """
+    total = price * volume
+    broker = total * broker_fee
+    if broker < 5:
+        broker = 5
+    tax = 0
+    if typ == consts.act_buy:
+        if code.startswith('sh6'):
+            tax = total * transfer_fee
+    elif typ == consts.act_sell:
+        if code.startswith('sz') or code.startswith('sh'):
+            tax = total * tax_fee
+    return round(broker + tax, 4)
+
+
+def vector_fee(typ, codes, price, volume,
+               broker_fee=0.00025, transfer_fee=0.00002, tax_fee=0.001) -> np.ndarray:
+    """
+    fee 的数组版本
+    :param typ: consts.act_buy/consts.act_sell 或可广播的数组
+    :param codes: 代码数组，按最后一维广播
+    :param price: 价格数组
+    :param volume: 量数组，量为0的位置费用为0
+    :return: 费用数组
+    """
+    price = np.asarray(price, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    codes = np.asarray(codes, dtype=str)
+    typ = np.asarray(typ)
+
+    total = price * volume
+    broker = np.maximum(total * broker_fee, 5)
+
+    is_sh6 = np.char.startswith(codes, 'sh6')
+    is_exchange = np.char.startswith(codes, 'sh') | np.char.startswith(codes, 'sz')
+    tax = np.where((typ == consts.act_buy) & is_sh6, total * transfer_fee, 0.0)
+    tax = np.where((typ == consts.act_sell) & is_exchange, total * tax_fee, tax)
+
+    return np.where(volume > 0, np.round(broker + tax, 4), 0.0)
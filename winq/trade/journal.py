@@ -0,0 +1,220 @@
+"""
+账户事件日志(实盘/模拟)
+
+1. 账户/信号/委托/成交/持仓 的变化先追加写入本地日志文件(顺序pickle记录), 再由后台任务异步写入数据库,
+   数据库写入不在交易关键路径上
+2. 内存中维护压缩后的状态(账户/持仓/未完成委托), 日志记录数达到snapshot或交易日结束时,
+   当前日志改名为.old并开始新日志, 后台写库任务写完.old中的记录后, 把当时的状态(已写入数据库)
+   写入快照文件并删除.old, 不等待数据库
+3. 重启时读取快照+.old+日志即可恢复账户状态, 日志中的记录重新写入数据库(数据库写入均为upsert, 可重复写)
+
+文件: {path}/{account_id}.snapshot, {path}/{account_id}.journal, {path}/{account_id}.journal.old
+
+配置:
+trade:
+  journal:
+    path: ~/.config/winq/journal  # 保存目录
+    snapshot: 1000  # 日志记录数达到后压缩为快照
+    fsync: false  # 每条记录是否fsync, 默认只flush到操作系统(进程崩溃不丢失)
+"""
+import asyncio
+import os
+import pickle
+import traceback
+from typing import Callable, Dict, Optional
+import winq.log as log
+
+_version = 1
+
+_active_status = ('init', 'commit', 'part_deal')
+
+# 写库队列中的快照标记, 之前的记录都已写入数据库
+_snapshot_kind = '__snapshot__'
+
+
+class Journal:
+    def __init__(self, account_id: str, writer: Callable, path: str, snapshot: int = 1000, fsync: bool = False):
+        """
+        :param account_id: 账户id
+        :param writer: async writer(kind, data) 写数据库
+        :param path: 保存目录
+        :param snapshot: 日志记录数达到后压缩为快照
+        :param fsync: 每条记录是否fsync
+        """
+        self.log = log.get_logger(self.__class__.__name__, prefix=account_id)
+        self.account_id = account_id
+        self.writer = writer
+        self.path = os.path.expanduser(path)
+        self.snapshot = snapshot if snapshot is not None and snapshot > 0 else 1000
+        self.fsync = fsync
+
+        self.snapshot_file = os.path.join(self.path, '{}.snapshot'.format(account_id))
+        self.journal_file = os.path.join(self.path, '{}.journal'.format(account_id))
+        self.old_file = self.journal_file + '.old'
+
+        self.state = self.new_state()
+        self.count = 0
+        self.file = None
+        self.compacting = False
+
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    @classmethod
+    def from_config(cls, account_id: str, writer: Callable, opt: Optional[Dict]) -> Optional['Journal']:
+        if opt is None or 'path' not in opt or opt['path'] is None:
+            return None
+        return cls(account_id=account_id, writer=writer, path=opt['path'],
+                   snapshot=int(opt['snapshot']) if 'snapshot' in opt else 1000,
+                   fsync=bool(opt['fsync']) if 'fsync' in opt else False)
+
+    @staticmethod
+    def new_state() -> Dict:
+        return dict(version=_version, account=None, position={}, entrust={})
+
+    @staticmethod
+    def apply(state: Dict, kind: str, data: Dict):
+        """
+        日志记录合并到状态, 信号/成交只写数据库, 不影响状态
+        """
+        if kind == 'account':
+            state['account'] = data
+        elif kind == 'position':
+            state['position'][data['position_id']] = data
+        elif kind == 'position_delete':
+            state['position'].pop(data['position_id'], None)
+        elif kind == 'entrust':
+            if data['status'] in _active_status:
+                state['entrust'][data['entrust_id']] = data
+            else:
+                state['entrust'].pop(data['entrust_id'], None)
+
+    def open(self, fresh=False) -> Optional[Dict]:
+        """
+        打开日志, 并启动数据库写入任务
+        :param fresh: True 新账户, 丢弃已有的快照及日志
+        :return: 恢复的状态, 没有已保存的账户时为None
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if fresh:
+            for file in (self.snapshot_file, self.old_file, self.journal_file):
+                if os.path.exists(file):
+                    os.remove(file)
+        else:
+            self.replay()
+
+        self.file = open(self.journal_file, 'ab')
+        self.task = asyncio.get_event_loop().create_task(self.feed_task())
+
+        return self.state if self.state['account'] is not None else None
+
+    def replay(self):
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'rb') as f:
+                state = pickle.load(f)
+            if state['version'] != _version:
+                self.log.error('journal snapshot version not match: {}, ignore'.format(state['version']))
+            else:
+                self.state = state
+
+        # 上次压缩未完成, .old中的记录可能还没写入快照, 重复合并结果不变
+        if os.path.exists(self.old_file):
+            self.replay_file(self.old_file)
+            self.compacting = True
+            self.queue.put_nowait((_snapshot_kind, self.copy_state()))
+        if os.path.exists(self.journal_file):
+            self.replay_file(self.journal_file)
+        self.log.info('journal replayed, records={}'.format(self.count))
+
+    def replay_file(self, file: str):
+        valid = 0
+        with open(file, 'rb') as f:
+            while True:
+                try:
+                    kind, data = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # 进程崩溃时最后一条记录可能不完整
+                    self.log.warning('journal truncated at offset={}: {}'.format(valid, e))
+                    break
+                valid = f.tell()
+                self.apply(self.state, kind, data)
+                # 崩溃前可能还没写入数据库
+                self.queue.put_nowait((kind, data))
+                self.count += 1
+        if valid != os.path.getsize(file):
+            with open(file, 'r+b') as f:
+                f.truncate(valid)
+
+    async def append(self, kind: str, data: Dict):
+        pickle.dump((kind, data), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+        self.apply(self.state, kind, data)
+        self.queue.put_nowait((kind, data))
+        self.count += 1
+        if self.count >= self.snapshot:
+            self.compact()
+
+    def copy_state(self) -> Dict:
+        """
+        记录只整体替换不修改, 复制到第二层即可
+        """
+        return dict(version=self.state['version'], account=self.state['account'],
+                    position=dict(self.state['position']), entrust=dict(self.state['entrust']))
+
+    def compact(self):
+        """
+        日志改名为.old并开始新日志, 由写库任务在.old的记录写完后生成快照, 不等待数据库
+        """
+        if self.compacting:
+            # 上次压缩还未完成, 记录继续追加到当前日志
+            return
+        self.compacting = True
+        self.file.close()
+        os.replace(self.journal_file, self.old_file)
+        self.file = open(self.journal_file, 'wb')
+        self.count = 0
+        self.queue.put_nowait((_snapshot_kind, self.copy_state()))
+
+    def write_snapshot(self, state: Dict):
+        tmp = self.snapshot_file + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_file)
+        if os.path.exists(self.old_file):
+            os.remove(self.old_file)
+
+    async def feed_task(self):
+        while True:
+            kind, data = await self.queue.get()
+            if kind is None:
+                self.queue.task_done()
+                break
+            if kind == _snapshot_kind:
+                try:
+                    await asyncio.get_event_loop().run_in_executor(None, self.write_snapshot, data)
+                except Exception as e:
+                    self.log.error('write snapshot exception: {}, stack={}'.format(e, traceback.format_exc()))
+                self.compacting = False
+                self.queue.task_done()
+                continue
+            try:
+                await self.writer(kind, data)
+            except Exception as e:
+                self.log.error('write db exception: kind={}, {}, stack={}'.format(kind, e, traceback.format_exc()))
+            self.queue.task_done()
+
+    async def close(self):
+        if self.task is None:
+            return
+        self.compact()
+        self.queue.put_nowait((None, None))
+        await self.task
+        self.task = None
+        self.file.close()
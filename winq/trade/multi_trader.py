@@ -0,0 +1,283 @@
+"""
+多账户模式
+
+一个进程/一个Trader运行多个账户:
+1. 行情(quot_task, quotation订阅队列)、数据库连接、tracer共用
+2. 每个账户有独立的AccountTrader，拥有自己的 risk/strategy/signal/broker/broker_event/robot 队列和任务
+3. 单个账户初始化失败或处理异常只影响该账户
+"""
+import asyncio
+import os
+import tempfile
+import traceback
+from collections import defaultdict
+from typing import Dict
+import winq.log as log
+import winq.monitor as monitor
+import winq.trade.consts as consts
+from winq.common import is_alive
+from winq.data.mongodb import MongoDB
+from winq.trade.account import Account
+from winq.trade.event_queue import ConflateQueue, SignalQueue
+from winq.trade.tradedb import TradeDB
+from winq.trade.trader import Trader
+
+
+class AccountTrader(Trader):
+    """
+    多账户模式下单个账户的运行上下文，账户内的对象(Account/Strategy/Risk/Broker)的trader指向此对象
+    """
+    # 与宿主Trader共用的队列
+    host_queue = ('account', 'quotation')
+
+    def __init__(self, host: Trader, account_id: str):
+        self.host = host
+        self.account_id = account_id
+        self.log = log.get_logger(self.__class__.__name__, prefix=account_id)
+        self.loop = host.loop
+        self.db_trade = host.db_trade
+        self.db_data = host.db_data
+        self.config = host.config
+        self.tracer = host.tracer
+        self.offloader = host.offloader
+        self.task_queue = host.task_queue
+
+        self.account = None
+        self.robot = None
+        self.is_trading = False
+
+        quot_queue = asyncio.Queue if self.is_backtest() else ConflateQueue
+        # 信号优先级/合并只用于实盘, 回测按产生顺序逐个处理, 保证结果可复现
+        signal_queue = asyncio.Queue if self.is_backtest() else SignalQueue
+        self.queue = dict(
+            account=host.queue['account'],
+            risk=quot_queue(),
+            signal=signal_queue(),
+            strategy=quot_queue(),
+            broker=asyncio.Queue(),
+            broker_event=asyncio.Queue(),
+            quotation=host.queue['quotation'],
+            robot=asyncio.Queue(),
+        )
+
+        self.depend_task = defaultdict(int)
+
+    @property
+    def running(self):
+        return self.host.running
+
+    @property
+    def quot(self):
+        return self.host.quot
+
+    def incr_depend_task(self, queue):
+        if queue in self.host_queue:
+            self.host.incr_depend_task(queue)
+            return
+        super().incr_depend_task(queue)
+
+    def decr_depend_task(self, queue):
+        if queue in self.host_queue:
+            self.host.decr_depend_task(queue)
+            return
+        super().decr_depend_task(queue)
+
+    def stop(self):
+        for name, queue in self.queue.items():
+            if name not in self.host_queue:
+                queue.put_nowait((consts.evt_term, None))
+
+    async def on_quot(self, evt, payload):
+        """
+        宿主account_task分发的行情事件
+        """
+        await self.account.on_quot(evt, payload)
+
+        origin = self.tracer.current()
+        if evt != consts.evt_quotation or self.account.broker.need_quot:
+            await self.queue['broker'].put(self.tracer.pack(evt, payload, origin))
+        if evt != consts.evt_quotation and self.robot is not None:
+            await self.queue['robot'].put(self.tracer.pack(evt, payload, origin))
+        await self.queue['risk'].put(self.tracer.pack(evt, payload, origin))
+        await self.queue['strategy'].put(self.tracer.pack(evt, payload, origin))
+
+
+class MultiTrader(Trader):
+    def __init__(self, db_trade: TradeDB, db_data: MongoDB, config: Dict):
+        super().__init__(db_trade=db_trade, db_data=db_data, config=config)
+        self.traders = {}
+
+    async def init_account(self):
+        trade_dict = self.config['trade']
+        cat, typ = trade_dict['category'], trade_dict['type']
+        if cat not in ['fund', 'stock'] or typ not in ['realtime', 'simulate']:
+            self.log.error('category/type 不正确, category={}, type={}'.format(cat, typ))
+            return False
+
+        accounts = await self.db_trade.load_account(filter=dict(status=0, category=cat, type=typ))
+        if len(accounts) == 0:
+            self.log.info('数据中没有已运行的real/simulate数据')
+            return False
+
+        quot_opt = None
+        for data in accounts:
+            acct_id = data['account_id']
+            path = os.sep.join([tempfile.gettempdir(), acct_id])
+            if os.path.exists(path):
+                with open(path) as f:
+                    pid = int(f.readline())
+                    if pid != os.getpid() and is_alive(pid):
+                        self.log.error('{}账号的进程已经存在, pid={}'.format(acct_id, pid))
+                        continue
+
+            trader = AccountTrader(host=self, account_id=acct_id)
+            account = Account(account_id=acct_id, typ=typ, db_data=self.db_data, db_trade=self.db_trade,
+                              trader=trader)
+            try:
+                if not await account.sync_from_db():
+                    self.log.error('从数据库中初始或account失败, account_id={}'.format(acct_id))
+                    continue
+                strategy = await self.db_trade.load_strategy(filter={'account_id': acct_id},
+                                                             projection=['quot_opt'], limit=1)
+            except Exception as e:
+                self.log.error('init account_id={} exception: {}, stack={}'.format(acct_id, e, traceback.format_exc()))
+                continue
+
+            opt = strategy[0]['quot_opt'] if len(strategy) > 0 else None
+            if opt is not None:
+                if quot_opt is None:
+                    quot_opt = dict(opt, codes=list(opt['codes']))
+                elif opt['frequency'] != quot_opt['frequency']:
+                    self.log.error('account_id={} 行情频率{}与{}不一致, 忽略'.format(
+                        acct_id, opt['frequency'], quot_opt['frequency']))
+                    await account.mapper.close()
+                    continue
+                else:
+                    quot_opt['codes'].extend([code for code in opt['codes'] if code not in quot_opt['codes']])
+
+            trader.account = account
+            self.traders[acct_id] = trader
+            self.write_pid(acct_id)
+            self.log.info('account_id={} inited'.format(acct_id))
+
+        if len(self.traders) == 0 or quot_opt is None:
+            self.log.error('没有可运行的账户')
+            return False
+
+        self.config['trade']['quotation'] = quot_opt
+        return True
+
+    async def start(self):
+        self.init_strategy()
+
+        is_init = await self.init_account()
+        if not is_init:
+            self.log.error('初始化账户异常')
+            return None
+        self.log.info('accounts inited, count={}'.format(len(self.traders)))
+
+        is_init = await self.init_quotation(opt=self.config['trade']['quotation'])
+        if not is_init:
+            self.log.error('初始化行情异常')
+            return None
+        self.log.info('quotation inited')
+
+        self.running = True
+
+        await self.start_monitor()
+        for name in AccountTrader.host_queue:
+            monitor.gauge_func('winq_queue_depth', self.queue[name].qsize, queue=name, account='')
+
+        await self.task_queue.put('quot_task(行情下发)')
+        self.loop.create_task(self.quot_task())
+
+        await self.task_queue.put('quot_sub_task(行情订阅)')
+        self.loop.create_task(self.general_async_task('quotation', func=self.on_quot_sub))
+
+        await self.task_queue.put('account_task(账户行情转发)')
+        self.loop.create_task(self.account_task())
+
+        for trader in self.traders.values():
+            await self.start_account_task(trader)
+
+        await self.task_queue.join()
+
+        self.tracer.dump()
+        await self.stop_monitor()
+
+        if self.offloader is not None:
+            self.offloader.shutdown()
+
+        for trader in self.traders.values():
+            await trader.account.mapper.close()
+
+        self.log.info('trader done, exit!')
+
+    async def destroy(self):
+        for trader in self.traders.values():
+            try:
+                await trader.destroy()
+            except Exception as e:
+                self.log.error('account_id={} destroy exception: {}'.format(trader.account_id, e))
+
+    def stop(self):
+        super().stop()
+        for trader in self.traders.values():
+            trader.stop()
+
+    def trace_stat(self) -> Dict:
+        stat = super().trace_stat()
+        for acct_id, trader in self.traders.items():
+            for name, queue in trader.queue.items():
+                if name not in trader.host_queue:
+                    stat['queue']['{}.{}'.format(acct_id, name)] = queue.qsize()
+        return stat
+
+    async def account_task(self):
+        for trader in self.traders.values():
+            trader.incr_depend_task('broker_event')
+            trader.incr_depend_task('broker')
+
+        task = await self.task_queue.get()
+        self.log.info('开始运行{}任务'.format(task))
+        queue = self.queue['account']
+        dropped = 0
+        while self.is_running('account'):
+            if self.running:
+                item = await queue.get()
+            else:
+                try:
+                    item = queue.get_nowait()
+                except Exception:
+                    await asyncio.sleep(1)
+                    continue
+
+            evt, payload, start = self.tracer.enter('account', queue, item)
+            if evt is not None and evt == consts.evt_term:
+                queue.task_done()
+                continue
+
+            handle_start = monitor.clock()
+            # 单个账户异常不影响其他账户
+            for acct_id, trader in self.traders.items():
+                try:
+                    await trader.on_quot(evt, payload)
+                except Exception as e:
+                    self.log.error('account_id={} account task exception: {}, stack={}'.format(
+                        acct_id, e, traceback.format_exc()))
+            self.tracer.leave('account', start)
+            queue.task_done()
+            monitor.observe('winq_queue_handle_seconds', monitor.clock() - handle_start, queue='account', account='')
+            monitor.inc('winq_queue_events_total', queue='account', account='', evt=evt)
+
+            if isinstance(queue, ConflateQueue) and queue.dropped > dropped:
+                self.log.warn('process is too slow, quotation dropped={}, merged={}'.format(
+                    queue.dropped, queue.merged))
+                dropped = queue.dropped
+
+        for trader in self.traders.values():
+            trader.decr_depend_task('broker_event')
+            trader.decr_depend_task('broker')
+
+        self.task_queue.task_done()
+        self.log.info('任务{}运行完毕'.format(task))
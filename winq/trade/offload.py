@@ -0,0 +1,114 @@
+"""
+策略计算后台执行(实盘/模拟)
+
+计算量大的策略(上百个代码的指标计算等)直接在事件循环中执行 on_quot 会阻塞行情、风控、券商反馈。
+策略实现 compute 后可把计算放到线程池/进程池中执行:
+1. compute(state, evt, payload) 运行在worker中, 只能使用传入的策略参数(compute_state)和行情, 不能访问账户/trader;
+   进程池要求 compute 为可pickle的函数(staticmethod), state/返回值可pickle
+2. on_compute(evt, payload, result) 在事件循环中根据计算结果产生信号, 信号仍经过signal队列
+3. 每个策略同时只有一个计算, 计算期间到达的行情只保留最新一个, 旧的未开始的计算被取消;
+   drop_stale=True 时计算完成后若已有更新的行情, 丢弃该结果
+4. 回测时不使用后台计算, 按顺序执行保证结果可重复
+
+配置:
+trade:
+  offload:
+    mode: thread  # thread/process
+    workers: 4
+    drop_stale: false
+"""
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Optional
+import winq.log as log
+import winq.trade.consts as consts
+
+
+class Offloader:
+    def __init__(self, mode: str = 'thread', workers: Optional[int] = None, drop_stale: bool = False):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.mode = mode
+        self.workers = workers
+        self.drop_stale = drop_stale
+
+        self.executor = None
+
+    @classmethod
+    def from_config(cls, opt: Optional[Dict]) -> Optional['Offloader']:
+        if opt is None:
+            return None
+        mode = opt['mode'] if 'mode' in opt else 'thread'
+        if mode not in ['thread', 'process']:
+            log.get_logger(cls.__name__).error('invalid offload mode: {}'.format(mode))
+            return None
+        return cls(mode=mode,
+                   workers=int(opt['workers']) if 'workers' in opt else None,
+                   drop_stale=bool(opt['drop_stale']) if 'drop_stale' in opt else False)
+
+    def get_executor(self):
+        if self.executor is None:
+            if self.mode == 'process':
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='offload')
+        return self.executor
+
+    def bind(self, strategy) -> 'OffloadRunner':
+        return OffloadRunner(self, strategy)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class OffloadRunner:
+    """
+    单个策略的后台计算, on_quot 替代 strategy.on_quot 作为策略任务的处理函数
+    """
+
+    def __init__(self, offloader: Offloader, strategy):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.offloader = offloader
+        self.strategy = strategy
+
+        self.seq = 0
+        self.running = None  # 正在计算的行情序号
+        self.pending = None  # (seq, evt, payload) 计算期间到达的最新行情
+
+    async def on_quot(self, evt, payload):
+        if evt != consts.evt_quotation:
+            await self.strategy.on_quot(evt, payload)
+            return
+
+        self.seq += 1
+        if self.running is not None:
+            # 旧的未开始的计算直接被最新行情替换
+            self.pending = (self.seq, evt, payload)
+            return
+        self.submit(self.seq, evt, payload)
+
+    def submit(self, seq, evt, payload):
+        self.running = seq
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(self.offloader.get_executor(), self.strategy.compute,
+                                      self.strategy.compute_state(), evt, payload)
+        loop.create_task(self.on_done(seq, evt, payload, future))
+
+    async def on_done(self, seq, evt, payload, future):
+        try:
+            result = await future
+            if self.offloader.drop_stale and self.seq > seq:
+                self.log.debug('strategy compute result is stale, drop: seq={}, latest={}'.format(seq, self.seq))
+            else:
+                await self.strategy.on_compute(evt, payload, result)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.log.error('strategy compute exception: {}, stack={}'.format(e, traceback.format_exc()))
+        finally:
+            self.running = None
+            if self.pending is not None:
+                pending, self.pending = self.pending, None
+                self.submit(*pending)
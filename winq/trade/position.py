@@ -1,12 +1,19 @@
-from winq.trade.base_obj import BaseObj
+from winq.trade.base_obj import BaseRecord
 from datetime import datetime
 import sys
+import winq.log as log
 
 
-class Position(BaseObj):
+class Position(BaseRecord):
+    __slots__ = ('position_id', 'name', 'code', 'time', 'volume', 'volume_available', 'volume_frozen',
+                 'fee', 'price', 'now_price', 'max_price', 'min_price',
+                 'profit_rate', 'max_profit_rate', 'min_profit_rate',
+                 'profit', 'max_profit', 'min_profit', 'max_profit_time', 'min_profit_time')
+
+    log = log.get_logger('Position')
+
     def __init__(self, position_id: str, account):
-        super().__init__(typ=account.typ, db_data=account.db_data, db_trade=account.db_trade, trader=account.trader)
-        self.account = account
+        super().__init__(account=account)
 
         self.position_id = position_id
 
@@ -37,48 +44,14 @@ class Position(BaseObj):
         self.min_profit_time = None  # 最小盈利时间
 
     async def on_quot(self, payload):
+        """
+        更新最新价，盈亏由account.update_position统一计算，不写库，由account合并写入
+        :param payload: 单个代码的行情
+        """
         self.now_price = payload['close']
-        self.max_price = self.now_price if self.max_price < self.now_price else self.max_price
-        self.min_price = self.now_price if self.min_price > self.now_price else self.min_price
-
-        self.profit = (self.now_price - self.price) * self.volume - self.fee
-        self.profit_rate = self.profit / (self.price * self.volume + self.fee)
-        if self.profit > self.max_profit:
-            self.max_profit = self.profit
-            self.max_profit_time = payload['day_time']
-            self.max_profit_rate = self.profit_rate
-
-        if self.profit < self.max_profit:
-            self.min_profit = self.profit
-            self.min_profit_time = payload['day_time']
-            self.min_profit_rate = self.profit_rate
-
-        await self.sync_to_db()
 
     async def sync_from_db(self) -> bool:
-        position = await self.db_trade.load_position(filter={'position_id': self.position_id}, limit=1)
-        position = None if len(position) == 0 else position[0]
-        if position is None:
-            self.log.error('position from db not found: {}'.format(self.position_id))
-            return False
-        self.from_dict(position)
-        return True
-
-    @BaseObj.discard_saver
-    async def sync_to_db(self) -> bool:
-        data = {'account_id': self.account.account_id,
-                'position_id': self.position_id, 'name': self.name, 'code': self.code,
-                'volume': self.volume, 'volume_available': self.volume_available,
-                'fee': self.fee, 'price': self.price,
-                'profit_rate': self.profit_rate,
-                'max_profit_rate': self.max_profit_rate, 'min_profit_rate': self.min_profit_rate,
-                'profit': self.profit, 'max_profit': self.max_profit, 'min_profit': self.min_profit,
-                'now_price': self.now_price, 'max_price': self.max_price, 'min_price': self.min_price,
-                'max_profit_time': self.max_profit_time, 'min_profit_time': self.min_profit_time,
-                'time': self.time
-                }
-        await self.db_trade.save_position(data=data)
-        return True
+        return await self.account.mapper.load_position(self)
 
     def from_dict(self, data):
         self.name = data['name']
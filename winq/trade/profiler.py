@@ -0,0 +1,186 @@
+"""
+运行中采样分析(实盘/模拟)
+
+不重启进程分析变慢的trader:
+1. 采样: 每interval秒(进程CPU时间, SIGPROF定时器)记录事件循环线程的调用栈, 不修改被分析的代码,
+   开销只与采样频率有关, 空闲等待不计入; 不支持SIGPROF时(windows/非主线程)由后台线程采样.
+   停止时写出折叠栈文件(flamegraph.pl / speedscope 可直接打开), 并按处理函数
+   (general_async_task/account_task 调用的 策略/风控/券商/账户 函数)输出耗时占比
+2. 任务: 输出所有未完成的asyncio任务及其当前调用位置, 以及各队列深度
+
+触发方式:
+- kill -USR1 <pid> 开始/停止采样, kill -USR2 <pid> 输出任务及队列
+- 开启monitor HTTP时: /profile 开始/停止采样, /tasks 输出任务及队列
+
+配置:
+trade:
+  profile:
+    path: ~/.config/winq/profile  # 输出目录, 默认report-path
+    interval: 0.005  # 采样间隔(秒)
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+import winq.log as log
+import winq.monitor as monitor
+
+_wrapper_file = monitor.__file__
+
+# 调用处理函数的任务函数, 其下一层即为归属的处理函数
+_dispatch_func = ('general_async_task', 'account_task')
+
+
+class Profiler:
+    def __init__(self, path: str, interval: float = 0.005):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.path = os.path.expanduser(path)
+        self.interval = interval
+
+        self.samples = Counter()
+        self.handlers = Counter()
+        self.labels = {}
+
+        self.thread = None
+        self.thread_id = None
+        self.use_timer = False
+        self.running = False
+        self.start_time = None
+
+    @classmethod
+    def from_config(cls, opt: Optional[Dict], path: str) -> 'Profiler':
+        if opt is None:
+            return cls(path=path)
+        return cls(path=opt['path'] if 'path' in opt and opt['path'] is not None else path,
+                   interval=float(opt['interval']) if 'interval' in opt else 0.005)
+
+    def is_running(self) -> bool:
+        return self.running
+
+    def start(self) -> bool:
+        """
+        在事件循环线程中调用
+        """
+        if self.running:
+            return False
+        self.samples.clear()
+        self.handlers.clear()
+        self.thread_id = threading.get_ident()
+        self.running = True
+        self.start_time = datetime.now()
+        # 线程采样只能在线程释放GIL时取到栈, 偏向I/O等待, 优先使用SIGPROF
+        self.use_timer = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+        if self.use_timer:
+            signal.signal(signal.SIGPROF, self.on_timer)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.thread = threading.Thread(target=self.sample_thread, name='profiler', daemon=True)
+            self.thread.start()
+        self.log.info('profile started, interval={}s, timer={}'.format(self.interval, self.use_timer))
+        return True
+
+    def stop(self) -> Optional[str]:
+        """
+        停止采样并写出折叠栈文件
+        :return: 文件路径
+        """
+        if not self.running:
+            return None
+        self.running = False
+        if self.use_timer:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_IGN)
+        else:
+            self.thread.join()
+            self.thread = None
+        return self.dump()
+
+    def toggle(self) -> str:
+        if self.running:
+            file = self.stop()
+            return 'profile stopped, file={}'.format(file)
+        self.start()
+        return 'profile started'
+
+    def label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            name = code.co_qualname if hasattr(code, 'co_qualname') else code.co_name
+            label = '{} ({}:{})'.format(name, os.path.basename(code.co_filename), code.co_firstlineno)
+            self.labels[code] = label
+        return label
+
+    def on_timer(self, signum, frame):
+        if self.running and frame is not None:
+            self.record(frame)
+
+    def sample_thread(self):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.record(frame)
+
+    def record(self, frame):
+        stack, handler, callee = [], None, None
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name in _dispatch_func and callee is not None:
+                handler = callee
+            label = self.label(code)
+            stack.append(label)
+            # 跳过指标统计的装饰器
+            if code.co_filename != _wrapper_file:
+                callee = label
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+        self.handlers[handler if handler is not None else '(loop)'] += 1
+
+    def dump(self) -> Optional[str]:
+        total = sum(self.samples.values())
+        if total == 0:
+            self.log.info('profile stopped, no sample')
+            return None
+        seconds = (datetime.now() - self.start_time).total_seconds()
+        self.log.info('profile stopped, samples={}, duration={:.1f}s'.format(total, seconds))
+        for handler, count in self.handlers.most_common(20):
+            self.log.info('profile {:6.2f}% {}'.format(count * 100 / total, handler))
+
+        os.makedirs(self.path, exist_ok=True)
+        file = os.path.join(self.path, 'profile-{}-{}.folded'.format(
+            os.getpid(), self.start_time.strftime('%Y%m%d%H%M%S')))
+        with open(file, 'w') as f:
+            for stack, count in self.samples.items():
+                f.write('{} {}\n'.format(stack, count))
+        return file
+
+
+def task_dump(queues: Dict[str, int]) -> List[str]:
+    """
+    在事件循环线程中调用, 输出未完成的asyncio任务及队列深度
+    """
+    lines = ['queue {}: {}'.format(name, size) for name, size in queues.items()]
+    tasks = asyncio.all_tasks()
+    lines.append('tasks: {}'.format(len(tasks)))
+    for task in tasks:
+        coro = task.get_coro()
+        name = coro.__qualname__ if hasattr(coro, '__qualname__') else str(coro)
+        # 沿await链找到最内层正在等待的位置
+        frame, inner = None, coro
+        while inner is not None:
+            inner_frame = getattr(inner, 'cr_frame', None) or getattr(inner, 'gi_frame', None)
+            if inner_frame is None:
+                break
+            frame = inner_frame
+            inner = getattr(inner, 'cr_await', None) or getattr(inner, 'gi_yieldfrom', None)
+        where = ''
+        if frame is not None:
+            where = ' at {} ({}:{})'.format(frame.f_code.co_name, os.path.basename(frame.f_code.co_filename),
+                                           frame.f_lineno)
+        lines.append('task {}: {}{}'.format(task.get_name(), name, where))
+    return lines
@@ -6,10 +6,13 @@ from winq.common import is_fund, is_stock
 import hiq_pyfetch as fetch
 import winq.log as log
 from winq.data.mongodb import MongoDB
+from winq.data.panel import SharedPanel
 import traceback
 from winq.data.winqdb import WinQDB
 import winq.trade.consts as consts
+import winq.monitor as monitor
 import pandas as pd
+import numpy as np
 
 """
 行情下发顺序：
@@ -430,6 +433,16 @@ class BacktestQuotation(Quotation):
 
         return True
 
+    def seek(self, day_time) -> bool:
+        """
+        跳过day_time及之前的行情(回测断点恢复)
+        """
+        self.iter = iter([key for key in self.bar if key > day_time])
+        self.iter_tag = True
+        self.end_quot_tag = False
+        self.quot_date.clear()
+        return True
+
     async def get_quot(self) -> Optional[Tuple[Optional[str], Optional[Dict]]]:
         now = datetime.now()
         start = now
@@ -493,6 +506,67 @@ class BacktestQuotation(Quotation):
         return None, None
 
 
+class PanelQuotation(BacktestQuotation):
+    """
+    使用预先加载的行情面板(SharedPanel)回测，不访问数据库，面板中的日期即交易日
+    """
+
+    def __init__(self, panel: SharedPanel, index: Sequence = (), db: MongoDB = None):
+        super().__init__(db=db)
+
+        self.panel = panel
+        self.panel_index = list(index)
+        self.trade_dates = set(panel.dates.normalize().to_pydatetime())
+
+    async def add_code(self, codes) -> bool:
+        new_codes = [code for code in codes if code not in self.codes and code in self.panel.code_index]
+        if len(new_codes) == 0:
+            return False
+
+        self.codes = self.codes + new_codes
+        self.index = [code for code in self.codes if code in self.panel_index]
+        self.code_info.update({code: self.panel.names.get(code, '') for code in new_codes})
+
+        code_index = [self.panel.code_index[code] for code in new_codes]
+        fields = self.panel.fields
+        close = self.panel.field('close')[:, code_index]
+        for i, trade_time in enumerate(self.panel.dates.to_pydatetime()):
+            valid = ~np.isnan(close[i])
+            if not valid.any():
+                continue
+            trade_date = datetime(year=trade_time.year, month=trade_time.month, day=trade_time.day)
+            day_time = trade_time
+            if self.day_frequency != 0:
+                day_time = trade_date + timedelta(hours=15)
+
+            values = self.panel.data[:, i, code_index]
+            bar = self.bar.setdefault(day_time, OrderedDict())
+            for j in np.nonzero(valid)[0]:
+                code = new_codes[j]
+                data = dict(zip(fields, values[:, j].tolist()))
+                data.update(code=code, name=self.code_info[code], trade_date=trade_date, day_time=day_time)
+                bar[code] = data
+
+        if self.day_time is None:
+            self.bar = OrderedDict(sorted(self.bar.items()))
+            self.iter = iter(self.bar)
+
+        return True
+
+    async def get_status_dict(self, now):
+        date_now = datetime(year=now.year, month=now.month, day=now.day)
+        if len(self.quot_date) == 0 or date_now not in self.quot_date:
+            self.trade_date = None
+            self.quot_date.clear()
+            self.quot_date[date_now] = dict(is_open=date_now in self.trade_dates,
+                                            evt_morning_start=False,
+                                            evt_morning_end=False,
+                                            evt_noon_start=False,
+                                            evt_noon_end=False)
+        self.trade_date = date_now
+        return self.quot_date[date_now]
+
+
 class RealtimeQuotation(Quotation):
     def __init__(self, db: MongoDB):
         super().__init__(db=db)
@@ -589,9 +663,12 @@ class RealtimeQuotation(Quotation):
 
             quot = None
             if self.is_trading():
-                quots = fetch.fetch_stock_rt_quote(codes=self.codes)
+                with monitor.timer('winq_quot_fetch_seconds'):
+                    quots = fetch.fetch_stock_rt_quote(codes=self.codes)
                 if quots is not None:
                     quot = self.pub_bar(now, quots)
+                else:
+                    monitor.inc('winq_quot_fetch_errors_total')
 
             if quot is not None:
                 self.reset_bar(now)
@@ -0,0 +1,132 @@
+"""
+回测记录器
+
+回测过程中信号、成交、每日账户及持仓快照直接按列追加原始值(数值列使用array, 时间保持datetime)，
+不再逐条to_dict/strftime，结束时一次性生成DataFrame，写出为Parquet文件(没有安装pyarrow时写出pickle):
+- equity.parquet 每个交易日收盘的账户数据(字段同 Account.to_dict(skip_obj=True), 时间为datetime)
+- deal.parquet 成交
+- signal.parquet 交易信号
+- position.parquet 每个交易日收盘的持仓
+"""
+import os
+from array import array
+from typing import Dict, List, Optional
+import pandas as pd
+import winq.log as log
+
+
+class Recorder:
+    # 表名: [(列名, 类型)], 类型 d: float, q: int, o: object
+    tables = {
+        'equity': [('status', 'q'), ('category', 'o'), ('type', 'o'),
+                   ('cash_init', 'd'), ('cash_available', 'd'), ('cash_frozen', 'd'),
+                   ('total_net_value', 'd'), ('total_hold_value', 'd'), ('cost', 'd'),
+                   ('broker_fee', 'd'), ('transfer_fee', 'd'), ('tax_fee', 'd'),
+                   ('profit', 'd'), ('profit_rate', 'd'), ('close_profit', 'd'),
+                   ('total_profit', 'd'), ('total_profit_rate', 'd'), ('start_time', 'o'), ('end_time', 'o')],
+        'deal': [('time', 'o'), ('deal_id', 'o'), ('entrust_id', 'o'), ('name', 'o'), ('code', 'o'),
+                 ('type', 'o'), ('volume', 'q'), ('price', 'd'), ('fee', 'd'), ('profit', 'd')],
+        'signal': [('time', 'o'), ('signal_id', 'o'), ('source', 'o'), ('source_name', 'o'), ('signal', 'o'),
+                   ('name', 'o'), ('code', 'o'), ('volume', 'q'), ('price', 'd'), ('desc', 'o')],
+        'position': [('end_time', 'o'), ('position_id', 'o'), ('name', 'o'), ('code', 'o'),
+                     ('volume', 'q'), ('volume_available', 'q'), ('fee', 'd'), ('price', 'd'),
+                     ('now_price', 'd'), ('profit', 'd'), ('profit_rate', 'd')],
+    }
+
+    def __init__(self, account_id: str):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.account_id = account_id
+        self.buffer = {}
+        self.frames = {}
+        for table in self.tables:
+            self.reset(table)
+
+    def reset(self, table: str):
+        self.buffer[table] = {col: [] if typ == 'o' else array(typ) for col, typ in self.tables[table]}
+        self.frames.pop(table, None)
+
+    def append(self, table: str, *values):
+        """
+        按tables中定义的列顺序追加一行
+        """
+        for buf, value in zip(self.buffer[table].values(), values):
+            buf.append(value)
+        self.frames.pop(table, None)
+
+    def record_signal(self, sig):
+        self.append('signal', sig.time, sig.signal_id, sig.source, sig.source_name, sig.signal,
+                    sig.name, sig.code, int(sig.volume), float(sig.price), sig.desc)
+
+    def record_deal(self, deal):
+        self.append('deal', deal.time, deal.deal_id, deal.entrust_id, deal.name, deal.code,
+                    deal.type, int(deal.volume), float(deal.price), float(deal.fee), float(deal.profit))
+
+    def record_equity(self, account):
+        self.append('equity', int(account.status), account.category, account.typ,
+                    float(account.cash_init), float(account.cash_available),
+                    float(account.cash_frozen), float(account.total_net_value), float(account.total_hold_value),
+                    float(account.cost), float(account.broker_fee), float(account.transfer_fee),
+                    float(account.tax_fee), float(account.profit), float(account.profit_rate),
+                    float(account.close_profit), float(account.total_profit), float(account.total_profit_rate),
+                    account.start_time, account.end_time)
+        for position in account.position.values():
+            self.append('position', account.end_time, position.position_id, position.name, position.code,
+                        int(position.volume), int(position.volume_available), float(position.fee),
+                        float(position.price), float(position.now_price), float(position.profit),
+                        float(position.profit_rate))
+
+    def set_frame(self, table: str, df: pd.DataFrame):
+        """
+        直接设置整表(向量化回测)
+        """
+        self.reset(table)
+        self.frames[table] = df
+
+    def size(self, table: str) -> int:
+        if table in self.frames:
+            return len(self.frames[table])
+        buf = self.buffer[table]
+        return len(next(iter(buf.values())))
+
+    def frame(self, table: str) -> pd.DataFrame:
+        if table not in self.frames:
+            df = pd.DataFrame({col: buf for col, buf in self.buffer[table].items()})
+            df.insert(0, 'account_id', self.account_id)
+            self.frames[table] = df
+        return self.frames[table]
+
+    def records(self, table: str) -> List[Dict]:
+        return self.frame(table).to_dict('records')
+
+    def save(self, path: str) -> Optional[Dict]:
+        """
+        写出Parquet文件, 没有Parquet引擎时写出pickle
+        :param path: 目录
+        :return: 表名: 文件路径
+        """
+        os.makedirs(path, exist_ok=True)
+        files = {}
+        for table in self.tables:
+            file = os.path.join(path, '{}.parquet'.format(table))
+            try:
+                try:
+                    self.frame(table).to_parquet(file, index=False)
+                except ImportError:
+                    file = os.path.join(path, '{}.pkl'.format(table))
+                    self.frame(table).to_pickle(file)
+            except Exception as e:
+                self.log.error('save {} failed: {}'.format(file, e))
+                return None
+            files[table] = file
+        return files
+
+    @staticmethod
+    def load(path: str, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        读取Parquet文件(pyarrow 支持memory_map), 没有时读取save写出的pickle
+        """
+        file = os.path.join(path, '{}.pkl'.format(table))
+        if not os.path.exists(os.path.join(path, '{}.parquet'.format(table))) and os.path.exists(file):
+            df = pd.read_pickle(file)
+            return df[columns] if columns is not None else df
+        return pd.read_parquet(os.path.join(path, '{}.parquet'.format(table)), columns=columns, memory_map=True)
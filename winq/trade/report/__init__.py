@@ -1,4 +1,2 @@
 from .report import Report
-
-
-
+from .metrics import curve_metrics, account_metrics, trade_stats
@@ -0,0 +1,349 @@
+"""
+绩效指标(向量化)
+
+净值曲线按时间为第0维:
+- 一维数组/Series: 单个回测, 指标返回标量
+- 二维数组(T x N)/DataFrame: N条曲线(参数扫描等), 指标返回长度N的数组/Series, 一次计算上千条曲线
+长度不同的曲线末尾用NaN补齐即可, 收益/回撤计算忽略NaN。
+
+rolling_* 为滚动窗口版本, 每行使用截至该行最近window个净值(即window-1个收益), 返回与输入同形状,
+前window-1行及窗口内有NaN(补齐部分)的行为NaN。
+
+periods 为每年的bar数, 日线252, 分钟线按实际频率传入(如5分钟线 252 * 48)。
+"""
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+
+periods_per_year = 252
+
+# 滚动回撤每批计算的元素数上限, 控制内存
+_rolling_chunk = 10_000_000
+
+
+def _prepare(data):
+    """
+    :return: (二维float数组, 原始pandas对象或None, 是否单条曲线)
+    """
+    orig = data if isinstance(data, (pd.Series, pd.DataFrame)) else None
+    arr = np.asarray(data, dtype=float)
+    single = arr.ndim == 1
+    if single:
+        arr = arr[:, None]
+    return arr, orig, single
+
+
+def _result(values: np.ndarray, orig, single):
+    if single:
+        return float(values[0])
+    if isinstance(orig, pd.DataFrame):
+        return pd.Series(values, index=orig.columns)
+    return values
+
+
+def _frame(values: np.ndarray, orig, single):
+    if single:
+        values = values[:, 0]
+        return pd.Series(values, index=orig.index) if orig is not None else values
+    if isinstance(orig, pd.DataFrame):
+        return pd.DataFrame(values, index=orig.index, columns=orig.columns)
+    return values
+
+
+def _returns(eq: np.ndarray) -> np.ndarray:
+    ret = np.full(eq.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret[1:] = eq[1:] / eq[:-1] - 1
+    return ret
+
+
+def _drawdown(eq: np.ndarray) -> np.ndarray:
+    peak = np.fmax.accumulate(eq, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - eq / peak
+
+
+def _first_last(eq: np.ndarray):
+    valid = ~np.isnan(eq)
+    count = valid.sum(axis=0)
+    first_idx = valid.argmax(axis=0)
+    last_idx = eq.shape[0] - 1 - valid[::-1].argmax(axis=0)
+    cols = np.arange(eq.shape[1])
+    return eq[first_idx, cols], eq[last_idx, cols], count
+
+
+def returns(equity):
+    """
+    逐bar收益率, 第一行为NaN
+    """
+    eq, orig, single = _prepare(equity)
+    return _frame(_returns(eq), orig, single)
+
+
+def drawdown(equity):
+    """
+    回撤序列(相对历史最高点的跌幅, 0~1)
+    """
+    eq, orig, single = _prepare(equity)
+    return _frame(_drawdown(eq), orig, single)
+
+
+def total_return(equity):
+    eq, orig, single = _prepare(equity)
+    first, last, _ = _first_last(eq)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _result(last / first - 1, orig, single)
+
+
+def annual_return(equity, periods: int = periods_per_year):
+    eq, orig, single = _prepare(equity)
+    first, last, count = _first_last(eq)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.power(last / first, periods / np.maximum(count - 1, 1)) - 1
+    return _result(np.where(count > 1, value, np.nan), orig, single)
+
+
+def volatility(equity, periods: int = periods_per_year):
+    """
+    年化波动率
+    """
+    eq, orig, single = _prepare(equity)
+    with np.errstate(invalid='ignore'):
+        value = np.nanstd(_returns(eq), axis=0, ddof=1) * np.sqrt(periods)
+    return _result(value, orig, single)
+
+
+def sharpe(equity, rf: float = 0.0, periods: int = periods_per_year):
+    """
+    年化夏普比率
+    :param rf: 年化无风险利率
+    """
+    eq, orig, single = _prepare(equity)
+    ret = _returns(eq) - rf / periods
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.nanstd(ret, axis=0, ddof=1)
+        value = np.nanmean(ret, axis=0) / std * np.sqrt(periods)
+    return _result(np.where(std > 0, value, np.nan), orig, single)
+
+
+def sortino(equity, rf: float = 0.0, periods: int = periods_per_year):
+    """
+    年化索提诺比率(下行波动)
+    """
+    eq, orig, single = _prepare(equity)
+    ret = _returns(eq) - rf / periods
+    with np.errstate(divide='ignore', invalid='ignore'):
+        down = np.sqrt(np.nanmean(np.minimum(ret, 0) ** 2, axis=0))
+        value = np.nanmean(ret, axis=0) / down * np.sqrt(periods)
+    return _result(np.where(down > 0, value, np.nan), orig, single)
+
+
+def max_drawdown(equity):
+    """
+    最大回撤(0~1)
+    """
+    eq, orig, single = _prepare(equity)
+    with np.errstate(invalid='ignore'):
+        value = np.nanmax(_drawdown(eq), axis=0)
+    return _result(value, orig, single)
+
+
+def max_drawdown_duration(equity):
+    """
+    最长回撤持续bar数(从前高到收复前高)
+    """
+    eq, orig, single = _prepare(equity)
+    under = _drawdown(eq) > 0
+    idx = np.arange(eq.shape[0])[:, None]
+    last_peak = np.maximum.accumulate(np.where(under, -1, idx), axis=0)
+    value = np.where(under, idx - last_peak, 0).max(axis=0)
+    return _result(value.astype(float), orig, single)
+
+
+def calmar(equity, periods: int = periods_per_year):
+    """
+    年化收益 / 最大回撤
+    """
+    eq, orig, single = _prepare(equity)
+    ar, mdd = annual_return(eq, periods=periods), max_drawdown(eq)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = ar / mdd
+    return _result(np.where(mdd > 0, value, np.nan), orig, single)
+
+
+def turnover(traded, equity, periods: int = periods_per_year):
+    """
+    年化换手率: 单边成交额(买卖合计/2) / 平均净值
+    :param traded: 每个bar的成交额(买+卖), 与equity同形状
+    """
+    eq, orig, single = _prepare(equity)
+    traded, _, _ = _prepare(traded)
+    count = (~np.isnan(eq)).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.nansum(traded, axis=0) / 2 / np.nanmean(eq, axis=0) * periods / np.maximum(count, 1)
+    return _result(value, orig, single)
+
+
+def exposure(hold, equity):
+    """
+    平均仓位: 持仓市值 / 净值 的均值
+    """
+    eq, orig, single = _prepare(equity)
+    hold, _, _ = _prepare(hold)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.nanmean(hold / eq, axis=0)
+    return _result(value, orig, single)
+
+
+def trade_stats(profit, group=None) -> pd.DataFrame:
+    """
+    平仓盈亏统计: 次数, 胜率, 盈亏比, 平均盈利/亏损
+    :param profit: 每笔卖出的盈亏
+    :param group: 每笔对应的曲线/账户标识, None为同一组
+    :return: 每组一行
+    """
+    profit = np.asarray(profit, dtype=float)
+    if group is None:
+        keys, inverse = np.array([0]), np.zeros(profit.shape[0], dtype=int)
+    else:
+        keys, inverse = np.unique(np.asarray(group), return_inverse=True)
+    n = keys.shape[0]
+    win = profit > 0
+
+    count = np.bincount(inverse, minlength=n)
+    win_count = np.bincount(inverse, weights=win, minlength=n)
+    win_sum = np.bincount(inverse, weights=np.where(win, profit, 0.0), minlength=n)
+    loss_sum = np.bincount(inverse, weights=np.where(win, 0.0, profit), minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        data = dict(trade_count=count,
+                    win_rate=win_count / count,
+                    profit_factor=np.where(loss_sum < 0, win_sum / -loss_sum, np.nan),
+                    avg_win=win_sum / win_count,
+                    avg_loss=loss_sum / (count - win_count),
+                    total_profit=win_sum + loss_sum)
+    return pd.DataFrame(data, index=keys if group is not None else None)
+
+
+def curve_metrics(equity, rf: float = 0.0, periods: int = periods_per_year) -> pd.DataFrame:
+    """
+    净值曲线汇总指标, 每条曲线一行
+    """
+    eq, orig, single = _prepare(equity)
+    data = dict(total_return=total_return(eq),
+                annual_return=annual_return(eq, periods=periods),
+                volatility=volatility(eq, periods=periods),
+                sharpe=sharpe(eq, rf=rf, periods=periods),
+                sortino=sortino(eq, rf=rf, periods=periods),
+                max_drawdown=max_drawdown(eq),
+                max_drawdown_duration=max_drawdown_duration(eq),
+                calmar=calmar(eq, periods=periods))
+    index = orig.columns if isinstance(orig, pd.DataFrame) else None
+    return pd.DataFrame(data, index=index)
+
+
+def account_metrics(acct_his: pd.DataFrame, deal: Optional[pd.DataFrame] = None,
+                    rf: float = 0.0, periods: int = periods_per_year) -> Dict:
+    """
+    单个账户的指标
+    :param acct_his: 账户每日快照(Account.recorder.frame('equity') / load_account_his)
+    :param deal: 成交(Account.recorder.frame('deal') / load_deal)
+    """
+    if acct_his is None or len(acct_his) == 0:
+        return {}
+    acct_his = pd.DataFrame(acct_his)
+    equity = acct_his['total_net_value'].to_numpy(dtype=float)
+    data = curve_metrics(equity, rf=rf, periods=periods).iloc[0].to_dict()
+    data['exposure'] = exposure(acct_his['total_hold_value'].to_numpy(dtype=float), equity)
+    data['turnover'] = 0.0
+
+    deal = pd.DataFrame(deal) if deal is not None else pd.DataFrame()
+    if not deal.empty:
+        days = pd.to_datetime(acct_his['end_time']).dt.normalize().to_numpy()
+        deal_days = pd.to_datetime(deal['time']).dt.normalize().to_numpy()
+        pos = np.clip(np.searchsorted(days, deal_days), 0, len(days) - 1)
+        traded = np.bincount(pos, weights=(deal['price'] * deal['volume']).to_numpy(dtype=float),
+                             minlength=len(days))
+        data['turnover'] = turnover(traded, equity, periods=periods)
+
+        sells = deal[deal['type'] == 'sell']
+        if not sells.empty:
+            data.update(trade_stats(sells['profit']).iloc[0].to_dict())
+    return data
+
+
+def rolling_return(equity, window: int):
+    """
+    滚动窗口收益(窗口内最后一个净值 / 第一个净值 - 1)
+    """
+    eq, orig, single = _prepare(equity)
+    value = np.full(eq.shape, np.nan)
+    if 0 < window <= eq.shape[0]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value[window - 1:] = eq[window - 1:] / eq[:eq.shape[0] - window + 1] - 1
+    return _frame(value, orig, single)
+
+
+def _rolling_moments(ret: np.ndarray, window: int):
+    """
+    每行最近window个净值对应的window-1个收益(ret[t-window+2..t])的均值和标准差
+    """
+    out_mean, out_std = np.full(ret.shape, np.nan), np.full(ret.shape, np.nan)
+    if window < 2 or window > ret.shape[0]:
+        return out_mean, out_std
+
+    valid = ~np.isnan(ret)
+    zero = np.zeros((1, ret.shape[1]))
+    s1 = np.concatenate([zero, np.cumsum(np.where(valid, ret, 0.0), axis=0)])
+    s2 = np.concatenate([zero, np.cumsum(np.where(valid, ret * ret, 0.0), axis=0)])
+    cnt = np.concatenate([zero, np.cumsum(valid, axis=0)])
+
+    # 第t行: 前缀和[t+1] - 前缀和[t-window+2]
+    end, start = slice(window, None), slice(1, ret.shape[0] - window + 2)
+    n = cnt[end] - cnt[start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (s1[end] - s1[start]) / n
+        var = ((s2[end] - s2[start]) - n * mean * mean) / (n - 1)
+    std = np.sqrt(np.maximum(var, 0))
+
+    full = n == window - 1
+    out_mean[window - 1:], out_std[window - 1:] = np.where(full, mean, np.nan), np.where(full & (n > 1), std, np.nan)
+    return out_mean, out_std
+
+
+def rolling_volatility(equity, window: int, periods: int = periods_per_year):
+    """
+    滚动窗口年化波动率
+    """
+    eq, orig, single = _prepare(equity)
+    _, std = _rolling_moments(_returns(eq), window)
+    return _frame(std * np.sqrt(periods), orig, single)
+
+
+def rolling_sharpe(equity, window: int, rf: float = 0.0, periods: int = periods_per_year):
+    """
+    滚动窗口年化夏普比率
+    """
+    eq, orig, single = _prepare(equity)
+    mean, std = _rolling_moments(_returns(eq) - rf / periods, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.where(std > 0, mean / std * np.sqrt(periods), np.nan)
+    return _frame(value, orig, single)
+
+
+def rolling_max_drawdown(equity, window: int):
+    """
+    滚动窗口最大回撤, 分批计算控制内存
+    """
+    eq, orig, single = _prepare(equity)
+    value = np.full(eq.shape, np.nan)
+    total = eq.shape[0] - window + 1
+    if window > 0 and total > 0:
+        view = np.lib.stride_tricks.sliding_window_view(eq, window, axis=0)  # (total, N, window)
+        step = max(1, _rolling_chunk // max(1, eq.shape[1] * window))
+        for start in range(0, total, step):
+            chunk = view[start:start + step]
+            peak = np.fmax.accumulate(chunk, axis=-1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                dd = np.max(1 - chunk / peak, axis=-1)
+            value[window - 1 + start:window - 1 + start + chunk.shape[0]] = dd
+    return _frame(value, orig, single)
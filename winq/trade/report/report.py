@@ -1,6 +1,9 @@
 # from ..account import Account
+import os
 from datetime import datetime
-from typing import Optional, Sequence
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+import numpy as np
 import pandas as pd
 import hiq_pyfetch as fetch
 from pyecharts import options as opts
@@ -8,6 +11,8 @@ from pyecharts.charts import *
 from pyecharts.charts.chart import Chart
 from winq.analyse.plot import \
     up_color, down_color, mix_color, plot_overlap, my_plot, plot_chart
+from winq.analyse.downsample import downsample_index, line_budget
+from winq.trade.report.metrics import account_metrics
 from winq.data import FundDB
 from pyecharts.components import Table
 from pyecharts.options import ComponentTitleOpts
@@ -46,6 +51,9 @@ class Report:
     scale_down = 0.995
     scale_up = 1.005
 
+    # 图表点数预算, 超过后降采样
+    point_budget = line_budget
+
     def __init__(self, account):
         self.account = account
         self.db_data = account.db_data
@@ -55,6 +63,7 @@ class Report:
         self.acct_his = None
         self.deal_his = None
         self.trade_date = []
+        self.trade_days = pd.DatetimeIndex([])
 
         self.codes = []
         self.daily = None
@@ -70,23 +79,77 @@ class Report:
         return datetime(year=d.year, month=d.month, day=d.day)
 
     @staticmethod
-    def _to_x_data(lst, target='str'):
-        data = []
-        is_list = True
-        if not isinstance(lst, list):
-            lst = [lst]
-            is_list = False
-        for trade_date in lst:
-            if fetch.is_trade_date(trade_date):
-                trade_date = Report._convert_time(trade_date)
-                if target == 'str':
-                    data.append(trade_date.strftime('%Y/%m/%d')[2:])
-                else:
-                    data.append(trade_date)
-        if not is_list:
-            if len(data) > 0:
-                data = data[0]
-        return data
+    def _to_date(data) -> pd.Series:
+        """
+        时间列一次转换为日期(datetime64, 时间部分为0), 支持datetime及 2020-01-01 / 2020/01/01 开头的字符串
+        """
+        data = pd.Series(data)
+        if not pd.api.types.is_datetime64_any_dtype(data):
+            data = pd.to_datetime(data.astype(str).str[:len('2020-01-01')].str.replace('/', '-', regex=False))
+        return data.dt.normalize()
+
+    @staticmethod
+    def _to_x_data(lst):
+        """
+        日期转为x轴标签 yy/mm/dd
+        """
+        return list(pd.DatetimeIndex(lst).strftime('%y/%m/%d'))
+
+    def _bucket_dates(self):
+        """
+        交易日超过点数预算时按相邻交易日分组, 返回每组最后一个交易日及其标签
+        """
+        days = self.trade_days
+        if len(days) <= self.point_budget:
+            return days, self.trade_date
+        step = int(np.ceil(len(days) / self.point_budget))
+        ends = np.arange(step - 1, len(days), step)
+        if ends[-1] != len(days) - 1:
+            ends = np.append(ends, len(days) - 1)
+        return days[ends], [self.trade_date[i] for i in ends]
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _is_trade_date(trade_date) -> bool:
+        return bool(fetch.is_trade_date(trade_date))
+
+    def trade_calendar(self, start_time, end_time) -> pd.DatetimeIndex:
+        """
+        交易日: 回测使用已加载的行情日期, 实盘使用账户日结日期, 都没有时逐日查询(缓存)
+        """
+        dates = pd.date_range(start_time, end_time)
+        days = None
+        quot = self.account.trader.quot
+        if self.is_backtest and quot is not None and hasattr(quot, 'bar') and len(quot.bar) > 0:
+            days = pd.DatetimeIndex(list(quot.bar.keys())).normalize()
+        elif self.acct_his is not None and len(self.acct_his) > 0:
+            days = self._to_date(pd.DataFrame(self.acct_his)['end_time'])
+        if days is not None:
+            return dates[dates.isin(days)]
+        return dates[[self._is_trade_date(d.to_pydatetime()) for d in dates]]
+
+    def load_quot_daily(self, start_time, end_time) -> Optional[pd.DataFrame]:
+        """
+        回测行情已在内存中, 直接生成交易代码的日线, 分钟行情按日合并
+        """
+        quot = self.account.trader.quot
+        if not self.is_backtest or quot is None or not hasattr(quot, 'bar') or len(quot.bar) == 0:
+            return None
+        codes = set(self.codes)
+        rows = [data for bars in quot.bar.values() for code, data in bars.items() if code in codes]
+        if len(rows) == 0:
+            return None
+        df = pd.DataFrame(rows)
+        df['trade_date'] = self._to_date(df['day_time'])
+        df = df[(df['trade_date'] >= start_time) & (df['trade_date'] <= end_time)]
+        if quot.day_frequency == 0:
+            agg = dict(open='first', high='max', low='min', close='last')
+            if 'volume' in df.columns:
+                agg['volume'] = 'sum'
+            if 'amount' in df.columns:
+                agg['amount'] = 'sum'
+            df = df.groupby(['code', 'trade_date'], sort=False).agg(agg).reset_index()
+        return df.sort_values(['code', 'trade_date']).reset_index(drop=True)
 
     async def collect_data(self):
         is_end = self.account.start_time is not None and self.account.end_time is not None
@@ -98,54 +161,65 @@ class Report:
         t_time = self.account.end_time
         end_time = datetime(year=t_time.year, month=t_time.month, day=t_time.day)
 
-        self.trade_date = self._to_x_data(list(pd.date_range(start_time, end_time)), 'datetime')
-
-        self.acct_his = self.account.acct_his
+        self.acct_his = self.account.recorder.frame('equity') if self.is_backtest else None
         if not self.is_backtest:
             self.acct_his = await self.db_trade.load_account_his(filter={'account_id': self.account.account_id},
                                                                  sort=[('end_time', 1)])
 
-        acct_his_df = pd.DataFrame(self.acct_his)
-        if acct_his_df is not None and not acct_his_df.empty:
-            acct_his_df['start_time'] = acct_his_df['start_time'].apply(self._convert_time)
-            acct_his_df['end_time'] = acct_his_df['end_time'].apply(self._convert_time)
-            acct_his_df.index = acct_his_df['end_time']
-
-            acct_his_all_df = pd.DataFrame(index=self.trade_date, data=[])
-            acct_his_all_df = acct_his_all_df.merge(acct_his_df, how='left', left_index=True, right_index=True)
-            acct_his_all_df.fillna(method='ffill', inplace=True)
+        trade_date = self.trade_calendar(start_time, end_time)
 
-            self.acct_his = acct_his_all_df
+        acct_his_df = pd.DataFrame(self.acct_his).copy()
+        if not acct_his_df.empty:
+            acct_his_df['start_time'] = self._to_date(acct_his_df['start_time']).values
+            acct_his_df['end_time'] = self._to_date(acct_his_df['end_time']).values
+            acct_his_df = acct_his_df.drop_duplicates(subset='end_time', keep='last')
+            acct_his_df.index = acct_his_df['end_time']
+            self.acct_his = acct_his_df.reindex(trade_date).ffill()
 
-        deal_his = self.account.deal
+        deal_his = self.account.recorder.frame('deal') if self.is_backtest else None
         if not self.is_backtest:
             deal_his = await self.db_trade.load_deal(filter={'account_id': self.account.account_id},
                                                      sort=[('time', 1)])
-        deal_his_df = pd.DataFrame(deal_his)
+        deal_his_df = pd.DataFrame(deal_his).copy()
+        self.deal_his = deal_his_df
         if not deal_his_df.empty:
-            # deal_his_df = deal_his_df[deal_his_df['type'] == 'sell']
-            deal_his_df['trade_date'] = deal_his_df['time'].apply(self._convert_time)
-            self.deal_his = deal_his_df
-
-            deal_his_group = deal_his_df.groupby('code')
-            self.codes = list(deal_his_group.groups.keys())
-            func_daily = self.db_data.load_fund_daily if isinstance(self.db_data,
-                                                                    FundDB) else self.db_data.load_stock_daily
-            self.daily = await func_daily(filter={'code': {'$in': self.codes},
-                                                  'trade_date': {'$gte': start_time, '$lte': end_time}},
-                                          sort=[('trade_date', 1)])
-
-        self.trade_date = self._to_x_data(self.trade_date)
-
-        if self.acct_his is not None and not self.acct_his.empty:
-            self.acct_his.to_csv('/Users/luoguochun/Downloads/acct_his.csv')
-        if self.deal_his is not None and not self.deal_his.empty:
-            self.deal_his.to_csv('/Users/luoguochun/Downloads/deal_his.csv')
-        if self.daily is not None and not self.daily.empty:
-            self.daily.to_csv('/Users/luoguochun/Downloads/daily.csv')
+            deal_his_df['trade_date'] = self._to_date(deal_his_df['time']).values
+            self.codes = list(deal_his_df['code'].unique())
+
+            self.daily = self.load_quot_daily(start_time, end_time)
+            if self.daily is None:
+                func_daily = self.db_data.load_fund_daily if isinstance(self.db_data,
+                                                                        FundDB) else self.db_data.load_stock_daily
+                self.daily = await func_daily(filter={'code': {'$in': self.codes},
+                                                      'trade_date': {'$gte': start_time, '$lte': end_time}},
+                                              sort=[('trade_date', 1)])
+
+        self.trade_days = trade_date
+        self.trade_date = self._to_x_data(trade_date)
+
         self.is_ready = True
         return self.is_ready
 
+    def save_data(self, path: str) -> Dict[str, str]:
+        """
+        报告数据保存为csv, 便于离线调试
+        """
+        os.makedirs(path, exist_ok=True)
+        files = {}
+        for name, df in (('acct_his', self.acct_his), ('deal_his', self.deal_his), ('daily', self.daily)):
+            if isinstance(df, pd.DataFrame) and not df.empty:
+                files[name] = os.path.join(path, '{}.csv'.format(name))
+                df.to_csv(files[name])
+        return files
+
+    def metrics(self, rf: float = 0.0) -> Dict:
+        """
+        绩效指标(收益/风险/交易统计), 需先collect_data
+        """
+        if not self.is_ready or self.acct_his is None:
+            return {}
+        return account_metrics(self.acct_his.dropna(subset=['total_net_value']), self.deal_his, rf=rf)
+
     def plot_cash(self):
         def _text(data):
             if len(data) == 0:
@@ -153,19 +227,23 @@ class Report:
             up = round((data[-1] - data[0]) / data[0] * 100, 2)
             return f'{round(data[0], 2)}元, {round(data[-1], 2)}元, {up}%'
 
-        x_data = self.trade_date
+        cash = self.acct_his['cash_available'].to_numpy(dtype=float)
+        net = self.acct_his['total_net_value'].to_numpy(dtype=float)
+        # 点数超过预算时按净值曲线LTTB选点, 保留首尾及最大最小值点
+        index = downsample_index(net, cash, budget=self.point_budget)
+        x_data = [self.trade_date[i] for i in index]
 
         graphic_text = []
 
         # line cash
-        y_data = list(self.acct_his['cash_available'])
-        max_y, min_y = max(y_data), min(y_data)
-        max_x_coord = self.trade_date[y_data.index(max_y)]
-        min_x_coord = self.trade_date[y_data.index(min_y)]
+        y_data = list(cash)
+        max_y, min_y = cash.max(), cash.min()
+        max_x_coord = self.trade_date[int(cash.argmax())]
+        min_x_coord = self.trade_date[int(cash.argmin())]
         line_cash = Line()
         line_cash.add_xaxis(xaxis_data=x_data)
         line_cash.add_yaxis(
-            series_name='资金', y_axis=y_data,
+            series_name='资金', y_axis=list(cash[index].round(2)),
             label_opts=opts.LabelOpts(is_show=False),
             is_smooth=True, symbol='none',
         )
@@ -205,17 +283,17 @@ class Report:
         )
 
         # line net
-        y_data = list(self.acct_his['total_net_value'])
-        max_y, min_y = max(y_data), min(y_data)
+        y_data = list(net)
+        max_y, min_y = net.max(), net.min()
         max_rate = round((max_y - self.account.cash_init) / self.account.cash_init * 100, 2)
         min_rate = round((min_y - self.account.cash_init) / self.account.cash_init * 100, 2)
         max_back = round((max_y - min_y) / max_y * 100, 2)
-        max_x_coord = self.trade_date[y_data.index(max_y)]
-        min_x_coord = self.trade_date[y_data.index(min_y)]
+        max_x_coord = self.trade_date[int(net.argmax())]
+        min_x_coord = self.trade_date[int(net.argmin())]
         line_net = Line()
         line_net.add_xaxis(xaxis_data=x_data)
         line_net.add_yaxis(
-            series_name='净值', y_axis=y_data,
+            series_name='净值', y_axis=list(net[index].round(2)),
             label_opts=opts.LabelOpts(is_show=False),
             is_smooth=True, symbol='none',
         )
@@ -311,8 +389,9 @@ class Report:
         return line
 
     def plot_profit(self) -> Optional[Chart]:
+        bucket_days, x_axis = self._bucket_dates()
         line = Line()
-        line.add_xaxis(xaxis_data=self.trade_date)
+        line.add_xaxis(xaxis_data=x_axis)
         line.add_yaxis(series_name='', y_axis=[])
 
         deal_his = self.deal_his[self.deal_his['type'] == 'sell'] if not self.deal_his.empty else pd.DataFrame()
@@ -337,13 +416,17 @@ class Report:
             lost_total = round(sum(lost_df['profit']), 2) if not lost_df.empty else 0
             lost_text = f'  -- 亏损({lost_total}元, {lost_rate}%, {lost_times}次, {lost_times_rate}%)'
 
+            if len(bucket_days) < len(self.trade_days):
+                # 交易日超过点数预算, 盈亏按分组合并到组内最后一个交易日
+                pos = bucket_days.searchsorted(deal_his['trade_date'].values)
+                deal_his = deal_his.assign(trade_date=bucket_days[np.minimum(pos, len(bucket_days) - 1)])
             deal_his_group = deal_his.groupby('trade_date').sum()
-            deal_his_group.reset_index(drop=True, inplace=True)
+            deal_his_group.reset_index(inplace=True)
             df = deal_his_group[deal_his_group['profit'] >= 0]
 
             if not df.empty:
-                x_data = self._to_x_data(list(df['trade_date']))
-                y_data = [round(x, 2) for x in list(df['profit'])]
+                x_data = self._to_x_data(df['trade_date'])
+                y_data = list(df['profit'].round(2))
                 scatter_up = Scatter()
                 scatter_up.add_xaxis(x_data)
                 scatter_up.add_yaxis('盈利', y_data, itemstyle_opts=opts.ItemStyleOpts(color=self.color_up))
@@ -352,8 +435,8 @@ class Report:
 
             df = deal_his_group[deal_his_group['profit'] < 0]
             if not df.empty:
-                x_data = self._to_x_data(list(df['trade_date']))
-                y_data = [round(x, 2) for x in list(df['profit'])]
+                x_data = self._to_x_data(df['trade_date'])
+                y_data = list(df['profit'].round(2))
                 scatter_down = Scatter()
                 scatter_down.add_xaxis(x_data)
                 scatter_down.add_yaxis('亏损', y_data, itemstyle_opts=opts.ItemStyleOpts(color=self.color_down))
@@ -506,12 +589,16 @@ class Report:
 
 
 if __name__ == '__main__':
+    import sys
+
     class Account:
         cash_init = 100000
         color_up = '#F11300'
         color_down = '#00A800'
 
         class Trader:
+            quot = None
+
             @staticmethod
             def is_backtest():
                 return True
@@ -520,29 +607,27 @@ if __name__ == '__main__':
         db_data = None
         db_trade = None
 
+    # 数据目录为Report.save_data保存的目录
+    path = sys.argv[1] if len(sys.argv) > 1 else '.'
 
     report = Report(Account())
-    report.acct_his = pd.read_csv('/Users/luoguochun/Downloads/acct_his.csv', index_col=0)
+    report.acct_his = pd.read_csv(os.path.join(path, 'acct_his.csv'), index_col=0)
     report.acct_his['start_time'] = pd.to_datetime(report.acct_his['start_time'])
     report.acct_his['end_time'] = pd.to_datetime(report.acct_his['end_time'])
 
-    report.deal_his = pd.read_csv('/Users/luoguochun/Downloads/deal_his.csv', index_col=0)
+    report.deal_his = pd.read_csv(os.path.join(path, 'deal_his.csv'), index_col=0)
     report.deal_his['time'] = pd.to_datetime(report.deal_his['time'])
     report.deal_his['trade_date'] = pd.to_datetime(report.deal_his['trade_date'])
 
-    report.daily = pd.read_csv('/Users/luoguochun/Downloads/daily.csv', index_col=0)
+    report.daily = pd.read_csv(os.path.join(path, 'daily.csv'), index_col=0)
     report.daily['trade_date'] = pd.to_datetime(report.daily['trade_date'])
 
     report.is_ready = True
-    report.trade_date = []
-    report.codes = ['sh601618']
-
-    for trade_date in list(pd.date_range('2020-12-01', '2020-12-31')):
-        if fetch.is_trade_date(trade_date):
-            report.trade_date.append(trade_date.strftime('%Y/%m/%d')[2:])
+    report.codes = list(report.deal_his['code'].unique())
+    report.trade_date = report._to_x_data(report.acct_his['end_time'])
 
     # line = report.plot_cash()
     # line = report.plot_profit()
     # line = report.plot_kline()
     line = report.plot()
-    line.render('/Users/luoguochun/Downloads/render.html')
+    line.render(os.path.join(path, 'render.html'))
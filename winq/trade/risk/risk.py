@@ -1,7 +1,53 @@
+import bisect
 import json
 from winq.trade.action_obj import BaseActionObj
 from winq.trade.account import Account
-from typing import Dict, Optional
+from typing import Dict, Optional, List, Tuple
+
+
+class TriggerBook:
+    """
+    按代码保存触发价:
+    lower 价格小于等于触发价时触发(止损), 升序
+    upper 价格大于等于触发价时触发(止盈), 升序
+    每次检查只需比较lower最大值和upper最小值
+    """
+
+    def __init__(self):
+        self.lower = {}
+        self.upper = {}
+
+    def set(self, code: str, lower: List[Tuple[float, str]] = (), upper: List[Tuple[float, str]] = ()):
+        """
+        :param code: 代码
+        :param lower: [(触发价, 描述)]
+        :param upper: [(触发价, 描述)]
+        """
+        self.remove(code)
+        for levels, book in ((lower, self.lower), (upper, self.upper)):
+            for price, tag in levels:
+                bisect.insort(book.setdefault(code, []), (price, tag))
+
+    def remove(self, code: str):
+        self.lower.pop(code, None)
+        self.upper.pop(code, None)
+
+    def codes(self):
+        return set(self.lower.keys()) | set(self.upper.keys())
+
+    def check(self, code: str, price: float) -> Optional[Tuple[float, str]]:
+        """
+        :return: 被穿越的触发价, (触发价, 描述), 未触发None
+        """
+        if code in self.lower:
+            level = self.lower[code][-1]
+            if price <= level[0]:
+                return level
+        if code in self.upper:
+            level = self.upper[code][0]
+            if price >= level[0]:
+                return level
+        return None
 
 
 class Risk(BaseActionObj):
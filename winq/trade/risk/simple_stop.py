@@ -1,10 +1,17 @@
-from .risk import Risk
+from .risk import Risk, TriggerBook
 from ..account import Account
 from ..trade_signal import TradeSignal
 import winq.trade.consts as consts
 
 
 class SimpleStop(Risk):
+    """
+    止损止盈风控:
+    1. 按持仓成本价预先计算止损/止盈触发价(rate为比例, 如0.15; stop_lost/stop_profit为金额)
+    2. 持仓成本或数量变化时重新计算触发价
+    3. 只检查行情中出现且持有的代码, 价格穿越触发价时产生卖信号
+    4. 已发出还未形成委托的信号、未完成的卖委托不重复发信号
+    """
     def __init__(self, risk_id, account: Account):
         super().__init__(risk_id=risk_id, account=account)
 
@@ -14,77 +21,95 @@ class SimpleStop(Risk):
         self.stop_lost = 0
         self.stop_lost_rate = 0.15
 
+        self.book = TriggerBook()
+        self.basis = {}  # code -> (成本价, 持仓量)
+        self.pending = set()  # 已发出卖信号的代码
+
     def name(self):
         return '神算子止损止盈风控'
 
     async def init(self, opt):
         if opt is not None:
             self.stop_profit = 0 if 'stop_profit' not in opt else float(opt['stop_profit'])
-            self.stop_lost_rate = 0 if 'stop_lost_rate' not in opt else float(opt['stop_lost_rate'])
+            self.stop_profit_rate = 0 if 'stop_profit_rate' not in opt else float(opt['stop_profit_rate'])
 
             self.stop_lost = 0 if 'stop_lost' not in opt else float(opt['stop_lost'])
             self.stop_lost_rate = 0 if 'stop_lost_rate' not in opt else float(opt['stop_lost_rate'])
 
         return True
 
+    def update_trigger(self, position):
+        basis = (position.price, position.volume)
+        if self.basis.get(position.code) == basis:
+            return
+        self.basis[position.code] = basis
+
+        lower, upper = [], []
+        if self.stop_lost_rate > 0:
+            lower.append((position.price * (1 - self.stop_lost_rate), '止损'))
+        if self.stop_lost > 0 and position.volume > 0:
+            lower.append((position.price - self.stop_lost / position.volume, '止损'))
+        if self.stop_profit_rate > 0:
+            upper.append((position.price * (1 + self.stop_profit_rate), '止盈'))
+        if self.stop_profit > 0 and position.volume > 0:
+            upper.append((position.price + self.stop_profit / position.volume, '止盈'))
+        self.book.set(position.code, lower=lower, upper=upper)
+
+    def remove_trigger(self, code):
+        self.book.remove(code)
+        self.basis.pop(code, None)
+        self.pending.discard(code)
+
+    def is_in_flight(self, code) -> bool:
+        for entrust in self.account.get_active_entrust(code=code):
+            if entrust.type == entrust.type_sell:
+                # 已形成委托, 由委托索引去重
+                self.pending.discard(code)
+                return True
+        return code in self.pending
+
+    async def on_open(self, evt, payload):
+        self.pending.clear()
+
+    async def on_close(self, evt, payload):
+        self.pending.clear()
+
     async def on_quot(self, evt, payload):
         # self.log.info('simple stop risk on_quot: evt={}, payload={}'.format(evt, payload))
-        for position in self.account.position.values():
-            if position.volume_available <= 0:
+        if evt != consts.evt_quotation:
+            return
+
+        positions = self.account.position
+        for code in [code for code in self.basis if code not in positions]:
+            self.remove_trigger(code)
+
+        for code, quot in payload['list'].items():
+            if code not in positions:
+                continue
+            position = positions[code]
+            self.update_trigger(position)
+
+            price = quot['close']
+            level = self.book.check(code, price)
+            if level is None:
+                continue
+
+            if position.volume_available <= 0 or self.is_in_flight(code):
                 continue
 
-            is_at_risk, is_at_profit = False, False
-            sell_price = position.now_price
-
-            is_lost = False if position.profit > 0 else True
-            profit_rate = abs(position.profit_rate)
-            profit = abs(position.profit)
-
-            # 止损
-            if is_lost and self.stop_lost_rate > 0 and self.stop_lost_rate > profit_rate:
-                self.log.info(
-                    'position({}) is at risk(stop_lost_rate=-{}, profit_rate=-{}), trigger sell signal'.format(
-                        position.code, self.stop_lost_rate, profit_rate))
-                # if profit_rate > (self.stop_lost_rate * 1.1):
-                #     sell_price = position.now_price + 0.01
-                is_at_risk = True
-
-            if not is_at_risk:
-                if is_lost and self.stop_lost > 0 and self.stop_lost > profit:
-                    self.log.info(
-                        'position({}) is at risk(stop_lost=-{}, profit=-{}), trigger sell signal'.format(
-                            position.code, self.stop_lost, profit))
-                    # if profit > (self.stop_lost * 1.1):
-                    #     sell_price = position.now_price + 0.01
-                    is_at_risk = True
-
-            # 止盈
-            if not is_lost and self.stop_profit_rate > 0 and self.stop_profit_rate > profit_rate:
-                self.log.info(
-                    'position({}) is at profit(stop_profit_rate={}, profit_rate={}), trigger sell signal'.format(
-                        position.code, self.stop_profit_rate, profit_rate))
-                # if profit_rate > (self.stop_lost_rate * 1.1):
-                #     sell_price = position.now_price + 0.01
-                is_at_profit = True
-
-            if not is_at_profit:
-                if not is_lost and self.stop_profit > 0 and self.stop_profit > profit:
-                    self.log.info(
-                        'position({}) is at profit(stop_profit_rate={}, profit_rate={}), trigger sell signal'.format(
-                            position.code, self.stop_profit_rate, profit_rate))
-                    # if profit > (self.stop_lost * 1.1):
-                    #     sell_price = position.now_price + 0.01
-                    is_at_profit = True
-
-            # 触发信号
-            if is_at_risk or is_at_profit:
-                sig = TradeSignal(self.get_uuid(), self.account)
-                sig.source = self.get_obj_id(typ=sig.risk)
-                sig.source_name = self.name()
-                sig.signal = sig.sig_sell
-                sig.code = position.code
-                sig.price = sell_price
-                sig.volume = position.volume
-                sig.time = position.time
-                sig.desc = '止盈' if is_at_profit else '止损'
-                await self.emit('signal', consts.evt_sig_sell, sig)
+            trigger_price, desc = level
+            self.log.info('position({}) price={} crossed {} price={}, trigger sell signal'.format(
+                code, price, desc, round(trigger_price, 4)))
+
+            sig = TradeSignal(self.new_id(), self.account)
+            sig.source = self.get_obj_id(typ=sig.risk)
+            sig.source_name = self.name()
+            sig.signal = sig.sig_sell
+            sig.code = position.code
+            sig.name = position.name
+            sig.price = price
+            sig.volume = position.volume_available
+            sig.time = quot['day_time']
+            sig.desc = desc
+            self.pending.add(code)
+            await self.emit('signal', consts.evt_sig_sell, sig)
@@ -1,7 +1,6 @@
 from .strategy import Strategy
 from ..account import Account
 from ..trade_signal import TradeSignal
-from copy import copy
 import winq.trade.consts as consts
 
 
@@ -19,7 +18,7 @@ class Dummy(Strategy):
         return '神算子Dummy策略'
 
     async def on_quot(self, evt, payload):
-        self.log.info('dummy strategy on_quot: evt={}, payload={}'.format(evt, payload))
+        self.log.debug('dummy strategy on_quot: evt={}, payload={}', evt, payload)
         if evt == consts.evt_quotation:
             for quot in payload['list'].values():
                 code, name, price = quot['code'], quot['name'], quot['close']
@@ -27,7 +26,7 @@ class Dummy(Strategy):
                     continue
 
                 day_time = quot['day_time']
-                sig = TradeSignal(self.get_uuid(), self.account,
+                sig = TradeSignal(self.new_id(), self.account,
                                   source=self.get_obj_id(typ=TradeSignal.strategy), source_name=self.name(),
                                   code=code, name=name, price=price, time=day_time)
 
@@ -38,7 +37,9 @@ class Dummy(Strategy):
 
                 vol = self.can_sell_volume(code=code)
                 if vol > 0:
-                    sig = copy(sig)
+                    sig = TradeSignal(self.new_id(), self.account,
+                                      source=sig.source, source_name=sig.source_name,
+                                      code=code, name=name, price=price, time=day_time)
                     sig.signal = sig.sig_sell
                     sig.volume = 100 if vol <= 100 else int(vol / 2)
                     await self.sell(sig=sig)
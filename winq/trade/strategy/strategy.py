@@ -2,6 +2,8 @@ import json
 from winq.trade.action_obj import BaseActionObj
 from winq.trade.account import Account
 from typing import Dict, Optional
+import winq.trade.consts as consts
+from winq.trade.trade_signal import TradeSignal, BatchSignal
 
 
 class Strategy(BaseActionObj):
@@ -11,6 +13,8 @@ class Strategy(BaseActionObj):
     2. evt_sig_buy 委托买
     3. evt_sig_sell 委托卖
     4. evt_quot_codes 订阅行情
+
+    计算量大的策略可实现 compute/on_compute, 实盘配置trade.offload时compute在线程池/进程池中执行, 见offload.py
     """
 
     def __init__(self, strategy_id, account: Account):
@@ -50,7 +54,49 @@ class Strategy(BaseActionObj):
         pass
 
     async def on_quot(self, evt, payload):
-        self.log.info('strategy on_quot: evt={}, payload={}'.format(evt, payload))
+        if evt == consts.evt_quotation and self.is_offload():
+            result = self.compute(self.compute_state(), evt, payload)
+            await self.on_compute(evt, payload, result)
+            return
+        self.log.debug('strategy on_quot: evt={}, payload={}', evt, payload)
+
+    async def rebalance(self, target: Dict[str, int], price: Dict[str, float], name: Optional[Dict[str, str]] = None,
+                        time=None, desc: str = ''):
+        """
+        按目标持仓调仓
+        :param target: code->目标持仓量, 0为清仓, 不在其中的持仓不变
+        :param price: code->委托价格
+        :param name: code->名称
+        """
+        batch = BatchSignal(source=self.get_obj_id(typ=TradeSignal.strategy), source_name=self.name(),
+                            time=time, target=target, price=price, name=name, desc=desc)
+        await self.batch(batch)
+
+    def is_offload(self) -> bool:
+        return type(self).compute is not Strategy.compute
+
+    def compute_state(self) -> object:
+        """
+        传给compute的策略参数/状态, 进程池时需可pickle
+        """
+        return self.opt
+
+    @staticmethod
+    def compute(state, evt, payload) -> object:
+        """
+        行情计算, 可在worker中运行, 不能访问账户/trader
+        :param state: compute_state()
+        :param evt: evt_quotation
+        :param payload: 行情
+        :return: 计算结果, 传给on_compute
+        """
+        return None
+
+    async def on_compute(self, evt, payload, result):
+        """
+        事件循环中根据计算结果产生信号
+        """
+        pass
 
     async def sync_from_db(self) -> bool:
         opt = await self.db_trade.load_strategy(filter={'account_id': self.account.account_id},
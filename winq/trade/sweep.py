@@ -0,0 +1,273 @@
+"""
+参数扫描
+
+行情只从数据库加载一次，放入共享内存(SharedPanel)，按参数网格(strategy/risk/broker option)
+生成多份回测配置，由进程池并发运行，子进程直接attach共享内存，不重复加载行情。
+每个回测的汇总指标合并为一张表返回。
+
+grid 格式:
+{
+    'strategy': {'opt1': [v1, v2], ...},
+    'risk': {'stop_lost_rate': [0.05, 0.1], ...},
+    'broker': {...}
+}
+"""
+import asyncio
+import copy
+import itertools
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
+from typing import Dict, List, Optional
+import hiq_pyfetch as fetch
+import pandas as pd
+from tqdm import tqdm
+import winq.log as log
+from winq.data.mongodb import MongoDB
+from winq.data.panel import SharedPanel
+from winq.trade.quotation import PanelQuotation
+from winq.trade.report.metrics import account_metrics
+from winq.trade.trader import Trader
+
+
+class SweepTrader(Trader):
+    """
+    参数扫描子进程中使用的Trader，行情来自共享面板，不生成报告
+    """
+
+    def __init__(self, panel: SharedPanel, index: List, config: Dict):
+        super().__init__(db_trade=None, db_data=None, config=config)
+        self.panel = panel
+        self.index = index
+
+    async def init_quotation(self, opt) -> bool:
+        self.quot = PanelQuotation(panel=self.panel, index=self.index)
+        return await self.quot.init(opt=opt)
+
+    async def backtest_report(self):
+        pass
+
+    async def daily_report(self):
+        pass
+
+    async def trade_report(self):
+        pass
+
+
+def summary(account) -> Dict:
+    """
+    回测汇总指标
+    """
+    data = dict(total_net_value=account.total_net_value,
+                total_profit=account.total_profit,
+                total_profit_rate=account.total_profit_rate,
+                close_profit=account.close_profit,
+                max_drawdown=0.0,
+                deal_count=account.recorder.size('deal'),
+                sell_count=0,
+                win_rate=0.0)
+
+    deal = account.recorder.frame('deal')
+    metrics = account_metrics(account.recorder.frame('equity'), deal)
+    if len(metrics) > 0:
+        data['max_drawdown'] = round(metrics['max_drawdown'] * 100, 4)
+        for key in ['annual_return', 'sharpe', 'sortino', 'calmar', 'turnover', 'exposure']:
+            data[key] = round(metrics[key], 4)
+
+    sells = deal[deal['type'] == 'sell']
+    if len(sells) > 0:
+        win = (sells['profit'] > 0).sum()
+        data['sell_count'] = len(sells)
+        data['win_rate'] = round(win * 100 / len(sells), 2)
+
+    return data
+
+
+def _sweep_worker(meta: Dict, index: List, config: Dict, log_level: str) -> Dict:
+    log.setup_logger(level=log_level, reset=True)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    panel = SharedPanel.attach(meta)
+    try:
+        trader = SweepTrader(panel=panel, index=index, config=config)
+        loop.run_until_complete(trader.start())
+        if trader.account is None:
+            return dict(error='init account failed')
+        return summary(trader.account)
+    except Exception as e:
+        return dict(error='{}: {}'.format(e, traceback.format_exc()))
+    finally:
+        panel.close()
+        loop.close()
+
+
+class Sweep:
+    def __init__(self, db_data: MongoDB, config: Dict, grid: Dict,
+                 processes: Optional[int] = None, log_level: str = 'error'):
+        """
+        :param db_data: 行情数据库
+        :param config: 同winqtrader的配置，trade.type 必须为backtest
+        :param grid: 参数网格
+        :param processes: 进程数，默认cpu个数
+        :param log_level: 子进程日志级别
+        """
+        self.log = log.get_logger(self.__class__.__name__)
+        self.db_data = db_data
+        self.config = config
+        self.grid = grid if grid is not None else {}
+        self.processes = processes
+        self.log_level = log_level
+
+        self.panel = None
+        self.index = []
+
+    def expand(self) -> List[Dict]:
+        """
+        展开参数网格
+        :return: [{'strategy': {..}, 'risk': {..}, 'broker': {..}}, ...]
+        """
+        keys, values = [], []
+        for typ in ['strategy', 'risk', 'broker']:
+            opts = self.grid[typ] if typ in self.grid and self.grid[typ] is not None else {}
+            for name, vals in opts.items():
+                keys.append((typ, name))
+                values.append(vals if isinstance(vals, (list, tuple)) else [vals])
+
+        params = []
+        for vals in itertools.product(*values):
+            param = dict(strategy={}, risk={}, broker={})
+            for (typ, name), val in zip(keys, vals):
+                param[typ][name] = val
+            params.append(param)
+        return params
+
+    def make_config(self, param: Dict) -> Dict:
+        config = copy.deepcopy(self.config)
+        trade_dict = config['trade']
+        for typ in ['strategy', 'risk', 'broker']:
+            if len(param[typ]) == 0:
+                continue
+            if trade_dict[typ] is None:
+                trade_dict[typ] = dict(id=None, option=None)
+            opt = trade_dict[typ]['option'] if trade_dict[typ]['option'] is not None else {}
+            opt.update(param[typ])
+            trade_dict[typ]['option'] = opt
+        return config
+
+    @staticmethod
+    def _to_datetime(d):
+        if isinstance(d, str):
+            return datetime.strptime(d, '%Y-%m-%d')
+        if isinstance(d, date):
+            return datetime(year=d.year, month=d.month, day=d.day)
+        return d
+
+    async def load(self) -> bool:
+        """
+        加载行情到共享内存
+        """
+        trade_dict = self.config['trade']
+        quot_opt = trade_dict['quotation']
+        codes = quot_opt['codes']
+        start = self._to_datetime(quot_opt['start-date'])
+        end = self._to_datetime(quot_opt['end-date'])
+        frequency = quot_opt['frequency'].lower()
+
+        if trade_dict['category'] == 'fund':
+            info = await self.db_data.load_fund_info(filter={'code': {'$in': codes}}, projection=['code', 'name'])
+        else:
+            info = await self.db_data.load_stock_info(filter={'code': {'$in': codes}}, projection=['code', 'name'])
+            index_info = await self.db_data.load_index_info(filter={'code': {'$in': codes}},
+                                                            projection=['code', 'name'])
+            if index_info is not None and not index_info.empty:
+                self.index = index_info['code'].to_list()
+                info = index_info if info is None else pd.concat((info, index_info))
+        if info is None or info.empty:
+            self.log.error('db stock/fund info failed')
+            return False
+        names = dict(zip(info['code'].to_list(), info['name'].to_list()))
+
+        fields = ['open', 'high', 'low', 'close', 'volume', 'day_open', 'day_high', 'day_min']
+        if 'd' in frequency:
+            func = self.db_data.load_fund_daily if trade_dict['category'] == 'fund' else self.db_data.load_stock_daily
+            df = await func(filter={'code': {'$in': codes}, 'trade_date': {'$gte': start, '$lte': end}},
+                            sort=[('trade_date', 1)])
+            if df is None or df.empty:
+                self.log.error('日线数据为空')
+                return False
+            df['day_open'], df['day_high'], df['day_min'] = df['open'], df['high'], df['low']
+            date_col = 'trade_date'
+        else:
+            period = str(int(frequency.split('m')[0]))
+            bars = []
+            for code in codes:
+                bar = fetch.fetch_stock_minute(code=code, period=period, start=start, end=end)
+                if bar is None:
+                    self.log.error('指数/股票: {}, 频率: {}min k线无数据'.format(code, period))
+                    return False
+                bar['code'] = code
+                bars.append(bar)
+            df = pd.concat(bars)
+            day = df['day_time'].dt.normalize()
+            group = df.groupby(['code', day])
+            df['day_open'] = group['open'].transform('first')
+            df['day_high'] = group['high'].cummax()
+            df['day_min'] = group['low'].cummin()
+            date_col = 'day_time'
+
+        for field in ['amount', 'turnover', 'chg_pct']:
+            if field in df.columns:
+                fields.append(field)
+
+        self.panel = SharedPanel.from_frame(df, fields, date_col=date_col, names=names)
+        return True
+
+    async def run(self, with_progress=True) -> Optional[pd.DataFrame]:
+        """
+        运行参数扫描
+        :return: 参数 + 汇总指标 表
+        """
+        params = self.expand()
+        if len(params) == 0:
+            self.log.error('参数网格为空')
+            return None
+
+        if self.panel is None and not await self.load():
+            return None
+
+        loop = asyncio.get_event_loop()
+        meta = self.panel.meta()
+        ctx = multiprocessing.get_context('spawn')
+        try:
+            with ProcessPoolExecutor(max_workers=self.processes, mp_context=ctx) as pool:
+                async def _wait(i, future):
+                    return i, await future
+
+                tasks = [_wait(i, loop.run_in_executor(pool, _sweep_worker, meta, self.index,
+                                                       self.make_config(param), self.log_level))
+                         for i, param in enumerate(params)]
+
+                results = [None] * len(params)
+                proc_bar = tqdm(total=len(params)) if with_progress else None
+                for task in asyncio.as_completed(tasks):
+                    i, result = await task
+                    results[i] = result
+                    if proc_bar is not None:
+                        proc_bar.update(1)
+                if proc_bar is not None:
+                    proc_bar.close()
+        finally:
+            self.panel.close()
+            self.panel = None
+
+        rows = []
+        for param, result in zip(params, results):
+            row = {}
+            for typ in ['strategy', 'risk', 'broker']:
+                for name, val in param[typ].items():
+                    row['{}.{}'.format(typ, name)] = val
+            row.update(result)
+            rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,199 @@
+"""
+全链路延时跟踪
+
+行情产生时打上单调时钟时间戳(origin)，事件经过各个队列时(account, risk, strategy, signal, broker, broker_event)
+记录:
+1. 行情到达该环节的延时(origin -> 出队)
+2. 在队列中的等待时间(入队 -> 出队)
+3. 处理函数耗时
+4. 出队时的队列深度
+
+信号、委托由处理函数内部emit产生，origin通过contextvars沿处理链传递，不需要修改TradeSignal/Entrust。
+延时预算(budget)用于约束行情到委托(broker环节)的延时，超出预算记录次数并告警。
+"""
+import bisect
+import contextvars
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import winq.log as log
+import winq.trade.consts as consts
+
+_trace_origin = contextvars.ContextVar('winq_trace_origin', default=None)
+
+
+class Histogram:
+    """
+    固定桶直方图，单位ms
+    """
+    buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float:
+        """
+        近似分位数，取所在桶的上界
+        """
+        if self.count == 0:
+            return 0.0
+        rank = self.count * p / 100
+        acc = 0
+        for i, cnt in enumerate(self.counts):
+            acc += cnt
+            if acc >= rank and cnt > 0:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return dict(count=self.count,
+                    mean=round(self.sum / self.count, 4) if self.count > 0 else 0.0,
+                    p50=self.percentile(50), p90=self.percentile(90), p99=self.percentile(99),
+                    max=round(self.max, 4))
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+        self.max = 0
+        self.count = 0
+        self.sum = 0
+
+    def set(self, value):
+        self.value = value
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self) -> Dict:
+        return dict(value=self.value, max=self.max,
+                    mean=round(self.sum / self.count, 4) if self.count > 0 else 0.0)
+
+
+class Tracer:
+    stages = ('account', 'risk', 'strategy', 'signal', 'broker', 'broker_event', 'quotation', 'robot')
+
+    def __init__(self, enable: bool = True, budget: Optional[float] = None, file: Optional[str] = None):
+        """
+        :param enable: 是否开启
+        :param budget: 行情到委托的延时预算，单位ms，None不限制
+        :param file: 结束时dump的文件，None只输出日志
+        """
+        self.log = log.get_logger(self.__class__.__name__)
+        self.enable = enable
+        self.budget = budget
+        self.file = file
+
+        self.latency = OrderedDict((stage, Histogram()) for stage in self.stages)
+        self.wait = OrderedDict((stage, Histogram()) for stage in self.stages)
+        self.handle = OrderedDict((stage, Histogram()) for stage in self.stages)
+        self.depth = OrderedDict((stage, Gauge()) for stage in self.stages)
+
+        self.quote_to_order = Histogram()
+        self.over_budget = 0
+
+    @classmethod
+    def from_config(cls, opt: Optional[Dict]) -> 'Tracer':
+        """
+        trade.trace 配置, 不配置时不跟踪(回测不产生计时开销):
+        trace:
+          enable: true
+          budget: 50
+          file: trace.json
+        """
+        if opt is None:
+            return cls(enable=False)
+        return cls(enable=opt['enable'] if 'enable' in opt else True,
+                   budget=opt['budget'] if 'budget' in opt else None,
+                   file=opt['file'] if 'file' in opt else None)
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def current() -> Optional[float]:
+        """
+        当前处理链的行情时间戳
+        """
+        return _trace_origin.get()
+
+    def pack(self, evt, payload, origin=None):
+        """
+        生成队列元素 (evt, payload, origin, 入队时间)
+        """
+        if not self.enable:
+            return evt, payload, origin, None
+        return evt, payload, origin, self.now()
+
+    def enter(self, stage: str, queue, item):
+        """
+        事件出队，记录延时和队列深度，设置处理链的origin
+        :return: evt, payload, 开始处理时间
+        """
+        evt, payload = item[0], item[1]
+        origin = item[2] if len(item) > 2 else None
+        _trace_origin.set(origin)
+        if not self.enable or evt == consts.evt_term:
+            return evt, payload, None
+
+        now = self.now()
+        self.depth[stage].set(queue.qsize())
+        if len(item) > 3 and item[3] is not None:
+            self.wait[stage].observe((now - item[3]) * 1000)
+        if origin is not None:
+            ms = (now - origin) * 1000
+            self.latency[stage].observe(ms)
+            if stage == 'broker' and evt in (consts.evt_entrust_buy, consts.evt_entrust_sell, consts.evt_entrust_batch):
+                self.quote_to_order.observe(ms)
+                if self.budget is not None and ms > self.budget:
+                    self.over_budget += 1
+                    self.log.warn('quote to order latency {:.3f}ms over budget {}ms, evt={}, over_budget={}'.format(
+                        ms, self.budget, evt, self.over_budget))
+        return evt, payload, now
+
+    def leave(self, stage: str, start: Optional[float]):
+        if start is not None:
+            self.handle[stage].observe((self.now() - start) * 1000)
+
+    def stat(self) -> Dict:
+        """
+        运行中查询
+        """
+        stages = OrderedDict()
+        for stage in self.stages:
+            if self.latency[stage].count == 0 and self.handle[stage].count == 0:
+                continue
+            stages[stage] = dict(latency=self.latency[stage].to_dict(),
+                                 wait=self.wait[stage].to_dict(),
+                                 handle=self.handle[stage].to_dict(),
+                                 depth=self.depth[stage].to_dict())
+        return dict(stages=stages,
+                    quote_to_order=self.quote_to_order.to_dict(),
+                    budget=self.budget,
+                    over_budget=self.over_budget)
+
+    def dump(self):
+        if not self.enable:
+            return
+        data = self.stat()
+        for stage, stat in data['stages'].items():
+            self.log.info('trace {}: latency={}, wait={}, handle={}, depth={}'.format(
+                stage, stat['latency'], stat['wait'], stat['handle'], stat['depth']))
+        self.log.info('trace quote_to_order: {}, budget={}, over_budget={}'.format(
+            data['quote_to_order'], data['budget'], data['over_budget']))
+        if self.file is not None:
+            with open(self.file, 'w') as f:
+                json.dump(data, f, indent=2)
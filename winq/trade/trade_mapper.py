@@ -0,0 +1,172 @@
+"""
+交易记录(信号/委托/成交/持仓)与数据库之间的映射，记录类本身不持有数据库引用，回测时不写库
+配置了账户事件日志(journal)时, 先写日志再由日志异步写库
+"""
+from datetime import datetime
+from typing import Dict
+import winq.log as log
+from winq.trade.deal import Deal
+from winq.trade.entrust import Entrust
+from winq.trade.position import Position
+from winq.trade.trade_signal import TradeSignal
+
+
+class TradeMapper:
+    def __init__(self, account):
+        self.log = log.get_logger(self.__class__.__name__)
+        self.account = account
+        self.journal = None
+
+        self.savers = {
+            TradeSignal: self.save_signal,
+            Entrust: self.save_entrust,
+            Deal: self.save_deal,
+            Position: self.save_position,
+        }
+
+    @property
+    def db_trade(self):
+        return self.account.db_trade
+
+    def is_discard(self) -> bool:
+        return self.account.trader.is_backtest()
+
+    async def write(self, kind: str, data: Dict):
+        if self.journal is not None:
+            await self.journal.append(kind, data)
+            return
+        await self.db_write(kind, data)
+
+    async def db_write(self, kind: str, data: Dict):
+        if kind == 'account':
+            await self.db_trade.save_account(data=data)
+        elif kind == 'signal':
+            await self.db_trade.save_signal(data=data)
+        elif kind == 'entrust':
+            await self.db_trade.save_entrust(data=data)
+        elif kind == 'deal':
+            await self.db_trade.save_deal(data=data)
+        elif kind == 'position':
+            await self.db_trade.save_position(data=data)
+        elif kind == 'position_delete':
+            await self.db_trade.delete_position(data)
+        else:
+            self.log.error('unknown record kind: {}'.format(kind))
+
+    async def close(self):
+        if self.journal is not None:
+            await self.journal.close()
+
+    def account_data(self) -> Dict:
+        account = self.account
+        return {'account_id': account.account_id, 'status': account.status,
+                'category': account.category, 'type': account.typ,
+                'cash_init': account.cash_init, 'cash_available': account.cash_available,
+                'cash_frozen': account.cash_frozen,
+                'total_net_value': account.total_net_value, 'total_hold_value': account.total_hold_value,
+                'cost': account.cost,
+                'broker_fee': account.broker_fee, "transfer_fee": account.transfer_fee, "tax_fee": account.tax_fee,
+                'profit': account.profit, 'profit_rate': account.profit_rate,
+                'close_profit': account.close_profit,
+                'total_profit': account.total_profit, 'total_profit_rate': account.total_profit_rate,
+                'start_time': account.start_time, 'end_time': account.end_time, 'update_time': datetime.now()}
+
+    async def save_account(self) -> bool:
+        if self.is_discard():
+            return True
+        await self.write('account', self.account_data())
+        return True
+
+    async def save(self, record) -> bool:
+        if self.is_discard():
+            return True
+        saver = self.savers.get(type(record))
+        if saver is None:
+            for cls, func in self.savers.items():
+                if isinstance(record, cls):
+                    saver = func
+                    break
+        if saver is None:
+            self.log.error('no mapper for record: {}'.format(type(record)))
+            return False
+        await saver(record)
+        return True
+
+    def signal_data(self, sig: TradeSignal) -> Dict:
+        return {'account_id': self.account.account_id,
+                'signal_id': sig.signal_id, 'name': sig.name, 'code': sig.code,
+                'source': sig.source, 'source_name': sig.source_name, 'signal': sig.signal,
+                'volume': sig.volume, 'price': sig.price, 'desc': sig.desc,
+                'time': sig.time
+                }
+
+    async def save_signal(self, sig: TradeSignal):
+        await self.write('signal', self.signal_data(sig))
+
+    def entrust_data(self, entrust: Entrust) -> Dict:
+        return {'account_id': self.account.account_id,
+                'entrust_id': entrust.entrust_id,
+                'broker_entrust_id': entrust.broker_entrust_id,
+                'name': entrust.name,
+                'code': entrust.code,
+                'type': entrust.type,
+                'price': entrust.price,
+                'volume': entrust.volume,
+                'volume_deal': entrust.volume_deal,
+                'volume_cancel': entrust.volume_cancel,
+                'status': entrust.status,
+                'desc': entrust.desc,
+                'time': entrust.time}
+
+    async def save_entrust(self, entrust: Entrust):
+        await self.write('entrust', self.entrust_data(entrust))
+
+    def deal_data(self, deal: Deal) -> Dict:
+        return {'account_id': self.account.account_id,
+                'deal_id': deal.deal_id, 'entrust_id': deal.entrust_id,
+                'name': deal.name, 'code': deal.code,
+                'volume': deal.volume, 'price': deal.price,
+                'fee': deal.fee, 'time': deal.time,
+                'type': deal.type, 'profit': deal.profit
+                }
+
+    async def save_deal(self, deal: Deal):
+        await self.write('deal', self.deal_data(deal))
+
+    def position_data(self, position: Position) -> Dict:
+        return {'account_id': self.account.account_id,
+                'position_id': position.position_id, 'name': position.name, 'code': position.code,
+                'volume': position.volume, 'volume_available': position.volume_available,
+                'fee': position.fee, 'price': position.price,
+                'profit_rate': position.profit_rate,
+                'max_profit_rate': position.max_profit_rate, 'min_profit_rate': position.min_profit_rate,
+                'profit': position.profit, 'max_profit': position.max_profit, 'min_profit': position.min_profit,
+                'now_price': position.now_price, 'max_price': position.max_price, 'min_price': position.min_price,
+                'max_profit_time': position.max_profit_time, 'min_profit_time': position.min_profit_time,
+                'time': position.time
+                }
+
+    async def save_position(self, position: Position):
+        await self.write('position', self.position_data(position))
+
+    async def delete_position(self, position: Position) -> bool:
+        if self.is_discard():
+            return True
+        await self.write('position_delete', dict(position_id=position.position_id))
+        return True
+
+    async def load_entrust(self, entrust: Entrust) -> bool:
+        data = await self.db_trade.load_entrust(filter={'entrust_id': entrust.entrust_id}, limit=1)
+        if len(data) == 0:
+            self.log.error('entrust from db not found: {}'.format(entrust.entrust_id))
+            return False
+        entrust.from_dict(data[0])
+        return True
+
+    async def load_position(self, position: Position) -> bool:
+        data = await self.db_trade.load_position(filter={'position_id': position.position_id}, limit=1)
+        if len(data) == 0:
+            self.log.error('position from db not found: {}'.format(position.position_id))
+            return False
+        position.from_dict(data[0])
+        return True
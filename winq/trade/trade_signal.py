@@ -1,8 +1,15 @@
-from winq.trade.base_obj import BaseObj
+from winq.trade.base_obj import BaseRecord
 from datetime import datetime
+from typing import Dict, List
+import winq.log as log
 
 
-class TradeSignal(BaseObj):
+class TradeSignal(BaseRecord):
+    __slots__ = ('signal_id', 'source', 'source_name', 'signal', 'name', 'code', 'time',
+                 'price', 'volume', 'desc', 'entrust_id')
+
+    log = log.get_logger('TradeSignal')
+
     sig_sell, sig_buy, sig_cancel = 'sell', 'buy', 'cancel'
     risk, strategy, broker, robot = 'risk', 'strategy', 'broker', 'robot'
 
@@ -10,8 +17,7 @@ class TradeSignal(BaseObj):
                  source: str = '',  source_name: str = '', signal: str = '',
                  code: str = '', name: str = '', price: float = 0.0,  volume: int = 0,
                  time: datetime = None, desc: str = '', entrust_id: str = ''):
-        super().__init__(typ=account.typ, db_data=account.db_data, db_trade=account.db_trade, trader=account.trader)
-        self.account = account
+        super().__init__(account=account)
 
         self.signal_id = signal_id
         self.source = source  # 信号源, risk:xxx, strategy:xx, broker:xx, robot:
@@ -28,17 +34,6 @@ class TradeSignal(BaseObj):
 
         self.entrust_id = entrust_id  # sell / cancel 有效
 
-    @BaseObj.discard_saver
-    async def sync_to_db(self) -> bool:
-        data = {'account_id': self.account.account_id,
-                'signal_id': self.signal_id, 'name': self.name, 'code': self.code,
-                'source': self.source, 'source_name': self.source_name, 'signal': self.signal,
-                'volume': self.volume, 'price': self.price, 'desc': self.desc,
-                'time': self.time
-                }
-        await self.db_trade.save_signal(data=data)
-        return True
-
     def to_dict(self):
         return {'account_id': self.account.account_id,
                 'signal_id': self.signal_id, 'name': self.name, 'code': self.code,
@@ -46,3 +41,28 @@ class TradeSignal(BaseObj):
                 'volume': self.volume, 'price': self.price, 'desc': self.desc,
                 'time': self.time.strftime('%Y-%m-%d %H:%M:%S') if self.time is not None else None
                 }
+
+
+class BatchSignal:
+    """
+    批量信号(evt_sig_batch), 一次事件提交多个委托:
+    1. target 目标持仓 code->持仓量, 账户与当前持仓比较后生成买卖委托, 0为清仓, 不在target中的持仓不变
+    2. signals 信号列表 [TradeSignal]
+    price/name 为target中代码的委托价格/名称
+    """
+    __slots__ = ('source', 'source_name', 'time', 'target', 'price', 'name', 'signals', 'desc')
+
+    def __init__(self, *, source: str = '', source_name: str = '', time: datetime = None,
+                 target: Dict[str, int] = None, price: Dict[str, float] = None, name: Dict[str, str] = None,
+                 signals: List[TradeSignal] = None, desc: str = ''):
+        self.source = source
+        self.source_name = source_name
+        self.time = time
+        self.target = target if target is not None else {}
+        self.price = price if price is not None else {}
+        self.name = name if name is not None else {}
+        self.signals = signals if signals is not None else []
+        self.desc = desc
+
+    def __str__(self):
+        return 'BatchSignal(source={}, target={}, signals={})'.format(self.source, len(self.target), len(self.signals))
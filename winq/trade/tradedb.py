@@ -98,26 +98,26 @@ class TradeDB(MongoDB):
         return self.get_coll(self._db, 'strategy_info')
 
     async def load_account(self, **kwargs) -> List:
-        self.log.debug('查询账户, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询账户, kwargs={} ...', kwargs)
         data = await self.do_load(self.account_info, to_frame=False, **kwargs)
-        self.log.debug('查询账户成功 data={}'.format(data))
+        self.log.debug('查询账户成功 data={}', data)
         return data
 
     async def save_account(self, data: Dict):
-        self.log.debug('保存账户信息, data = {}'.format(data))
+        self.log.debug('保存账户信息, data = {}', data)
         inserted_ids = await self.do_update(coll=self.account_info,
                                             filter={'account_id': data['account_id']}, update=data)
         self.log.debug('保存账户信息成功')
         return inserted_ids
 
     async def load_account_his(self, **kwargs) -> List:
-        self.log.debug('查询账户日结, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询账户日结, kwargs={} ...', kwargs)
         data = await self.do_load(self.account_info_his, to_frame=False, **kwargs)
-        self.log.debug('查询账户日结成功 data={}'.format(data))
+        self.log.debug('查询账户日结成功 data={}', data)
         return data
 
     async def save_account_his(self, data: Dict):
-        self.log.debug('保存账户日结信息, data = {}'.format(data))
+        self.log.debug('保存账户日结信息, data = {}', data)
         inserted_ids = await self.do_update(coll=self.account_info_his,
                                             filter={'account_id': data['account_id'],
                                                     'end_time': data['end_time']},
@@ -126,72 +126,72 @@ class TradeDB(MongoDB):
         return inserted_ids
 
     async def load_signal(self, **kwargs) -> List:
-        self.log.debug('查询信号信息, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询信号信息, kwargs={} ...', kwargs)
         data = await self.do_load(self.signal_info, to_frame=False, **kwargs)
-        self.log.debug('查询信号信息成功 data={}'.format(data))
+        self.log.debug('查询信号信息成功 data={}', data)
         return data
 
     async def save_signal(self, data: Dict):
-        self.log.debug('保存信号信息, data = {}'.format(data))
+        self.log.debug('保存信号信息, data = {}', data)
         inserted_ids = await self.do_update(coll=self.signal_info,
                                             filter={'signal_id': data['signal_id']}, update=data)
         self.log.debug('保存信号信息成功')
         return inserted_ids
 
     async def load_entrust(self, **kwargs) -> List:
-        self.log.debug('查询委托信息, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询委托信息, kwargs={} ...', kwargs)
         data = await self.do_load(self.entrust_info, to_frame=False, **kwargs)
-        self.log.debug('查询委托信息成功 data={}'.format(data))
+        self.log.debug('查询委托信息成功 data={}', data)
         return data
 
     async def save_entrust(self, data: Dict):
-        self.log.debug('保存委托信息, data = {}'.format(data))
+        self.log.debug('保存委托信息, data = {}', data)
         inserted_ids = await self.do_update(coll=self.entrust_info,
                                             filter={'entrust_id': data['entrust_id']}, update=data)
         self.log.debug('保存委托信息成功')
         return inserted_ids
 
     async def load_deal(self, **kwargs) -> List:
-        self.log.debug('查询成交历史, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询成交历史, kwargs={} ...', kwargs)
         data = await self.do_load(self.deal_info, to_frame=False, **kwargs)
-        self.log.debug('查询成交历史成功 data={}'.format(data))
+        self.log.debug('查询成交历史成功 data={}', data)
         return data
 
     async def save_deal(self, data: Dict):
-        self.log.debug('保存成交历史, data = {}'.format(data))
+        self.log.debug('保存成交历史, data = {}', data)
         inserted_ids = await self.do_update(coll=self.deal_info,
                                             filter={'deal_id': data['deal_id']}, update=data)
         self.log.debug('保存成交历史成功')
         return inserted_ids
 
     async def load_position(self, **kwargs) -> List:
-        self.log.debug('查询持仓信息, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询持仓信息, kwargs={} ...', kwargs)
         data = await self.do_load(self.position_info, to_frame=False, **kwargs)
-        self.log.debug('查询持仓信息成功 data={}'.format(data))
+        self.log.debug('查询持仓信息成功 data={}', data)
         return data
 
     async def save_position(self, data: Dict):
-        self.log.debug('保存持仓信息, data = {}'.format(data))
+        self.log.debug('保存持仓信息, data = {}', data)
         inserted_ids = await self.do_update(coll=self.position_info,
                                             filter={'position_id': data['position_id']}, update=data)
         self.log.debug('保存持仓信息成功')
         return inserted_ids
 
     async def delete_position(self, data: Dict):
-        self.log.debug('删除持仓信息, data = {}'.format(data))
+        self.log.debug('删除持仓信息, data = {}', data)
         inserted_ids = await self.do_delete(coll=self.position_info,
                                             filter={'position_id': data['position_id']})
         self.log.debug('删除持仓信息成功')
         return inserted_ids
 
     async def load_strategy(self, **kwargs) -> List:
-        self.log.debug('查询策略信息, kwargs={} ...'.format(kwargs))
+        self.log.debug('查询策略信息, kwargs={} ...', kwargs)
         data = await self.do_load(self.strategy_info, to_frame=False, **kwargs)
-        self.log.debug('查询策略信息成功 data={}'.format(data))
+        self.log.debug('查询策略信息成功 data={}', data)
         return data
 
     async def save_strategy(self, data: Dict):
-        self.log.debug('保存策略信息, data = {}'.format(data))
+        self.log.debug('保存策略信息, data = {}', data)
         inserted_ids = await self.do_update(coll=self.strategy_info,
                                             filter={'account_id': data['account_id']}, update=data)
         self.log.debug('保存策略信息成功')
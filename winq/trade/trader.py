@@ -2,7 +2,8 @@ import winq.log as log
 import asyncio
 import os
 import tempfile
-import subprocess as sub
+import itertools
+import uuid
 from winq.data.mongodb import MongoDB
 from winq.trade.tradedb import TradeDB
 from typing import Dict, Optional
@@ -14,8 +15,15 @@ from winq.trade.quotation import BacktestQuotation, RealtimeQuotation
 from collections import defaultdict
 import winq.trade.consts as consts
 from winq.trade.report import Report
-import yaml
+from winq.trade.event_queue import ConflateQueue, SignalQueue
+from winq.trade.tracer import Tracer
+from winq.trade.checkpoint import Checkpoint
+from winq.trade.offload import Offloader
+import winq.monitor as monitor
+from winq.monitor import Monitor
+from winq.trade.profiler import Profiler, task_dump
 import traceback
+import yaml
 
 from winq.trade.risk import *
 from winq.trade.broker import *
@@ -32,11 +40,15 @@ class Trader:
 
         self.account = None
 
+        # 实盘行情合并，避免处理积压的行情
+        quot_queue = asyncio.Queue if self.is_backtest() else ConflateQueue
+        # 信号优先级/合并只用于实盘, 回测按产生顺序逐个处理, 保证结果可复现
+        signal_queue = asyncio.Queue if self.is_backtest() else SignalQueue
         self.queue = dict(
-            account=asyncio.Queue(),
-            risk=asyncio.Queue(),
-            signal=asyncio.Queue(),
-            strategy=asyncio.Queue(),
+            account=quot_queue(),
+            risk=quot_queue(),
+            signal=signal_queue(),
+            strategy=quot_queue(),
             broker=asyncio.Queue(),
             broker_event=asyncio.Queue(),
             quotation=asyncio.Queue(),
@@ -55,12 +67,39 @@ class Trader:
 
         self.depend_task = defaultdict(int)
 
+        self.id_seq = itertools.count(1)
+
+        self.checkpoint = None
+        if self.is_backtest():
+            self.checkpoint = Checkpoint.from_config(
+                config['trade']['checkpoint'] if 'checkpoint' in config['trade'] else None)
+
+        trace_opt = config['trade']['trace'] if 'trace' in config['trade'] else None
+        self.tracer = Tracer.from_config(trace_opt)
+
+        self.offloader = None
+        if not self.is_backtest():
+            self.offloader = Offloader.from_config(
+                config['trade']['offload'] if 'offload' in config['trade'] else None)
+
+        self.monitor = Monitor.from_config(config['trade']['monitor'] if 'monitor' in config['trade'] else None)
+        self.profiler = Profiler.from_config(config['trade']['profile'] if 'profile' in config['trade'] else None,
+                                             path=self.report_path())
+
     def is_running(self, queue):
         if not self.running:
             return self.depend_task[queue] > 0
 
         return self.running
 
+    def next_id(self) -> str:
+        """
+        信号/委托/成交/持仓id, 回测使用递增序号, 实盘使用uuid
+        """
+        if self.is_backtest():
+            return str(next(self.id_seq))
+        return str(uuid.uuid4()).replace('-', '')
+
     def incr_depend_task(self, queue):
         self.depend_task[queue] += 1
 
@@ -82,8 +121,17 @@ class Trader:
             return None
         self.log.info('quotation inited')
 
+        if self.checkpoint is not None and self.checkpoint.resume is not None:
+            state = self.checkpoint.load()
+            if state is None or not self.checkpoint.restore(self, state):
+                self.log.error('从断点恢复异常: {}'.format(self.checkpoint.resume))
+                return None
+            self.log.info('resume from checkpoint: {}, day_time={}'.format(self.checkpoint.resume, state['day_time']))
+
         self.running = True
 
+        await self.start_monitor()
+
         await self.task_queue.put('quot_task(行情下发)')
         self.loop.create_task(self.quot_task())
 
@@ -93,44 +141,99 @@ class Trader:
         await self.task_queue.put('account_task(账户行情转发)')
         self.loop.create_task(self.account_task())
 
+        await self.start_account_task(self)
+
+        await self.task_queue.join()
+
+        self.tracer.dump()
+        await self.stop_monitor()
+
+        if self.offloader is not None:
+            self.offloader.shutdown()
+
+        if self.is_backtest():
+            await self.backtest_report()
+        else:
+            await self.account.mapper.close()
+
+        self.log.info('trader done, exit!')
+
+    async def start_monitor(self):
+        if self.monitor is not None:
+            await self.monitor.start()
+            self.monitor.route('/profile', self.profile_toggle)
+            self.monitor.route('/tasks', self.dump_tasks)
+
+    async def stop_monitor(self):
+        if self.profiler.is_running():
+            self.profiler.stop()
+        if self.monitor is not None:
+            await self.monitor.stop()
+
+    def profile_toggle(self) -> str:
+        """
+        开始/停止采样分析
+        """
+        msg = self.profiler.toggle()
+        self.log.info(msg)
+        return msg
+
+    def dump_tasks(self) -> str:
+        """
+        输出未完成的任务及队列深度
+        """
+        lines = task_dump(self.trace_stat()['queue'])
+        for line in lines:
+            self.log.info(line)
+        return '\n'.join(lines)
+
+    async def start_account_task(self, trader):
+        """
+        启动账户相关的任务(信号/风控/策略/券商/券商事件/运维)
+        :param trader: 任务所属的trader，多账户模式下为AccountTrader
+        """
+        account = trader.account
+        for name, queue in trader.queue.items():
+            if trader is not self and name in trader.host_queue:
+                continue
+            monitor.gauge_func('winq_queue_depth', queue.qsize, queue=name, account=account.account_id)
+
         await self.task_queue.put('signal_task(交易信号)')
-        self.loop.create_task(self.general_async_task('signal', func=self.account.on_signal))
+        self.loop.create_task(trader.general_async_task('signal', func=account.on_signal,
+                                                        batch_func=account.on_signal_batch))
 
         await self.task_queue.put('risk_task(风控策略)')
-        self.loop.create_task(self.general_async_task('risk',
-                                                      func=self.account.risk.on_quot,
-                                                      open_func=self.account.risk.on_open,
-                                                      close_func=self.account.risk.on_close))
-
+        self.loop.create_task(trader.general_async_task('risk',
+                                                        func=account.risk.on_quot,
+                                                        open_func=account.risk.on_open,
+                                                        close_func=account.risk.on_close))
+
+        strategy_func = account.strategy.on_quot
+        if self.offloader is not None and account.strategy.is_offload():
+            strategy_func = self.offloader.bind(account.strategy).on_quot
+            self.log.info('strategy compute offload, mode={}'.format(self.offloader.mode))
         await self.task_queue.put('strategy_task(交易策略)')
-        self.loop.create_task(self.general_async_task('strategy',
-                                                      func=self.account.strategy.on_quot,
-                                                      open_func=self.account.strategy.on_open,
-                                                      close_func=self.account.strategy.on_close))
+        self.loop.create_task(trader.general_async_task('strategy',
+                                                        func=strategy_func,
+                                                        open_func=account.strategy.on_open,
+                                                        close_func=account.strategy.on_close))
 
         await self.task_queue.put('broker_task(券商委托)')
-        self.loop.create_task(self.general_async_task('broker',
-                                                      func=self.account.broker.on_entrust,
-                                                      open_func=self.account.broker.on_open,
-                                                      close_func=self.account.broker.on_close))
+        self.loop.create_task(trader.general_async_task('broker',
+                                                        func=account.broker.on_entrust_event,
+                                                        open_func=account.broker.on_open,
+                                                        close_func=account.broker.on_close))
 
         await self.task_queue.put('broker_event_task(券商反馈事件)')
-        self.loop.create_task(self.general_async_task('broker_event',
-                                                      func=self.account.on_broker))
+        self.loop.create_task(trader.general_async_task('broker_event',
+                                                        func=account.on_broker))
 
-        if self.robot is not None:
+        if trader.robot is not None:
             await self.task_queue.put('robot_task(机器运维)')
-            self.loop.create_task(self.general_async_task('robot',
-                                                          func=self.robot.on_robot,
-                                                          open_func=self.robot.on_open,
-                                                          close_func=self.robot.on_close))
-
-        await self.task_queue.join()
-
-        if self.is_backtest():
-            await self.backtest_report()
-
-        self.log.info('trader done, exit!')
+            self.loop.create_task(trader.general_async_task('robot',
+                                                            func=trader.robot.on_robot,
+                                                            open_func=trader.robot.on_open,
+                                                            close_func=trader.robot.on_close))
 
     async def destroy(self):
         await self.account.broker.destroy()
@@ -142,17 +245,40 @@ class Trader:
         for queue in self.queue.values():
             queue.put_nowait((consts.evt_term, None))
 
+    def trace_stat(self) -> Dict:
+        """
+        运行中查询各环节延时及队列深度
+        """
+        stat = self.tracer.stat()
+        stat['queue'] = {name: queue.qsize() for name, queue in self.queue.items()}
+        return stat
+
     def signal_handler(self, signum, frame):
         print('catch signal: {}, stop trade...'.format(signum))
         self.stop()
 
+    def profile_handler(self, signum, frame):
+        self.loop.call_soon_threadsafe(self.profile_toggle)
+
+    def tasks_handler(self, signum, frame):
+        self.loop.call_soon_threadsafe(self.dump_tasks)
+
     def is_backtest(self) -> bool:
         typ = self.config['trade']['type']
         return typ == 'backtest'
 
+    def report_path(self) -> str:
+        trade_dict = self.config['trade']
+        path = trade_dict['report-path'] if 'report-path' in trade_dict and trade_dict['report-path'] else '.'
+        return os.path.expanduser(path)
+
     async def backtest_report(self):
         self.log.info('backtest report')
-        print(self.account)
+        path = os.path.join(self.report_path(), 'backtest-{}'.format(self.account.account_id))
+        files = self.account.recorder.save(path)
+        if files is not None:
+            self.log.info('backtest data saved: {}'.format(files))
+        print(yaml.dump(self.account.to_dict(skip_obj=True), allow_unicode=True, sort_keys=False))
 
     async def daily_report(self):
         print('daily_report')
@@ -166,7 +292,9 @@ class Trader:
             return False
 
         plot = report.plot()
-        plot.render('/Users/luoguochun/Downloads/render.html')
+        path = self.report_path()
+        os.makedirs(path, exist_ok=True)
+        plot.render(os.path.join(path, 'report-{}.html'.format(self.account.account_id)))
 
     async def on_quot_sub(self, evt, payload):
         if evt == 'evt_quot_codes' and self.running:
@@ -284,6 +412,7 @@ class Trader:
         strategy_info.risk_opt = risk_opt
         strategy_info.quot_opt = quot_opt
 
+        account.open_journal(fresh=True)
         await account.sync_to_db()
         await strategy_info.sync_to_db()
 
@@ -330,27 +459,10 @@ class Trader:
                 self.write_pid(self.account.account_id)
                 return True
 
-        # strategy_js, risk_js, broker_js = trade_dict['strategy'], trade_dict['risk'], trade_dict['broker']
         if not self.is_backtest() and (acct_id is None or len(acct_id) == 0):
-            # fork 多个进程数据库存在的, 多账号处理
-            accounts = await self.db_trade.load_account(filter=dict(status=0, category=cat, type=typ))
-            if len(accounts) == 0:
-                self.log.info('数据中没有已运行的real/simulate数据')
-                return False
-            for account in accounts:
-                self.log.info('开始fork程序运行account_id={}'.format(account['account_id']))
-                _, path = tempfile.mkstemp()
-                self.config['log']['file'] = 'trade-{}.log'.format(account['account_id'])
-                self.config['trade']['account_id'] = account['account_id']
-                with open(path, 'w') as f:
-                    f.write(yaml.dump(self.config))
-                trader = sub.Popen(['winqtrader', '--conf', path])
-                self.log.info('process pid={}'.format(trader.pid))
-
-                self.write_pid(account.account_id)
-
-            self.log.info('main process exit')
-            os._exit(0)
+            # 多账号在同一进程中运行，见MultiTrader
+            self.log.error('account-id为空, 多账户请使用MultiTrader运行')
+            return False
 
         # 新生成trade / backtest
         self.account = await self.create_new_account()
@@ -376,6 +488,16 @@ class Trader:
 
         return await self.quot.init(opt=opt)
 
+    async def join_queue(self):
+        """
+        等待所有队列处理完成, 后面的队列可能向前面的队列产生事件, 直到所有队列为空
+        """
+        while True:
+            for queue in self.queue.values():
+                await queue.join()
+            if all(queue.empty() for queue in self.queue.values()):
+                break
+
     async def quot_task(self):
         task = await self.task_queue.get()
         self.log.info('开始运行{}任务'.format(task))
@@ -383,14 +505,16 @@ class Trader:
         while self.running:
             evt, payload = await self.quot.get_quot()
             if evt is not None:
-                await self.queue['account'].put((evt, payload))
+                await self.queue['account'].put(self.tracer.pack(evt, payload, self.tracer.now()))
 
             sleep_sec = 1
             if is_backtest:
                 if evt is None:
-                    for key, queue in self.queue.items():
-                        await queue.join()
+                    await self.join_queue()
                     self.stop()
+                if evt == consts.evt_noon_end and self.checkpoint is not None and self.checkpoint.need_save():
+                    await self.join_queue()
+                    await self.checkpoint.save(self)
                 # 让出执行权
                 sleep_sec = 0.01
             await asyncio.sleep(sleep_sec)
@@ -404,51 +528,46 @@ class Trader:
         task = await self.task_queue.get()
         self.log.info('开始运行{}任务'.format(task))
         queue = self.queue['account']
+        dropped = 0
         while self.is_running('account'):
-            pre_evt, pre_payload = None, None
             if self.running:
-                evt, payload = await queue.get()
+                item = await queue.get()
             else:
                 try:
-                    evt, payload = queue.get_nowait()
+                    item = queue.get_nowait()
                 except Exception:
                     await asyncio.sleep(1)
                     continue
 
+            evt, payload, start = self.tracer.enter('account', queue, item)
             if evt is not None and evt == consts.evt_term:
                 queue.task_done()
                 continue
 
-            if not self.is_backtest():
-                while not queue.empty():
-                    self.log.warn('process is too slow...')
-                    try:
-                        if evt != consts.evt_quotation:
-                            await self.account.on_quot(evt, payload)
-                        else:
-                            pre_evt, pre_payload = evt, payload
-                    except Exception as e:
-                        self.log.error('account task exception: {}, stack={}'.format(e, traceback.format_exc()))
-                    finally:
-                        evt, payload = queue.get()
-                        queue.task_done()
-
+            handle_start = monitor.clock()
             try:
-                if pre_evt is not None:
-                    if evt != consts.evt_quotation:
-                        await self.account.on_quot(pre_evt, pre_payload)
                 await self.account.on_quot(evt, payload)
 
-                if evt != consts.evt_quotation:
-                    await self.queue['broker'].put((evt, payload))
-                    if self.robot is not None:
-                        await self.queue['robot'].put((evt, payload))
-                await self.queue['risk'].put((evt, payload))
-                await self.queue['strategy'].put((evt, payload))
+                origin = self.tracer.current()
+                if evt != consts.evt_quotation or self.account.broker.need_quot:
+                    await self.queue['broker'].put(self.tracer.pack(evt, payload, origin))
+                if evt != consts.evt_quotation and self.robot is not None:
+                    await self.queue['robot'].put(self.tracer.pack(evt, payload, origin))
+                await self.queue['risk'].put(self.tracer.pack(evt, payload, origin))
+                await self.queue['strategy'].put(self.tracer.pack(evt, payload, origin))
             except Exception as e:
                 self.log.error('account task exception: {}, stack={}'.format(e, traceback.format_exc()))
             finally:
+                self.tracer.leave('account', start)
                 queue.task_done()
+                monitor.observe('winq_queue_handle_seconds', monitor.clock() - handle_start,
+                                queue='account', account=self.account.account_id)
+                monitor.inc('winq_queue_events_total', queue='account', account=self.account.account_id, evt=evt)
+
+            if isinstance(queue, ConflateQueue) and queue.dropped > dropped:
+                self.log.warn('process is too slow, quotation dropped={}, merged={}'.format(
+                    queue.dropped, queue.merged))
+                dropped = queue.dropped
 
         self.decr_depend_task('broker_event')
         self.decr_depend_task('broker')
@@ -456,7 +575,11 @@ class Trader:
         self.task_queue.task_done()
         self.log.info('任务{}运行完毕'.format(task))
 
-    async def general_async_task(self, queue, func, open_func=None, close_func=None):
+    async def general_async_task(self, queue, func, open_func=None, close_func=None, batch_func=None):
+        """
+        通用队列处理任务
+        :param batch_func: 队列支持get_batch(SignalQueue)时, 队首连续的同一事件一次交给batch_func(evt, payloads)处理
+        """
         queue_name = queue
         if queue_name in ['signal', 'risk', 'strategy', 'robot']:
             self.incr_depend_task('account')
@@ -465,19 +588,26 @@ class Trader:
         self.log.info('开始运行{}任务'.format(task))
 
         queue = self.queue[queue]
+        account_id = self.account.account_id if self.account is not None else ''
         while self.is_running(queue_name):
             if self.running:
-                evt, payload = await queue.get()
+                item = await queue.get()
             else:
                 try:
-                    evt, payload = queue.get_nowait()
+                    item = queue.get_nowait()
                 except Exception:
                     await asyncio.sleep(1)
                     continue
+            evt, payload, start = self.tracer.enter(queue_name, queue, item)
             if evt is not None and evt == consts.evt_term:
                 queue.task_done()
                 continue
 
+            batch = []
+            if batch_func is not None and hasattr(queue, 'get_batch'):
+                batch = [self.tracer.enter(queue_name, queue, batch_item) for batch_item in queue.get_batch(evt)]
+
+            handle_start = monitor.clock()
             try:
                 evt_handled = False
                 if open_func is not None:
@@ -488,12 +618,21 @@ class Trader:
                     if evt == consts.evt_morning_end or evt == consts.evt_noon_end or evt == consts.evt_end:
                         await close_func(evt, payload)
                         evt_handled = True
-                if not evt_handled and func is not None:
+                if not evt_handled and len(batch) > 0:
+                    await batch_func(evt, [payload] + [batch_payload for _, batch_payload, _ in batch])
+                elif not evt_handled and func is not None:
                     await func(evt, payload)
             except Exception as e:
                 self.log.error('{} task exception: {}, stack={}'.format(queue_name, e, traceback.format_exc()))
             finally:
+                self.tracer.leave(queue_name, start)
                 queue.task_done()
+                for _, _, batch_start in batch:
+                    self.tracer.leave(queue_name, batch_start)
+                    queue.task_done()
+                monitor.observe('winq_queue_handle_seconds', monitor.clock() - handle_start,
+                                queue=queue_name, account=account_id)
+                monitor.inc('winq_queue_events_total', 1 + len(batch), queue=queue_name, account=account_id, evt=evt)
 
         if queue_name in ['signal', 'risk', 'strategy', 'robot']:
             self.decr_depend_task('account')
@@ -0,0 +1,310 @@
+"""
+向量化回测
+
+适用于可以表达为 codes x dates 信号矩阵的策略(如选股策略的结果)，不经过Trader事件循环，
+一次性用数组运算计算成交、费用、T+1可用、资金、净值及逐笔盈亏。
+
+输出结构与Account一致:
+- acct_his 每个交易日收盘的账户快照(同 Account.to_dict(skip_obj=True))
+- deal 成交列表(同 Deal.to_dict())
+可直接交给Report生成报告。
+
+成交价格为传入的price矩阵(默认收盘价)，停牌(price为NaN)的bar不成交。
+资金不足不会拒绝委托，cash_available可能为负，由调用方控制仓位大小。
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Union
+import numpy as np
+import pandas as pd
+import winq.log as log
+import winq.trade.consts as consts
+from winq.trade.recorder import Recorder
+from winq.trade.fees import vector_fee
+
+
+def _ffill(data: np.ndarray) -> np.ndarray:
+    return pd.DataFrame(data).ffill().values
+
+
+def _shift(data: np.ndarray, fill) -> np.ndarray:
+    head = np.full((1,) + data.shape[1:], fill, dtype=data.dtype)
+    return np.concatenate([head, data[:-1]])
+
+
+def _cumsum_reset(data: np.ndarray, reset: np.ndarray) -> np.ndarray:
+    """
+    按列累加，reset为True的位置重新从该位置开始累加
+    """
+    cs = np.cumsum(data, axis=0)
+    base = np.where(reset, cs - data, np.nan)
+    base = np.nan_to_num(_ffill(base), nan=0.0)
+    return cs - base
+
+
+class VectorBacktest:
+    """
+    向量化回测
+
+    price: DataFrame, index为bar时间(升序), columns为代码, 值为成交价格
+    信号方式: run_signal(entries, exits, volume/cash_per_trade) 满仓进出
+    仓位方式: run_position(positions) 目标持仓量矩阵，按交易日收盘调仓
+    """
+
+    def __init__(self, price: pd.DataFrame, *,
+                 cash_init: float = 1000000.0,
+                 broker_fee: float = 0.00025,
+                 transfer_fee: float = 0.00002,
+                 tax_fee: float = 0.001,
+                 names: Optional[Dict] = None,
+                 account_id: Optional[str] = None,
+                 category: str = 'stock',
+                 strategy_name: str = 'VectorBacktest',
+                 db_data=None):
+        self.log = log.get_logger(self.__class__.__name__)
+
+        self.price = price.sort_index()
+        self.times = pd.DatetimeIndex(self.price.index)
+        self.codes = list(self.price.columns)
+        self.names = names if names is not None else {}
+
+        days = self.times.normalize()
+        self.day_index = pd.factorize(days)[0]
+        self.day_last = np.append(self.day_index[1:] != self.day_index[:-1], True)
+
+        self.account_id = account_id if account_id is not None else self.get_uuid()
+        self.typ = 'backtest'
+        self.category = category
+        self.strategy_name = strategy_name
+
+        self.cash_init = cash_init
+        self.broker_fee = broker_fee
+        self.transfer_fee = transfer_fee
+        self.tax_fee = tax_fee
+
+        self.start_time = days[0].to_pydatetime() if len(days) > 0 else None
+        self.end_time = None
+
+        # Report 使用的接口
+        self.db_data = db_data
+        self.db_trade = None
+        self.trader = self
+        self.strategy = self
+
+        self.equity = None  # 逐bar账户数据
+        self.volume = None  # 逐bar持仓量
+        self.acct_his = []
+        self.deal = []
+        self.signal = []
+        self.recorder = Recorder(account_id=self.account_id)
+
+    @staticmethod
+    def get_uuid():
+        return str(uuid.uuid4()).replace('-', '')
+
+    @staticmethod
+    def is_backtest() -> bool:
+        return True
+
+    def name(self):
+        return self.strategy_name
+
+    def _align(self, data: pd.DataFrame) -> pd.DataFrame:
+        return data.reindex(index=self.price.index, columns=self.codes)
+
+    def _holding(self, entries: np.ndarray, exits: np.ndarray, tradable: np.ndarray) -> np.ndarray:
+        """
+        由进出信号计算持仓状态，同一交易日买入的不能卖出(T+1)，被拦截的卖出顺延到下一个卖出信号
+        """
+        sig = np.where(entries & ~exits, 1.0, np.where(exits & ~entries, 0.0, np.nan))
+        sig[~tradable] = np.nan
+
+        day = np.broadcast_to(self.day_index[:, None].astype(float), sig.shape)
+        while True:
+            holding = np.nan_to_num(_ffill(sig), nan=0.0).astype(bool)
+            pre_holding = _shift(holding, False)
+            enter = holding & ~pre_holding
+            leave = ~holding & pre_holding
+
+            enter_day = _shift(_ffill(np.where(enter, day, np.nan)), np.nan)
+            blocked = leave & (enter_day == day)
+            if not blocked.any():
+                return holding
+            sig[blocked] = np.nan
+
+    def run_signal(self, entries: pd.DataFrame, exits: pd.DataFrame,
+                   volume: Union[int, pd.DataFrame, None] = None,
+                   cash_per_trade: Optional[float] = None) -> bool:
+        """
+        信号方式回测，entries为True时满仓买入，exits为True时全部卖出
+        :param entries: 买入信号矩阵
+        :param exits: 卖出信号矩阵
+        :param volume: 每次买入量(股)，整数或矩阵
+        :param cash_per_trade: 每次买入金额，按100股取整，与volume二选一
+        :return:
+        """
+        if volume is None and cash_per_trade is None:
+            self.log.error('volume/cash_per_trade 必须指定一个')
+            return False
+
+        price = self.price.values.astype(float)
+        tradable = ~np.isnan(price)
+        entries = self._align(entries).fillna(False).values.astype(bool)
+        exits = self._align(exits).fillna(False).values.astype(bool)
+
+        holding = self._holding(entries, exits, tradable)
+        enter = holding & ~_shift(holding, False)
+
+        if cash_per_trade is not None:
+            size = np.floor(cash_per_trade / price / 100) * 100
+        elif isinstance(volume, pd.DataFrame):
+            size = self._align(volume).values.astype(float)
+        else:
+            size = np.full(price.shape, float(volume))
+
+        size = _ffill(np.where(enter, np.nan_to_num(size, nan=0.0), np.nan))
+        target = np.where(holding, np.nan_to_num(size, nan=0.0), 0.0)
+
+        return self._run(target)
+
+    def run_position(self, positions: pd.DataFrame) -> bool:
+        """
+        仓位方式回测，取每个交易日最后一个目标持仓，在当日最后一个bar按price调仓，
+        隔日调仓天然满足T+1
+        :param positions: 目标持仓量矩阵(股)
+        :return:
+        """
+        price = self.price.values.astype(float)
+        target = self._align(positions).values.astype(float)
+
+        target = np.where(self.day_last[:, None] & ~np.isnan(price), target, np.nan)
+        target = np.nan_to_num(_ffill(target), nan=0.0)
+
+        return self._run(target)
+
+    def _run(self, target: np.ndarray) -> bool:
+        if len(self.times) == 0:
+            self.log.error('price 无数据')
+            return False
+
+        codes = np.asarray(self.codes, dtype=str)
+        price = self.price.values.astype(float)
+        now_price = np.nan_to_num(_ffill(price), nan=0.0)
+        deal_price = np.nan_to_num(price, nan=0.0)
+
+        pre_target = _shift(target, 0.0)
+        trade = target - pre_target
+        buy_vol = np.clip(trade, 0, None)
+        sell_vol = np.clip(-trade, 0, None)
+
+        buy_fee = vector_fee(consts.act_buy, codes, deal_price, buy_vol,
+                             self.broker_fee, self.transfer_fee, self.tax_fee)
+        sell_fee = vector_fee(consts.act_sell, codes, deal_price, sell_vol,
+                              self.broker_fee, self.transfer_fee, self.tax_fee)
+        buy_cost = deal_price * buy_vol + buy_fee
+        sell_income = deal_price * sell_vol - sell_fee
+
+        # 持仓成本(含买入费用)，移动平均: cost_t = ratio_t * cost_t-1 + buy_cost_t
+        # 卖出时 ratio = 剩余量/原有量，按建仓(空仓->持仓)分段累计
+        hold = target > 0
+        reset = hold & (pre_target <= 0)
+        ratio = np.where((sell_vol > 0) & hold, target / np.where(pre_target > 0, pre_target, 1), 1.0)
+        log_p = _cumsum_reset(np.log(ratio), reset)
+        p = np.exp(log_p)
+        cost = np.where(hold, p * _cumsum_reset(buy_cost / p, reset), 0.0)
+
+        pre_cost = _shift(cost, 0.0)
+        pre_avg = np.where(pre_target > 0, pre_cost / np.where(pre_target > 0, pre_target, 1), 0.0)
+        sell_profit = np.where(sell_vol > 0, np.round(sell_income - pre_avg * sell_vol, 4), 0.0)
+
+        hold_value = (now_price * target).sum(axis=1)
+        total_cost = cost.sum(axis=1)
+        cash = self.cash_init - np.cumsum(buy_cost.sum(axis=1)) + np.cumsum(sell_income.sum(axis=1))
+        profit = hold_value - total_cost
+        close_profit = np.cumsum(sell_profit.sum(axis=1))
+        total_profit = close_profit + profit
+
+        self.volume = pd.DataFrame(target, index=self.price.index, columns=self.codes)
+        self.equity = pd.DataFrame({
+            'cash_available': np.round(cash, 2),
+            'cash_frozen': 0.0,
+            'total_hold_value': np.round(hold_value, 4),
+            'total_net_value': np.round(cash + hold_value, 4),
+            'cost': np.round(total_cost, 4),
+            'profit': np.round(profit, 4),
+            'profit_rate': np.round(np.where(total_cost > 0, profit / np.where(total_cost > 0, total_cost, 1) * 100, 0.0), 4),
+            'close_profit': np.round(close_profit, 4),
+            'total_profit': np.round(total_profit, 4),
+            'total_profit_rate': np.round(total_profit / self.cash_init * 100, 4),
+        }, index=self.price.index)
+
+        self.end_time = self._day_end(self.times[-1])
+        self.acct_his = self._collect_acct_his()
+        self.deal = self._collect_deal(buy_vol, buy_fee, np.zeros(buy_vol.shape), consts.act_buy) + \
+            self._collect_deal(sell_vol, sell_fee, sell_profit, consts.act_sell)
+        self.deal.sort(key=lambda d: d['time'])
+        self.recorder.set_frame('equity', pd.DataFrame(self.acct_his))
+        self.recorder.set_frame('deal', pd.DataFrame(self.deal))
+
+        return True
+
+    @staticmethod
+    def _day_end(day_time) -> datetime:
+        return datetime(year=day_time.year, month=day_time.month, day=day_time.day, hour=15)
+
+    def _collect_acct_his(self):
+        df = self.equity[self.day_last].copy()
+        end_time = self.times[self.day_last].normalize() + timedelta(hours=15)
+
+        df['account_id'] = self.account_id
+        df['status'] = 0
+        df['category'] = self.category
+        df['type'] = self.typ
+        df['cash_init'] = self.cash_init
+        df['broker_fee'] = self.broker_fee
+        df['transfer_fee'] = self.transfer_fee
+        df['tax_fee'] = self.tax_fee
+        df['start_time'] = self.start_time.strftime('%Y-%m-%d %H:%M:%S')
+        df['end_time'] = end_time.strftime('%Y-%m-%d %H:%M:%S')
+
+        columns = ['account_id', 'status', 'category', 'type',
+                   'cash_init', 'cash_available', 'cash_frozen',
+                   'total_net_value', 'total_hold_value', 'cost',
+                   'broker_fee', 'transfer_fee', 'tax_fee',
+                   'profit', 'profit_rate', 'close_profit',
+                   'total_profit', 'total_profit_rate',
+                   'start_time', 'end_time']
+        return df[columns].to_dict('records')
+
+    def _collect_deal(self, volume, fee, profit, typ):
+        rows, cols = np.nonzero(volume > 0)
+        if len(rows) == 0:
+            return []
+
+        codes = np.asarray(self.codes)[cols]
+        df = pd.DataFrame({
+            'account_id': self.account_id,
+            'deal_id': [self.get_uuid() for _ in range(len(rows))],
+            'entrust_id': [self.get_uuid() for _ in range(len(rows))],
+            'name': [self.names.get(code, '') for code in codes],
+            'code': codes,
+            'type': typ,
+            'volume': volume[rows, cols].astype(int),
+            'price': self.price.values[rows, cols],
+            'fee': fee[rows, cols],
+            'profit': profit[rows, cols],
+            'time': self.times[rows].strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        return df.to_dict('records')
+
+    def to_dict(self):
+        data = self.equity.iloc[-1].to_dict() if self.equity is not None and not self.equity.empty else {}
+        data.update({'account_id': self.account_id, 'status': 0,
+                     'category': self.category, 'type': self.typ,
+                     'cash_init': self.cash_init,
+                     'broker_fee': self.broker_fee, 'transfer_fee': self.transfer_fee, 'tax_fee': self.tax_fee,
+                     'start_time': self.start_time.strftime('%Y-%m-%d %H:%M:%S') if self.start_time is not None else None,
+                     'end_time': self.end_time.strftime('%Y-%m-%d %H:%M:%S') if self.end_time is not None else None,
+                     'deal': self.deal,
+                     'signal': self.signal})
+        return data